@@ -0,0 +1 @@
+"""Benchmarks for the EV charging station finder."""
@@ -0,0 +1,107 @@
+"""
+Compare the table-scan `find_stations_scan` with the index-backed `find_stations`
+(and the top-k ranked mode) on a synthetic catalogue.
+
+    python -m benchmarks.bench_find_stations --stations 200000 --queries 20
+"""
+
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from src.ev_charging_stations.services import database
+from src.ev_charging_stations.services import db_pool
+from src.ev_charging_stations.services import station_index
+from src.ev_charging_stations.utils.config import settings
+
+CITIES = [(40.7128, -74.0060), (52.52, 13.405), (35.68, 139.69), (34.05, -118.24), (-33.87, 151.21)]
+
+
+def build_database(path: Path, n: int, seed: int = 0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE charging_stations (
+            station_id INTEGER PRIMARY KEY, provider TEXT, location_name TEXT,
+            latitude REAL, longitude REAL, charging_speed TEXT, available_chargers INTEGER,
+            charging_types TEXT, accessibility TEXT, operating_hours TEXT,
+            avg_sentiment REAL, num_reviews INTEGER
+        )
+    """)
+    rows = []
+    for i in range(n):
+        lat, lon = rng.choice(CITIES)
+        rows.append((
+            i, "ChargeCo", f"Station {i}",
+            lat + rng.gauss(0, 3), lon + rng.gauss(0, 3),
+            rng.choice(["Fast", "Supercharger"]), rng.randint(0, 6),
+            rng.choice(["Type 1", "Type 2", "DC Fast Charge"]),
+            rng.choice(["Public", "Restricted"]), "24/7",
+            rng.uniform(-1, 1), rng.randint(0, 20),
+        ))
+    conn.executemany("INSERT INTO charging_stations VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def make_queries(n: int, seed: int = 1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        lat, lon = rng.choice(CITIES)
+        queries.append({
+            "latitude": lat + rng.uniform(-1, 1),
+            "longitude": lon + rng.uniform(-1, 1),
+            "charging_speed": rng.choice(["Fast", "Supercharger", None]),
+            "charging_type": rng.choice(["Type 2", None]),
+        })
+    return queries
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    results = [fn(dict(q)) for q in queries]
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = Path(tmp) / "bench.db"
+        build_database(db_file, args.stations)
+        settings.db_file = db_file
+        settings.snapshot_dir = Path(tmp) / "snapshots"
+        db_pool.close_pool()
+        db_pool.enable_wal(db_file)
+        queries = make_queries(args.queries)
+
+        start = time.perf_counter()
+        station_index.load_station_index(db_file)
+        load_time = time.perf_counter() - start
+
+        scan_time, scan_results = timed(database.find_stations_scan, queries)
+        index_time, index_results = timed(database.find_stations, queries)
+        ranked_time, _ = timed(lambda q: database.find_nearest_stations(q, k=10), queries)
+        db_pool.close_pool()
+
+    same = all(
+        [s.station_id for s in a] == [s.station_id for s in b]
+        for a, b in zip(scan_results, index_results)
+    )
+    print(f"stations: {args.stations}, queries: {args.queries}")
+    print(f"index load (once):  {load_time * 1000:9.1f} ms")
+    print(f"find_stations_scan: {scan_time / args.queries * 1000:9.1f} ms/query")
+    print(f"find_stations:      {index_time / args.queries * 1000:9.1f} ms/query")
+    print(f"ranked mode (k=10): {ranked_time / args.queries * 1000:9.1f} ms/query")
+    print(f"speedup: {scan_time / index_time:.1f}x, identical results: {same}")
+
+
+if __name__ == "__main__":
+    main()
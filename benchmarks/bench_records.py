@@ -0,0 +1,95 @@
+"""
+Cost of turning search results into a response: Pydantic models per row
+(StationOutput -> .dict() -> StationOutputModel -> json) versus StationRecord
+tuples serialized with orjson.
+
+    python -m benchmarks.bench_records --stations 100000 --page 1000
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import orjson
+
+from src.ev_charging_stations.api import StationOutputModel
+from src.ev_charging_stations.services.station_store import StationStore
+
+COLUMNS = [
+    "station_id", "provider", "location_name", "latitude", "longitude", "charging_speed",
+    "available_chargers", "charging_types", "accessibility", "operating_hours",
+    "avg_sentiment", "num_reviews",
+]
+
+
+def make_store(n: int, seed: int = 0) -> StationStore:
+    rng = np.random.default_rng(seed)
+    rows = [
+        (
+            i, "ChargeCo", f"Station {i}", float(lat), float(lon), speed, int(chargers), kind, access, "24/7",
+            float(sentiment), int(reviews),
+        )
+        for i, lat, lon, speed, chargers, kind, access, sentiment, reviews in zip(
+            range(n), rng.uniform(-80, 80, n), rng.uniform(-180, 180, n),
+            rng.choice(["Fast", "Supercharger"], n).tolist(), rng.integers(0, 7, n),
+            rng.choice(["Type 1", "Type 2", "DC Fast Charge"], n).tolist(),
+            rng.choice(["Public", "Restricted"], n).tolist(), rng.uniform(-1, 1, n), rng.integers(0, 30, n),
+        )
+    ]
+    return StationStore(rows, COLUMNS)
+
+
+def models_path(store: StationStore, positions) -> bytes:
+    """What /process did before: validate, dump, re-validate, encode."""
+    stations = store.to_outputs(positions)
+    models = [StationOutputModel(**station.model_dump()) for station in stations]
+    return json.dumps({"model_output": [m.model_dump() for m in models]}).encode()
+
+
+def records_path(store: StationStore, positions) -> bytes:
+    stations = store.to_records(positions)
+    return orjson.dumps({"model_output": [station._asdict() for station in stations]})
+
+
+def objects_per_second(fn, store, positions, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(store, positions)
+    return repeat * len(positions) / (time.perf_counter() - start)
+
+
+def bytes_per_station(build, positions) -> float:
+    tracemalloc.start()
+    objects = build(positions)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / len(positions)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stations", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    store = make_store(args.stations)
+    positions = np.random.default_rng(1).choice(args.stations, args.page, replace=False)
+
+    print(f"stations: {args.stations}, page: {args.page}")
+    print(f"{'':24}{'objects/s':>12}{'bytes/station':>15}{'json bytes':>12}")
+    for name, fn, build in (
+        ("pydantic + json", models_path, store.to_outputs),
+        ("records + orjson", records_path, store.to_records),
+    ):
+        rate = objects_per_second(fn, store, positions, args.repeat)
+        memory = bytes_per_station(build, positions)
+        payload = len(fn(store, positions)) / args.page
+        print(f"{name:24}{rate:12,.0f}{memory:15,.0f}{payload:12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
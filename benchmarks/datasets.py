@@ -0,0 +1,189 @@
+"""
+Deterministic synthetic station and review datasets, from 10^3 to 10^7 rows.
+
+Stations are scattered around the gazetteer cities, so questions naming a
+known city find nearby stations. Rows are generated in fixed blocks of
+`SEED_BLOCK` rows, each seeded from `(seed, block)`, and written in chunks,
+so memory stays flat and the same arguments give the same rows whatever the
+chunk size. The CSVs use the headers of `data/`
+(stations also carry precomputed sentiment, so review ranking has a signal
+without running `compute_sentiment`) and load with the regular `load_data`:
+
+    python -m benchmarks.datasets --stations 1000000 --out .cache/bench
+    python -m src.ev_charging_stations.scripts.load_data --db .cache/bench/bench.db \\
+        --stations-csv .cache/bench/stations-1000000-v2.csv --reviews-csv .cache/bench/reviews-1000000-v2-x1.5.csv
+"""
+
+import argparse
+import csv
+import sqlite3
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from src.ev_charging_stations.scripts.load_data import load_csvs
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+CHUNK_ROWS = 100_000
+SEED_BLOCK = 10_000
+# part of the file names: bump when the generated rows change
+DATASET_VERSION = 2
+
+STATION_HEADER = [
+    "Station ID", "Provider", "Location Name", "Latitude", "Longitude", "Charging Speed",
+    "Available Chargers", "Charging Types", "Accessibility", "Operating Hours", "Avg Sentiment", "Num Reviews",
+]
+REVIEW_HEADER = [
+    "Review ID", "User ID", "Station ID", "Preferred Charging Speed", "Preferred Charging Type", "Feedback",
+]
+PROVIDERS = ["ChargeCo", "PowerGrid", "EVNow", "Electra", "VoltHub", "GreenCharge"]
+SPEEDS = ["Fast", "Supercharger", "Standard"]
+TYPES = ["Type 1", "Type 2", "DC Fast Charge", "CCS", "CHAdeMO"]
+ACCESS = ["Public", "Restricted"]
+HOURS = ["24/7", "06:00 - 22:00", "09:00 - 18:00", "07:00 - 23:00"]
+FEEDBACK = [
+    "Great station, fast charging and easy to find.",
+    "Chargers were broken and the area felt unsafe.",
+    "Decent location but there was a long wait.",
+    "Love the supercharger here, quick and reliable!",
+    "The station was dirty and hard to find.",
+    "Plenty of chargers, friendly staff, would come back.",
+    "Slow charging speed, not worth the detour.",
+    "Good value, clean and well lit at night.",
+]
+FIRST_STATION_ID = 1_000_000
+FIRST_REVIEW_ID = 1_000_000
+
+
+def city_centres() -> np.ndarray:
+    cities = pd.read_csv(DATA_DIR / "cities.csv", usecols=["latitude", "longitude"])
+    return cities.to_numpy(dtype=np.float64)
+
+
+def rechunk(blocks: Iterator[pd.DataFrame], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """The rows of `blocks`, in order, as DataFrames of `chunk_rows` rows (the last may be shorter)."""
+    pending: list[pd.DataFrame] = []
+    rows = 0
+    for block in blocks:
+        pending.append(block)
+        rows += len(block)
+        while rows >= chunk_rows:
+            frame = pd.concat(pending, ignore_index=True)
+            yield frame.iloc[:chunk_rows]
+            rest = frame.iloc[chunk_rows:].reset_index(drop=True)
+            pending, rows = ([rest] if len(rest) else []), len(rest)
+    if rows:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def station_chunks(n: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """`n` stations as DataFrames of at most `chunk_rows` rows, with the CSV headers."""
+    centres = city_centres()
+    # ~20 km spread around each city, wider for bigger catalogues
+    spread = 0.2 * max(1.0, np.log10(max(n, 10)) - 3)
+
+    def blocks():
+        for block, start in enumerate(range(0, n, SEED_BLOCK)):
+            size = min(SEED_BLOCK, n - start)
+            rng = np.random.default_rng([seed, block])
+            ids = np.arange(start, start + size) + FIRST_STATION_ID
+            centre = centres[rng.integers(0, len(centres), size)]
+            yield pd.DataFrame({
+                "Station ID": ids,
+                "Provider": np.array(PROVIDERS)[rng.integers(0, len(PROVIDERS), size)],
+                "Location Name": [f"Station {i}" for i in ids],
+                "Latitude": np.round(np.clip(centre[:, 0] + rng.normal(0, spread, size), -89.9, 89.9), 6),
+                "Longitude": np.round((centre[:, 1] + rng.normal(0, spread, size) + 180) % 360 - 180, 6),
+                "Charging Speed": np.array(SPEEDS)[rng.integers(0, len(SPEEDS), size)],
+                "Available Chargers": rng.integers(0, 9, size),
+                "Charging Types": np.array(TYPES)[rng.integers(0, len(TYPES), size)],
+                "Accessibility": np.array(ACCESS)[rng.integers(0, len(ACCESS), size)],
+                "Operating Hours": np.array(HOURS)[rng.integers(0, len(HOURS), size)],
+                "Avg Sentiment": np.round(rng.uniform(-1, 1, size), 4),
+                "Num Reviews": rng.integers(0, 30, size),
+            }, columns=STATION_HEADER)
+
+    return rechunk(blocks(), chunk_rows)
+
+
+def review_chunks(n_stations: int, reviews_per_station: float = 1.5, seed: int = 0,
+                  chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """About `reviews_per_station` reviews per station, for stations of `station_chunks(n_stations)`."""
+    n = int(n_stations * reviews_per_station)
+
+    def blocks():
+        for block, start in enumerate(range(0, n, SEED_BLOCK)):
+            size = min(SEED_BLOCK, n - start)
+            rng = np.random.default_rng([seed, 1_000_000 + block])
+            yield pd.DataFrame({
+                "Review ID": np.arange(start, start + size) + FIRST_REVIEW_ID,
+                "User ID": [f"U{u}" for u in rng.integers(0, max(n // 3, 1), size)],
+                "Station ID": rng.integers(0, n_stations, size) + FIRST_STATION_ID,
+                "Preferred Charging Speed": np.array(SPEEDS)[rng.integers(0, len(SPEEDS), size)],
+                "Preferred Charging Type": np.array(TYPES)[rng.integers(0, len(TYPES), size)],
+                "Feedback": np.array(FEEDBACK)[rng.integers(0, len(FEEDBACK), size)],
+            }, columns=REVIEW_HEADER)
+
+    return rechunk(blocks(), chunk_rows)
+
+
+def write_csv(path: Path, chunks: Iterator[pd.DataFrame]) -> int:
+    rows = 0
+    with open(path, "w", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, header=i == 0, index=False, quoting=csv.QUOTE_MINIMAL)
+            rows += len(chunk)
+    return rows
+
+
+def write_dataset(out: Path, n_stations: int, reviews_per_station: float = 1.5, seed: int = 0) -> tuple[Path, Path]:
+    """Write (or reuse) the station and review CSVs for `n_stations`; returns their paths."""
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    # every argument the rows depend on is in the name, so a cached file is only reused for the same ones
+    suffix = (f"{n_stations}" if seed == 0 else f"{n_stations}-s{seed}") + f"-v{DATASET_VERSION}"
+    stations_csv = out / f"stations-{suffix}.csv"
+    reviews_csv = out / f"reviews-{suffix}-x{reviews_per_station:g}.csv"
+    if not stations_csv.exists():
+        write_csv(stations_csv, station_chunks(n_stations, seed))
+    if not reviews_csv.exists():
+        write_csv(reviews_csv, review_chunks(n_stations, reviews_per_station, seed))
+    return stations_csv, reviews_csv
+
+
+def build_database(db_file: Path, n_stations: int, reviews_per_station: float = 1.5, seed: int = 0,
+                   csv_dir: Path = None) -> Path:
+    """A migrated SQLite database of `n_stations` synthetic stations, loaded by `load_data`."""
+    db_file = Path(db_file)
+    stations_csv, reviews_csv = write_dataset(csv_dir or db_file.parent, n_stations, reviews_per_station, seed)
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode=WAL")
+    try:
+        load_csvs(conn, stations_csv, reviews_csv)
+    finally:
+        conn.close()
+    return db_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--reviews-per-station", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=Path, default=Path(".cache") / "bench")
+    parser.add_argument("--db", action="store_true", help="also load each dataset into <out>/stations-N-vV.db")
+    args = parser.parse_args()
+
+    for n in args.stations:
+        stations_csv, reviews_csv = write_dataset(args.out, n, args.reviews_per_station, args.seed)
+        print(f"✅ {stations_csv} and {reviews_csv}")
+        if args.db:
+            db_file = args.out / f"stations-{n}-v{DATASET_VERSION}.db"
+            build_database(db_file, n, args.reviews_per_station, args.seed, args.out)
+            print(f"✅ {db_file}")
+
+
+if __name__ == "__main__":
+    main()
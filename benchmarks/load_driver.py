@@ -0,0 +1,137 @@
+"""
+End-to-end load driver for `POST /process`: concurrent HTTP clients against a
+running API, reporting throughput and latency percentiles per concurrency level.
+
+Without `--url` it serves the app itself with uvicorn, on a generated
+catalogue (`--stations`) and with the stub OpenRouter/OpenCage servers, so
+the whole path (HTTP, LLM call, geocoding, search, serialization) is
+measured without touching real providers. `--max-p95-ms` turns the run into
+a gate: the exit status is 1 if any level is slower, or if requests fail.
+
+    python -m benchmarks.load_driver --stations 100000 --requests 500 --concurrency 1 16 64
+    python -m benchmarks.load_driver --url http://staging:8000 --requests 200 --max-p95-ms 800
+"""
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+QUESTIONS = [
+    "fast chargers near {town}",
+    "public superchargers in {town}",
+    "best reviewed Type 2 stations around {town}",
+    "where can I charge my car in {town}",
+]
+
+
+def question(i: int) -> str:
+    # Unique town per request, so neither the LLM nor the geocode cache helps.
+    return QUESTIONS[i % len(QUESTIONS)].format(town=f"Town{i}")
+
+
+async def run_level(client: httpx.AsyncClient, url: str, concurrency: int, total: int, offset: int,
+                    params: dict) -> tuple[float, list[float], Counter]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], Counter()
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{url}/process", json={"query": question(offset + i)}, params=params)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies, statuses
+
+
+async def drive(url: str, args) -> bool:
+    """Run every concurrency level; False if a level failed the gate."""
+    params = {"k": args.k} if args.k else {}
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    ok = True
+    print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await client.post(f"{url}/process", json={"query": question(-1)}, params=params)  # warm up
+        offset = 0
+        for concurrency in args.concurrency:
+            elapsed, latencies, statuses = await run_level(client, url, concurrency, args.requests, offset, params)
+            offset += args.requests
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            errors = sum(n for status, n in statuses.items() if status != 200)
+            print(f"{concurrency:>11} {args.requests / elapsed:>9.1f} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {errors:>7}")
+            if errors:
+                print(f"{'':>11} responses: {dict(statuses)}")
+            if args.max_p95_ms is not None and (p95 > args.max_p95_ms or errors):
+                ok = False
+    return ok
+
+
+def serve_locally(args, tmp: Path) -> str:
+    """Generated database, stub upstreams and an in-process uvicorn; returns the base URL."""
+    import uvicorn
+
+    from benchmarks.datasets import build_database
+    from benchmarks.stub_servers import start_stub_servers
+    from src.ev_charging_stations.services import geocoding, llm_extraction
+    from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+    from src.ev_charging_stations.utils.config import settings
+
+    start = time.perf_counter()
+    db_file = build_database(tmp / "bench.db", args.stations, csv_dir=args.data_dir or tmp)
+    print(f"catalogue: {args.stations} stations ({time.perf_counter() - start:.1f} s to generate and load)")
+
+    llm, geocoder = start_stub_servers(args.llm_latency, args.geocode_latency, args.jitter)
+    settings.db_file = db_file
+    settings.snapshot_dir = tmp / "snapshots"
+    settings.openrouter_url = f"{llm.url}/api/v1/chat/completions"
+    settings.opencage_url = f"{geocoder.url}/geocode/v1/json"
+    settings.openrouter_rate_per_second = settings.opencage_rate_per_second = 0  # stubs have no quota
+    llm_extraction.llm_cache = TieredCache(TTLCache())
+    geocoding.geocode_cache = TieredCache(TTLCache())
+
+    from src.ev_charging_stations.api import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    print(f"llm latency {args.llm_latency * 1000:.0f} ms, geocode latency {args.geocode_latency * 1000:.0f} ms")
+    return f"http://127.0.0.1:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="API to load (default: serve one locally against stub upstreams)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--k", type=int, default=None, help="ranked mode: ask for the k nearest stations")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="fail if any level's p95 is above this")
+    parser.add_argument("--stations", type=int, default=100_000)
+    parser.add_argument("--data-dir", type=Path, default=None, help="reuse generated CSVs from this directory")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--geocode-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.url.rstrip("/") if args.url else serve_locally(args, Path(tmp))
+        ok = asyncio.run(drive(url, args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
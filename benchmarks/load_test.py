@@ -0,0 +1,84 @@
+"""
+Throughput of the async /process pipeline against mocked upstreams.
+
+The LLM and OpenCage are replaced by an httpx.MockTransport with fixed
+latencies, so the numbers show how the pipeline scales with concurrency
+rather than how fast the providers are.
+
+    python -m benchmarks.load_test --requests 256 --llm-latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+from src.ev_charging_stations.pipelines.query_pipeline import run_query_pipeline_async
+from src.ev_charging_stations.services import geocoding, http_client, llm_extraction
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.services.station_index import get_station_index
+from src.ev_charging_stations.utils.config import settings
+
+
+def mock_upstreams(llm_latency: float, geocode_latency: float) -> httpx.MockTransport:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if "opencage" in request.url.host:
+            await asyncio.sleep(geocode_latency)
+            return httpx.Response(200, json={"results": [{"geometry": {"lat": 52.52, "lng": 13.405}}]})
+        await asyncio.sleep(llm_latency)
+        question = json.loads(request.content)["messages"][0]["content"].rsplit("Question:", 1)[1].strip()
+        town = question.rsplit(" ", 1)[-1]
+        content = json.dumps({"city": town, "charging_speed": "Fast", "sort_by_reviews": False})
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    return httpx.MockTransport(handler)
+
+
+async def run_level(concurrency: int, total: int, offset: int) -> tuple[float, list[float]]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            # Unique wording and town per request, so caches do not help.
+            await run_query_pipeline_async(f"cheapest chargers near Town{offset + i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return time.perf_counter() - start, latencies
+
+
+async def main_async(args):
+    http_client.set_transport(mock_upstreams(args.llm_latency, args.geocode_latency))
+    settings.openrouter_rate_per_second = settings.opencage_rate_per_second = 0  # mocks have no quota
+    llm_extraction.llm_cache = TieredCache(TTLCache())
+    geocoding.geocode_cache = TieredCache(TTLCache())
+    get_station_index()
+
+    print(f"llm latency {args.llm_latency * 1000:.0f} ms, geocode latency {args.geocode_latency * 1000:.0f} ms")
+    print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    offset = 0
+    for concurrency in args.concurrency:
+        elapsed, latencies = await run_level(concurrency, args.requests, offset)
+        offset += args.requests
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        print(f"{concurrency:>11} {args.requests / elapsed:>9.1f} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+    await http_client.close_async_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--geocode-latency", type=float, default=0.05)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
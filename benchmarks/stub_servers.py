@@ -0,0 +1,123 @@
+"""
+Local stand-ins for OpenRouter and OpenCage with configurable latency.
+
+Unlike the `httpx.MockTransport` of `load_test`, these are real HTTP servers,
+so benchmarks also pay for sockets, connection pooling and JSON over the
+wire. The LLM stub answers with the city named at the end of the question;
+the geocoder places every town on a gazetteer city, chosen by hash.
+
+    python -m benchmarks.stub_servers --llm-latency 0.3 --geocode-latency 0.05
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.datasets import city_centres
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, handler, latency: float, jitter: float = 0.0, error_rate: float = 0.0, port: int = 0):
+        super().__init__(("127.0.0.1", port), handler)
+        self.latency, self.jitter, self.error_rate = latency, jitter, error_rate
+        self.requests = 0
+        self._rng = random.Random(0)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self.serve_forever, name=self.RequestHandlerClass.__name__, daemon=True).start()
+        return self
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real providers
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _simulate(self) -> bool:
+        """Sleep for the configured latency; False if this request should fail."""
+        self.server.requests += 1
+        time.sleep(self.server.delay())
+        if self.server.error_rate and self.server._rng.random() < self.server.error_rate:
+            self._reply(503, {"error": "stub failure"})
+            return False
+        return True
+
+
+class OpenRouterHandler(_StubHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if not self._simulate():
+            return
+        question = body["messages"][0]["content"].rsplit("Question:", 1)[-1].strip()
+        content = json.dumps({"city": question.rsplit(" ", 1)[-1], "sort_by_reviews": "review" in question})
+        self._reply(200, {"choices": [{"message": {"content": content}}]})
+
+
+class OpenCageHandler(_StubHandler):
+    centres = None
+
+    def do_GET(self):
+        if not self._simulate():
+            return
+        place = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        if OpenCageHandler.centres is None:
+            OpenCageHandler.centres = city_centres()
+        lat, lng = self.centres[int(hashlib.sha1(place.encode()).hexdigest(), 16) % len(self.centres)]
+        self._reply(200, {"results": [{"geometry": {"lat": float(lat), "lng": float(lng)}}]})
+
+
+def start_stub_servers(llm_latency: float = 0.3, geocode_latency: float = 0.05, jitter: float = 0.0,
+                       error_rate: float = 0.0) -> tuple[StubServer, StubServer]:
+    """Start both stubs on free ports; point `settings.openrouter_url` / `opencage_url` at their `.url`."""
+    llm = StubServer(OpenRouterHandler, llm_latency, jitter, error_rate).start()
+    geocoder = StubServer(OpenCageHandler, geocode_latency, jitter, error_rate).start()
+    return llm, geocoder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--geocode-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-port", type=int, default=8081)
+    parser.add_argument("--geocode-port", type=int, default=8082)
+    args = parser.parse_args()
+
+    llm = StubServer(OpenRouterHandler, args.llm_latency, args.jitter, args.error_rate, args.llm_port).start()
+    geocoder = StubServer(OpenCageHandler, args.geocode_latency, args.jitter, args.error_rate, args.geocode_port).start()
+    print("Point the API at the stubs with:")
+    print(f"  OPENROUTER_URL={llm.url}/api/v1/chat/completions OPENCAGE_URL={geocoder.url}/geocode/v1/json "
+          "uvicorn src.ev_charging_stations.api:app")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Microbenchmarks for the hot functions, run with pytest-benchmark:
+
+    pytest benchmarks --benchmark-autosave                 # record a baseline
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+
+Catalogue sizes default to 10^3..10^5 stations; set BENCH_SIZES (e.g.
+"1000,1000000,10000000") for larger ones. Generated databases are cached
+under .cache/bench so repeated runs skip the load.
+"""
+
+import itertools
+import os
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.datasets import DATASET_VERSION, FEEDBACK, build_database, city_centres  # noqa: E402
+from src.ev_charging_stations.scripts.compute_sentiment import get_sentiment_score, score_texts  # noqa: E402
+from src.ev_charging_stations.services import database, db_pool, station_index  # noqa: E402
+from src.ev_charging_stations.services.migrations import migrate  # noqa: E402
+from src.ev_charging_stations.services.station_store import haversine_distances  # noqa: E402
+from src.ev_charging_stations.utils.config import settings  # noqa: E402
+
+SIZES = [int(n) for n in os.environ.get("BENCH_SIZES", "1000,10000,100000").split(",")]
+CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "bench"
+
+
+def make_queries(n: int = 64, seed: int = 1) -> list[dict]:
+    rng = random.Random(seed)
+    centres = city_centres()
+    queries = []
+    for _ in range(n):
+        lat, lon = centres[rng.randrange(len(centres))]
+        queries.append({
+            "latitude": float(lat) + rng.uniform(-0.1, 0.1),
+            "longitude": float(lon) + rng.uniform(-0.1, 0.1),
+            "charging_speed": rng.choice(["Fast", "Supercharger", None]),
+            "charging_type": rng.choice(["Type 2", None]),
+        })
+    return queries
+
+
+def cycle(fn, queries):
+    """Call `fn` on the next query each round, so caches see a realistic mix."""
+    state = {"i": 0}
+
+    def run():
+        query = queries[state["i"] % len(queries)]
+        state["i"] += 1
+        return fn(dict(query))
+    return run
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda n: f"{n}_stations")
+def catalogue(request, tmp_path_factory):
+    """A generated database of `n` stations, with the station index loaded from it."""
+    n = request.param
+    db_file = CACHE_DIR / f"stations-{n}-v{DATASET_VERSION}.db"
+    if not db_file.exists():
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        build_database(db_file, n, csv_dir=CACHE_DIR)
+    saved = settings.db_file, settings.snapshot_dir
+    settings.db_file, settings.snapshot_dir = db_file, tmp_path_factory.mktemp("snapshots")
+    migrate(db_file)  # databases cached by older runs
+    db_pool.close_pool()
+    db_pool.enable_wal(db_file)
+    station_index.load_station_index(db_file)
+    yield n
+    db_pool.close_pool()
+    settings.db_file, settings.snapshot_dir = saved
+    # loaded again on first use, rather than snapshotting the default database now
+    station_index._watcher.close()
+    station_index._index, station_index._watcher = None, None
+
+
+def test_find_stations(benchmark, catalogue):
+    benchmark(cycle(database.find_stations, make_queries()))
+
+
+def test_find_nearest_stations(benchmark, catalogue):
+    benchmark(cycle(lambda q: database.find_nearest_stations(q, k=10), make_queries()))
+
+
+def test_find_nearest_stations_by_reviews(benchmark, catalogue):
+    benchmark(cycle(lambda q: database.find_nearest_stations({**q, "sort_by_reviews": True}, k=10), make_queries()))
+
+
+def test_find_stations_by_name(benchmark, catalogue):
+    """Provider (with a typo) and station-name lookups on the full-text index, combined with the geo search."""
+    # a new name every round, so the lookup cache never answers
+    names = (f"Station {1_000_000 + i % catalogue}" for i in itertools.count(0, 7))
+    benchmark(cycle(lambda q: database.find_stations({**q, "provider": "ChargCo", "name_query": next(names)}),
+                    make_queries()))
+
+
+def test_haversine(benchmark):
+    benchmark(database.haversine, 40.7128, -74.0060, 52.52, 13.405)
+
+
+@pytest.mark.parametrize("n", SIZES, ids=lambda n: f"{n}_points")
+def test_haversine_distances(benchmark, n):
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(-80, 80, n), rng.uniform(-180, 180, n)
+    benchmark(haversine_distances, 40.7128, -74.0060, lat, lon)
+
+
+def test_sentiment_score(benchmark):
+    benchmark(get_sentiment_score, FEEDBACK[0])
+
+
+def test_score_texts_batch(benchmark):
+    texts = [f"{FEEDBACK[i % len(FEEDBACK)]} Visit {i}." for i in range(1000)]
+    benchmark.pedantic(score_texts, args=(texts,), kwargs={"workers": 1}, rounds=3)
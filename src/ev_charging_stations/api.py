@@ -1,12 +1,31 @@
 """Module for hosting the UI and API."""
 
-from fastapi import FastAPI
-from pydantic import BaseModel
+import asyncio
+import base64
+import binascii
+import json
+import orjson
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, Request
+from pydantic import BaseModel, model_validator
 from pathlib import Path
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from src.ev_charging_stations.pipelines.query_pipeline import run_query_pipeline
-from typing import Optional
+from src.ev_charging_stations.pipelines.query_pipeline import match_stations_async, rank_stations_async, resolve_filters_async, run_batch_pipeline_async
+from src.ev_charging_stations.services.availability import close_availability, get_availability
+from src.ev_charging_stations.services.database import ranked_chunks
+from src.ev_charging_stations.services.db_pool import close_pool, enable_wal
+from src.ev_charging_stations.services.http_client import close_async_client
+from src.ev_charging_stations.services import metrics
+from src.ev_charging_stations.services.migrations import migrate
+from src.ev_charging_stations.services.opening_hours import normalize_open_at
+from src.ev_charging_stations.services.reviews import add_review
+from src.ev_charging_stations.services.sentiment import close_sentiment_service, get_sentiment_service
+from src.ev_charging_stations.services.shards import close_shard_pool, get_search_index, get_shard_set
+from src.ev_charging_stations.services.station_index import load_station_index
+from src.ev_charging_stations.utils.config import settings
+from typing import Literal, Optional
 from fastapi import HTTPException
 
 
@@ -14,7 +33,26 @@ from fastapi import HTTPException
 # -------------------------
 # App setup
 # -------------------------
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Migrate the schema and load the station index (or shard set) once, before serving requests."""
+    migrate()
+    # switch journal mode first: doing it later counts as a change and reloads the index
+    enable_wal(settings.db_file)
+    if settings.shard_dir:
+        get_shard_set()
+    else:
+        load_station_index()
+    yield
+    await close_async_client()
+    close_pool()
+    close_sentiment_service()
+    close_availability()
+    close_shard_pool()
+    profiler.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -24,6 +62,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+profiler = metrics.StackSampler(settings.profile_sample_rate)
+
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Request latency per route, plus the per-stage Server-Timing header when enabled."""
+    timings = metrics.start_request_timings()
+    start = time.perf_counter()
+    if profiler.should_sample():
+        with profiler.sampling():
+            response = await call_next(request)
+    else:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    metrics.request_duration.observe(elapsed, path=getattr(route, "path", "unmatched"), method=request.method)
+    if settings.server_timing:
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings, elapsed)
+    return response
+
 # -------------------------
 # Models
 # -------------------------
@@ -47,23 +105,296 @@ class StationOutputModel(BaseModel):
     operating_hours: str
     avg_sentiment: Optional[float] = None
     num_reviews: Optional[int] = None
+    distance_km: Optional[float] = None  # set in ranked mode (`k`)
 
 
 class ResponseModel(BaseModel):
     """Model for API response."""
     model_output: list[StationOutputModel]
+    total: Optional[int] = None  # matching stations before pagination
+    next_cursor: Optional[str] = None  # pass back as `cursor` for the next page
+
+
+class BatchQueryModel(BaseModel):
+    """Model for a batch of queries."""
+    queries: list[QueryModel]
+
+
+class BatchItemModel(BaseModel):
+    """Result for one query of a batch: stations, or the error for that query."""
+    model_output: Optional[list[StationOutputModel]] = None
+    error: Optional[str] = None
+
+
+class BatchResponseModel(BaseModel):
+    """Model for batch API response, in the order of the submitted queries."""
+    results: list[BatchItemModel]
+
+
+class ReviewModel(BaseModel):
+    """Model for a review submitted by a user."""
+    station_id: int
+    feedback: str
+    user_id: Optional[str] = None
+    preferred_charging_speed: Optional[str] = None
+    preferred_charging_type: Optional[str] = None
+
+
+class ReviewResponseModel(BaseModel):
+    """Model for a stored review, with the station's updated average."""
+    review_id: int
+    station_id: int
+    sentiment_score: Optional[float] = None
+    avg_sentiment: Optional[float] = None
+    num_reviews: int
+
+
+class AvailabilityUpdateModel(BaseModel):
+    """One status update: the station's free chargers now, or the change in them."""
+    station_id: int
+    available: Optional[int] = None
+    delta: Optional[int] = None
+
+    @model_validator(mode="after")
+    def one_of_available_or_delta(self):
+        if (self.available is None) == (self.delta is None):
+            raise ValueError("Give exactly one of `available` or `delta`.")
+        return self
+
+
+class AvailabilityBatchModel(BaseModel):
+    """Model for a batch of status updates, applied in order."""
+    updates: list[AvailabilityUpdateModel]
+
+
+class AvailabilityResponseModel(BaseModel):
+    """New counts of the updated stations, and station ids that were not found."""
+    applied: dict[int, int]
+    unknown: list[int]
 
 # -------------------------
 # API Endpoints
 # -------------------------
 
-@app.post("/process", response_model=ResponseModel)
-async def process_query(query_model: QueryModel):
-    """Serves the API for the frontend or external calls."""
-    stations = run_query_pipeline(query_model.query)
-    if stations is None:
-        raise HTTPException(status_code=500, detail="Failed to process query. Try again later.(Open Router API KEY error.)")
-    return {"model_output": [station.dict() for station in stations]}
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(data["offset"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return offset
+
+
+def page_bounds(total: int, limit: Optional[int], offset: int, cursor: Optional[str]) -> tuple[int, int, Optional[str]]:
+    """Slice [start, stop) for the requested page, and the cursor for the next one."""
+    start = decode_cursor(cursor) if cursor else offset
+    stop = total if limit is None else min(start + limit, total)
+    return start, stop, encode_cursor(stop) if stop < total else None
+
+
+def orjson_response(content) -> Response:
+    """
+    A JSON body serialized with orjson, skipping the response model: the
+    records are already typed. Routes returning this document their body with
+    `responses=` rather than `response_model=`, which would not be enforced.
+    """
+    return Response(orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS), media_type="application/json")
+
+
+def with_options(filter_dict: dict, corridor_km: Optional[float], min_available: Optional[int],
+                 open_at: Optional[str]) -> dict:
+    """Apply the request's corridor width (to a route question), availability floor and opening time."""
+    if corridor_km is not None and filter_dict.get("route"):
+        filter_dict["corridor_km"] = corridor_km
+    if min_available is not None:
+        filter_dict["min_available"] = min_available
+    if open_at is not None:
+        if normalize_open_at(open_at) is None:
+            raise HTTPException(status_code=400, detail=f"Cannot read open_at {open_at!r}; use now, HH:MM or 'Sat 09:00'.")
+        filter_dict["open_at"] = open_at
+    return filter_dict
+
+
+@app.post("/process", responses={200: {"model": ResponseModel}})
+async def process_query(
+    query_model: QueryModel,
+    k: Optional[int] = Query(None, ge=1, le=1000),
+    max_radius: float = Query(600, gt=0),
+    corridor_km: Optional[float] = Query(None, gt=0, le=200),
+    min_available: Optional[int] = Query(None, ge=1),
+    open_at: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    """
+    Serves the API for the frontend or external calls. With `k`, returns the
+    k nearest matching stations within `max_radius` km (best-scored when the
+    question asks for well-reviewed ones), each with `distance_km`.
+    A route question ("from Munich to Berlin") returns the stations within
+    `corridor_km` of the route instead, in order along it.
+    `min_available` keeps stations with at least that many free chargers
+    right now (see `/availability`).
+    `open_at` ("now", "23:00", "Sat 09:00") keeps stations open at that time.
+    """
+    filter_dict = with_options(await resolve_filters_async(query_model.query), corridor_km, min_available, open_at)
+    index, positions, distances = await rank_stations_async(filter_dict, k, max_radius)
+    start, stop, next_cursor = page_bounds(len(positions), limit, offset, cursor)
+    # Only the requested page becomes records; they go straight to orjson.
+    with metrics.span("serialize"):
+        stations = index.to_records(positions[start:stop], None if distances is None else distances[start:stop])
+        return orjson_response({
+            "model_output": [station._asdict() for station in stations],
+            "total": len(positions),
+            "next_cursor": next_cursor,
+        })
+
+STREAM_CHUNK = 32
+
+
+@app.post("/process/stream")
+async def process_query_stream(
+    query_model: QueryModel,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    k: Optional[int] = Query(None, ge=1, le=1000),
+    max_radius: float = Query(600, gt=0),
+    corridor_km: Optional[float] = Query(None, gt=0, le=200),
+    min_available: Optional[int] = Query(None, ge=1),
+    open_at: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+):
+    """
+    Streams matching stations in rank order as NDJSON (one station per line)
+    or Server-Sent Events, so clients can render results as they arrive.
+    Totals and the next cursor are sent as headers (and a final SSE event).
+    Only the matching happens up front: the page is ranked a chunk at a time
+    as it is sent (ranked mode, `k`, is bounded and ranked in one go).
+    """
+    filter_dict = with_options(await resolve_filters_async(query_model.query), corridor_km, min_available, open_at)
+    if k is None:
+        index, positions, keys = await match_stations_async(filter_dict, max_radius)
+        start, stop, next_cursor = page_bounds(len(positions), limit, offset, cursor)
+        chunks = ((page, None) for page in ranked_chunks(positions, keys, start, stop, STREAM_CHUNK))
+    else:
+        index, positions, distances = await rank_stations_async(filter_dict, k, max_radius)
+        start, stop, next_cursor = page_bounds(len(positions), limit, offset, cursor)
+        page = positions[start:stop]
+        page_distances = None if distances is None else distances[start:stop]
+        chunks = (
+            (page[i:i + STREAM_CHUNK], None if page_distances is None else page_distances[i:i + STREAM_CHUNK])
+            for i in range(0, len(page), STREAM_CHUNK)
+        )
+
+    def lines():
+        # a sync generator: Starlette runs it on a worker thread, chunk by chunk
+        for page, page_distances in chunks:
+            stations = index.to_records(page, page_distances)
+            if format == "sse":
+                yield b"".join(b"event: station\ndata: " + orjson.dumps(s._asdict()) + b"\n\n" for s in stations)
+            else:
+                yield b"".join(orjson.dumps(s._asdict()) + b"\n" for s in stations)
+        if format == "sse":
+            yield b"event: end\ndata: " + orjson.dumps({"total": len(positions), "next_cursor": next_cursor}) + b"\n\n"
+
+    headers = {"X-Total-Count": str(len(positions))}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(lines(), media_type=media_type, headers=headers)
+
+@app.post("/process/batch", responses={200: {"model": BatchResponseModel}})
+async def process_batch(batch: BatchQueryModel):
+    """Processes many queries in one call, for bulk and nightly jobs."""
+    if len(batch.queries) > settings.batch_max_size:
+        raise HTTPException(status_code=413, detail=f"At most {settings.batch_max_size} queries per batch.")
+    outcomes = await run_batch_pipeline_async([q.query for q in batch.queries])
+    with metrics.span("serialize"):
+        results = []
+        for outcome in outcomes:
+            if isinstance(outcome, HTTPException):
+                results.append({"model_output": None, "error": outcome.detail})
+            elif isinstance(outcome, Exception):
+                results.append({"model_output": None, "error": str(outcome) or type(outcome).__name__})
+            else:
+                results.append({"model_output": [station._asdict() for station in outcome], "error": None})
+        return orjson_response({"results": results})
+
+@app.post("/reviews", response_model=ReviewResponseModel, status_code=201)
+async def submit_review(review: ReviewModel):
+    """
+    Scores a new review as it arrives and folds it into the station's
+    averages and review features; searches see it after the next index check.
+    """
+    if not review.feedback.strip():
+        raise HTTPException(status_code=400, detail="Feedback cannot be empty.")
+    with metrics.span("sentiment"):
+        (score,) = await get_sentiment_service().score_async([review.feedback])
+    with metrics.span("store"):
+        stored = await asyncio.to_thread(add_review, review.model_dump(), score)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Unknown station {review.station_id}.")
+    return stored
+
+@app.post("/availability", response_model=AvailabilityResponseModel)
+async def ingest_availability(batch: AvailabilityBatchModel):
+    """
+    Applies a batch of charger status updates to the live overlay. Searches
+    and subscribers see them at once; they reach disk at the next checkpoint.
+    """
+    updates = [(u.station_id, u.available, u.delta) for u in batch.updates]
+    with metrics.span("availability"):
+        applied, unknown = get_availability().apply(get_search_index(), updates)
+    return {"applied": applied, "unknown": unknown}
+
+AVAILABILITY_KEEPALIVE = 15.0
+
+
+@app.get("/availability/stream")
+async def stream_availability(request: Request, station_ids: list[int] = Query(..., max_length=1000)):
+    """
+    Server-Sent Events with the live charger counts of `station_ids` (the
+    stations a client is showing): current counts first, then each change
+    as it is applied. Changes a slow client has not read yet are merged.
+    """
+    overlay = get_availability()
+    subscription = overlay.subscribe(station_ids)
+
+    async def events():
+        try:
+            yield b"event: availability\ndata: " + orjson.dumps(overlay.counts(get_search_index(), station_ids), option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+            while not await request.is_disconnected():
+                changes = await subscription.changes(AVAILABILITY_KEEPALIVE)
+                if changes:
+                    yield b"event: availability\ndata: " + orjson.dumps(changes, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+                else:
+                    yield b": keepalive\n\n"
+        finally:
+            overlay.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus scrape endpoint for this worker."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile")
+async def get_profile(top: int = Query(200, ge=1), reset: bool = False):
+    """Hottest sampled stacks in collapsed form (feed to flamegraph.pl or speedscope)."""
+    if profiler.rate <= 0:
+        raise HTTPException(status_code=404, detail="Profiling is off; set PROFILE_SAMPLE_RATE.")
+    body = profiler.collapsed(top)
+    if reset:
+        profiler.reset()
+    return PlainTextResponse(body)
 
 @app.get("/")
 async def get_index():
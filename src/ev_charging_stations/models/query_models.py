@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, field_validator
+from typing import NamedTuple, Optional
+
+from src.ev_charging_stations.services.opening_hours import normalize_open_at
 
 class UserQuery(BaseModel):
     city: Optional[str] = None
@@ -8,6 +10,24 @@ class UserQuery(BaseModel):
     charging_speed: Optional[str] = None
     charging_type: Optional[str] = None
     accessibility: Optional[str] = None
+    sort_by_reviews: Optional[bool] = None
+    available_only: Optional[bool] = None
+    # "now", "HH:MM" (today), "Sat 09:00" or an ISO datetime, in station local time
+    open_at: Optional[str] = None
+    # route questions: named stops, and their coordinates once geocoded
+    origin: Optional[str] = None
+    destination: Optional[str] = None
+    waypoints: Optional[list[str]] = None
+    route: Optional[list[tuple[float, float]]] = None
+    # charging network, and a station or place name, matched typo-tolerantly
+    provider: Optional[str] = None
+    name_query: Optional[str] = None
+
+    @field_validator("open_at", mode="before")
+    @classmethod
+    def drop_unknown_times(cls, value):
+        # an unreadable time from the LLM means no hours filter, not a failed query
+        return normalize_open_at(value)
 
 class StationOutput(BaseModel):
     station_id: int
@@ -22,3 +42,27 @@ class StationOutput(BaseModel):
     operating_hours: str
     avg_sentiment: Optional[float]
     num_reviews: Optional[int]
+    distance_km: Optional[float] = None
+
+
+class StationRecord(NamedTuple):
+    """
+    Lightweight station row for the search path: same fields as
+    StationOutput, without validation. Convert only the page you return.
+    """
+    station_id: int
+    provider: str
+    location_name: str
+    latitude: float
+    longitude: float
+    charging_speed: str
+    available_chargers: int
+    charging_types: str
+    accessibility: str
+    operating_hours: str
+    avg_sentiment: Optional[float]
+    num_reviews: Optional[int]
+    distance_km: Optional[float] = None
+
+    def to_output(self) -> StationOutput:
+        return StationOutput(**self._asdict())
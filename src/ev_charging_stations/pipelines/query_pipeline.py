@@ -1,11 +1,55 @@
-from src.ev_charging_stations.services.llm_extraction import parse_user_question
-from src.ev_charging_stations.services.geocoding import geocode_city
-from src.ev_charging_stations.services.database import find_stations
+import asyncio
+import functools
+import json
+import numpy as np
+from typing import Optional
+from src.ev_charging_stations.services.availability import get_availability, min_available
+from src.ev_charging_stations.services.llm_extraction import normalize_question, parse_user_question, parse_user_question_async
+from src.ev_charging_stations.services.gazetteer import normalize_place
+from src.ev_charging_stations.services.geocoding import geocode_city, geocode_city_async
+from src.ev_charging_stations.services.metrics import registry, span, upstream_errors
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.services.singleflight import SingleFlight
+from src.ev_charging_stations.services import database
+from src.ev_charging_stations.services.database import match_station_positions, rank_nearest_positions, rank_station_positions
+from src.ev_charging_stations.services.shards import get_search_index
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.utils.config import settings
 from fastapi import HTTPException
 
+# Step 3 results, (index, positions, distances), stored with the index and
+# its generation: valid only for the snapshot and review scores they were
+# computed on. Concurrent identical searches share one run.
+response_cache = TieredCache(TTLCache(maxsize=settings.response_cache_size, ttl=settings.response_cache_ttl_seconds))
+registry.register_cache("response", lambda: response_cache)
+search_flight = SingleFlight("search")
+
+
+def cached_result(key: str, index) -> Optional[tuple]:
+    """The response cache's result for `key` if it was computed on `index` as it is now."""
+    cached = response_cache.get(key)
+    if cached is not None and cached[0] is index and cached[1] == index.generation:
+        return cached[2]
+    return None
+
+
+def search_key(filter_dict: dict, k: Optional[int] = None, max_radius: float = 600) -> str:
+    # availability filters depend on live counts as well: key on their version
+    live = get_availability().version if min_available(filter_dict) else None
+    return json.dumps([filter_dict, k, max_radius, live], sort_keys=True)
+
+
+def route_stops(filters) -> list[str]:
+    """Places of a route question in travel order; empty unless both ends are named."""
+    if not (filters.origin and filters.destination) or filters.route:
+        return []
+    return [filters.origin, *(filters.waypoints or []), filters.destination]
+
+
 def run_query_pipeline(user_question: str):
     # Step 1: Parse with LLM
-    filters = parse_user_question(user_question)
+    with span("llm"):
+        filters = parse_user_question(user_question)
 
     # Step 1b: Handle API failure
     if filters is None:
@@ -16,15 +60,212 @@ def run_query_pipeline(user_question: str):
 
     # Step 2: If city provided but no lat/lng, geocode it
     if filters.city and not filters.latitude and not filters.longitude:
-        lat_lng = geocode_city(filters.city)
+        with span("geocode"):
+            lat_lng = geocode_city(filters.city)
         if lat_lng:
             filters.latitude, filters.longitude = lat_lng
 
+    # Step 2b: A route question searches a corridor through all of its stops
+    stops = route_stops(filters)
+    if stops:
+        with span("geocode"):
+            route = [geocode_city(stop) for stop in stops]
+        if all(route):
+            filters.route = route
+
     # Step 3: Prepare filter dict
     filter_dict = filters.dict(exclude_none=True)
 
     # Step 4: Query database
-    stations = find_stations(filter_dict)
+    with span("search"):
+        stations = list(search_flight.do(search_key(filter_dict), lambda: database.find_stations(filter_dict)))
 
     return stations
 
+
+async def _geocode_async(city: str) -> Optional[tuple[float, float]]:
+    try:
+        return await asyncio.wait_for(geocode_city_async(city), settings.geocode_timeout_seconds)
+    except asyncio.TimeoutError:
+        upstream_errors.inc(service="opencage", error="Timeout")
+        return None
+
+
+async def resolve_filters_async(user_question: str) -> dict:
+    """
+    Steps 1-2 of the pipeline (LLM parse, geocode) without blocking the event
+    loop. Each stage has its own timeout, and cancelling the caller (e.g. a
+    client disconnect) cancels whichever stage is in flight. The station index
+    is warmed on a worker thread while the LLM call is still running.
+    """
+    warm_index = asyncio.create_task(asyncio.to_thread(get_search_index))
+    try:
+        # Step 1: Parse with LLM
+        try:
+            with span("llm"):
+                filters = await asyncio.wait_for(parse_user_question_async(user_question), settings.llm_timeout_seconds)
+        except asyncio.TimeoutError:
+            upstream_errors.inc(service="openrouter", error="Timeout")
+            filters = None
+        if filters is None:
+            raise HTTPException(
+                status_code=500,
+                detail="Error: Failed to process query using language model. Please try again later."
+            )
+
+        # Step 2: Geocode; a slow geocoder only costs us the coordinates
+        if filters.city and not filters.latitude and not filters.longitude:
+            with span("geocode"):
+                lat_lng = await _geocode_async(filters.city)
+            if lat_lng:
+                filters.latitude, filters.longitude = lat_lng
+
+        stops = route_stops(filters)
+        if stops:
+            with span("geocode"):
+                route = await asyncio.gather(*(_geocode_async(stop) for stop in stops))
+            if all(route):
+                filters.route = route
+
+        await warm_index
+        return filters.model_dump(exclude_none=True)
+    finally:
+        if not warm_index.done():
+            warm_index.cancel()
+
+
+async def rank_stations_async(filter_dict: dict, k: Optional[int] = None, max_radius: float = 600
+                              ) -> tuple[StationIndex, np.ndarray, Optional[np.ndarray]]:
+    """
+    Step 3: ranked catalogue positions and their distances (ranked mode, when
+    `k` is given; None otherwise), plus the index snapshot they refer to.
+    Repeats within `response_cache_ttl_seconds` come from the response cache,
+    and concurrent identical searches share one run.
+    """
+    index = get_search_index()
+    key = search_key(filter_dict, k, max_radius)
+    if k is None:
+        search = functools.partial(rank_station_positions, filter_dict, max_radius=max_radius, index=index)
+    else:
+        search = functools.partial(rank_nearest_positions, filter_dict, k, max_radius, index=index)
+
+    generation = index.generation
+
+    async def run():
+        result = await asyncio.to_thread(search)
+        ranked = (index, *result) if k is not None else (index, result, None)
+        response_cache.set(key, (index, generation, ranked))
+        return ranked
+
+    try:
+        with span("search"):
+            cached = cached_result(key, index)
+            if cached is not None:
+                return cached
+            flight = (key, id(index), generation)
+            return await asyncio.wait_for(search_flight.do_async(flight, run), settings.db_timeout_seconds)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Station search timed out. Please try again.")
+
+
+async def match_stations_async(filter_dict: dict, max_radius: float = 600
+                               ) -> tuple[StationIndex, np.ndarray, Optional[np.ndarray]]:
+    """
+    Step 3 without the ranking, for streaming: the matching positions and
+    their sort keys (see `match_station_positions`), plus the index snapshot.
+    A ranked result still in the response cache is used as is (keys None).
+    """
+    index = get_search_index()
+    try:
+        with span("search"):
+            cached = cached_result(search_key(filter_dict, None, max_radius), index)
+            if cached is not None:
+                return index, cached[1], None
+            search = functools.partial(match_station_positions, filter_dict, max_radius=max_radius, index=index)
+            return (index, *await asyncio.wait_for(asyncio.to_thread(search), settings.db_timeout_seconds))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Station search timed out. Please try again.")
+
+
+async def run_query_pipeline_async(user_question: str, k: Optional[int] = None, max_radius: float = 600):
+    """Same stages and result as `run_query_pipeline`, without blocking the event loop."""
+    filter_dict = await resolve_filters_async(user_question)
+    index, positions, distances = await rank_stations_async(filter_dict, k, max_radius)
+    return index.to_outputs(positions, distances)
+
+
+LLM_FAILURE = "Failed to process query using language model. Please try again later."
+
+
+async def _bounded(semaphore: asyncio.Semaphore, coro):
+    async with semaphore:
+        return await coro
+
+
+async def run_batch_pipeline_async(user_questions: list[str]) -> list:
+    """
+    Run many questions at once. Returns, in input order, either a list of
+    StationRecord or an Exception for each question.
+
+    Identical questions (after normalization) are parsed once, LLM calls run
+    concurrently up to `batch_llm_concurrency`, each distinct city (or route
+    stop) is geocoded once, and every search runs against the same station index snapshot.
+    """
+    warm_index = asyncio.create_task(asyncio.to_thread(get_search_index))
+
+    # Step 1: dedupe and parse
+    keys = [normalize_question(q) for q in user_questions]
+    unique = dict(zip(keys, user_questions))
+    llm_slots = asyncio.Semaphore(settings.batch_llm_concurrency)
+
+    async def parse(question):
+        try:
+            return await asyncio.wait_for(parse_user_question_async(question), settings.llm_timeout_seconds)
+        except asyncio.TimeoutError:
+            upstream_errors.inc(service="openrouter", error="Timeout")
+            return None
+
+    with span("llm"):
+        parsed = await asyncio.gather(*(_bounded(llm_slots, parse(q)) for q in unique.values()))
+    filters_by_key = dict(zip(unique, parsed))
+
+    # Step 2: geocode each distinct city (or route stop) once
+    cities = {}
+    for filters in parsed:
+        if filters is None:
+            continue
+        if filters.city and not filters.latitude and not filters.longitude:
+            cities.setdefault(normalize_place(filters.city), filters.city)
+        for stop in route_stops(filters):
+            cities.setdefault(normalize_place(stop), stop)
+    geo_slots = asyncio.Semaphore(settings.batch_geocode_concurrency)
+
+    with span("geocode"):
+        coords = dict(zip(cities, await asyncio.gather(*(_bounded(geo_slots, _geocode_async(c)) for c in cities.values()))))
+
+    # Step 3: search every distinct query against one snapshot
+    index = await warm_index
+
+    def search_all():
+        results = {}
+        for key, filters in filters_by_key.items():
+            if filters is None:
+                results[key] = HTTPException(status_code=500, detail=LLM_FAILURE)
+                continue
+            filter_dict = filters.model_dump(exclude_none=True)
+            if filters.city and not filters.latitude and not filters.longitude:
+                lat_lng = coords.get(normalize_place(filters.city))
+                if lat_lng:
+                    filter_dict["latitude"], filter_dict["longitude"] = lat_lng
+            route = [coords.get(normalize_place(stop)) for stop in route_stops(filters)]
+            if route and all(route):
+                filter_dict["route"] = route
+            try:
+                results[key] = index.to_records(rank_station_positions(filter_dict, index=index))
+            except Exception as e:
+                results[key] = e
+        return results
+
+    with span("search"):
+        results = await asyncio.to_thread(search_all)
+    return [results[key] for key in keys]
@@ -1,7 +1,25 @@
+"""
+Incremental sentiment scoring for user reviews.
+
+Only reviews whose feedback changed since they were last scored (tracked by a
+hash of the text) go through the sentiment service (`services.sentiment`:
+TextBlob or VADER, chunked over a process pool, duplicates scored once). Scores are
+written with `executemany` in one transaction, and station averages are kept
+up to date from running sum/count deltas instead of a full regroup. The
+station features of the rescored stations are refreshed in the same
+transaction.
+
+    python -m src.ev_charging_stations.scripts.compute_sentiment [--full] [--workers N] [--backend vader]
+"""
+
+import argparse
 import sqlite3
+from collections import defaultdict
 from pathlib import Path
-import pandas as pd
-from textblob import TextBlob
+from src.ev_charging_stations.services.migrations import migrate
+from src.ev_charging_stations.services.sentiment import BACKENDS, SentimentService, build_cache, get_backend, text_hash
+from src.ev_charging_stations.services.station_features import refresh_station_features
+from src.ev_charging_stations.utils.config import settings
 
 # ============================
 # CONFIG
@@ -9,101 +27,125 @@ from textblob import TextBlob
 BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent  # project root
 DB_FILE = BASE_DIR / "ev_charging.db"
 
-# ============================
-# CONNECT TO DATABASE
-# ============================
-conn = sqlite3.connect(DB_FILE)
-cursor = conn.cursor()
-
-print(f"Connected to database at {DB_FILE}")
-
-# ============================
-# ADD SENTIMENT COLUMNS IF NEEDED
-# ============================
-def add_column_if_not_exists(table: str, column: str, col_type: str):
-    cursor.execute(f"PRAGMA table_info({table})")
-    existing_cols = [info[1] for info in cursor.fetchall()]
-    if column not in existing_cols:
-        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {col_type}")
-        print(f"✅ Added column '{column}' to '{table}' table.")
-    else:
-        print(f"⚠️ Column '{column}' already exists in '{table}' table.")
-
-add_column_if_not_exists("user_reviews", "sentiment_score", "REAL")
-add_column_if_not_exists("charging_stations", "avg_sentiment", "REAL")
-add_column_if_not_exists("charging_stations", "num_reviews", "INTEGER")
-conn.commit()
-
-# ============================
-# LOAD USER REVIEWS
-# ============================
-reviews_df = pd.read_sql_query("SELECT * FROM user_reviews", conn)
-
-if reviews_df.empty:
-    print("⚠️ No reviews found in the database.")
-    conn.close()
-    exit()
+REVIEWS_QUERY = """
+SELECT review_id, station_id, feedback, sentiment_score, feedback_hash(feedback)
+FROM user_reviews
+"""
+CHANGED_ONLY = "WHERE feedback_hash IS NULL OR feedback_hash != feedback_hash(feedback)"
+
+# Stations loaded since the last run have no running sum yet; seed it from
+# the scores currently stored, before this run's deltas are applied.
+SEED_AGGREGATES = """
+UPDATE charging_stations SET
+    sentiment_sum = (SELECT TOTAL(r.sentiment_score) FROM user_reviews r WHERE r.station_id = charging_stations.station_id),
+    num_reviews = (SELECT COUNT(r.sentiment_score) FROM user_reviews r WHERE r.station_id = charging_stations.station_id)
+WHERE sentiment_sum IS NULL
+"""
+
+UPDATE_REVIEW = """
+UPDATE user_reviews SET sentiment_score = ?, feedback_hash = ?
+WHERE review_id = ? AND station_id = ?
+"""
+
+# Right-hand sides see the row before the update.
+APPLY_DELTA = """
+UPDATE charging_stations SET
+    sentiment_sum = sentiment_sum + :sum,
+    num_reviews = num_reviews + :count,
+    avg_sentiment = CASE WHEN num_reviews + :count > 0
+                         THEN (sentiment_sum + :sum) / (num_reviews + :count) END
+WHERE station_id = :station_id
+"""
+
+
+def feedback_hash(text) -> str:
+    return text_hash(text)
 
-print(f"Found {len(reviews_df)} user reviews.")
 
-# ============================
-# COMPUTE SENTIMENT USING TEXTBLOB
-# ============================
 def get_sentiment_score(text):
-    try:
-        if not isinstance(text, str) or not text.strip():
-            return None
-        polarity = TextBlob(text).sentiment.polarity  # -1 to +1
-        return round(polarity, 4)
-    except Exception as e:
-        print(f"Error analyzing: {text[:30]}... ({e})")
-        return None
-
-print("Computing sentiment scores...")
-reviews_df["sentiment_score"] = reviews_df["feedback"].apply(get_sentiment_score)
-
-# ============================
-# UPDATE DATABASE WITH SCORES
-# ============================
-for _, row in reviews_df.iterrows():
-    cursor.execute(
-        "UPDATE user_reviews SET sentiment_score = ? WHERE review_id = ?",
-        (row["sentiment_score"], row["review_id"])
-    )
-
-conn.commit()
-print("✅ Updated sentiment scores in user_reviews table.")
-
-# ============================
-# COMPUTE AVERAGE SENTIMENT PER STATION
-# ============================
-avg_df = (
-    reviews_df.groupby("station_id")["sentiment_score"]
-    .agg(["mean", "count"])
-    .reset_index()
-    .rename(columns={"mean": "avg_sentiment", "count": "num_reviews"})
-)
-
-for _, row in avg_df.iterrows():
-    cursor.execute(
-        """
-        UPDATE charging_stations
-        SET avg_sentiment = ?, num_reviews = ?
-        WHERE station_id = ?
-        """,
-        (row["avg_sentiment"], row["num_reviews"], row["station_id"])
-    )
-
-# ============================
-# SHOW FIRST 10 ROWS OF CHARGING STATIONS
-# ============================
-stations_df = pd.read_sql_query("SELECT * FROM charging_stations", conn)
+    return get_backend("textblob").score(text)
+
+
+def score_texts(texts: list, workers: int = None, chunksize: int = 256) -> list:
+    """Scores in input order from the configured backend; small batches skip the pool."""
+    cache = build_cache() if settings.sentiment_cache_file else None
+    with SentimentService(workers=workers, chunksize=chunksize, cache=cache) as service:
+        return service.score(texts)
+
+
+def pending_reviews(conn: sqlite3.Connection, full: bool = False) -> list[tuple]:
+    """(review_id, station_id, feedback, old_score, new_hash) for reviews to (re)score."""
+    conn.create_function("feedback_hash", 1, feedback_hash, deterministic=True)
+    return conn.execute(REVIEWS_QUERY if full else REVIEWS_QUERY + CHANGED_ONLY).fetchall()
+
+
+def station_deltas(pending: list[tuple], scores: list) -> list[dict]:
+    sums, counts = defaultdict(float), defaultdict(int)
+    for (_, station_id, _, old_score, _), new_score in zip(pending, scores):
+        if old_score is not None:
+            sums[station_id] -= old_score
+            counts[station_id] -= 1
+        if new_score is not None:
+            sums[station_id] += new_score
+            counts[station_id] += 1
+    return [
+        {"station_id": station_id, "sum": sums[station_id], "count": counts[station_id]}
+        for station_id in sums
+        if counts[station_id] or sums[station_id]
+    ]
+
+
+def update_sentiment(conn: sqlite3.Connection, full: bool = False, workers: int = None) -> tuple[int, int]:
+    """Score new or changed reviews and fold them into station averages.
+
+    Returns (reviews scored, stations updated). `full` rescores every review and
+    rebuilds the running sums, which also clears accumulated float drift.
+    """
+    pending = pending_reviews(conn, full)
+    scores = score_texts([row[2] for row in pending], workers)
+    deltas = station_deltas(pending, scores)
+
+    with conn:
+        if full:
+            conn.execute("UPDATE charging_stations SET sentiment_sum = NULL")
+        conn.execute(SEED_AGGREGATES)
+        conn.executemany(UPDATE_REVIEW, [
+            (score, new_hash, review_id, station_id)
+            for (review_id, station_id, _, _, new_hash), score in zip(pending, scores)
+        ])
+        conn.executemany(APPLY_DELTA, deltas)
+        if full:
+            conn.execute("""
+                UPDATE charging_stations
+                SET avg_sentiment = CASE WHEN num_reviews > 0 THEN sentiment_sum / num_reviews END
+            """)
+        refresh_station_features(conn, full=full)
+    return len(pending), len(deltas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", type=Path, default=DB_FILE)
+    parser.add_argument("--full", action="store_true", help="rescore every review, not just new or changed ones")
+    parser.add_argument("--workers", type=int, default=None, help="scoring processes (default: CPU count)")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="sentiment backend (default: SENTIMENT_BACKEND); use with --full when switching")
+    args = parser.parse_args()
+    if args.backend:
+        settings.sentiment_backend = args.backend
+
+    conn = sqlite3.connect(args.db)
+    print(f"Connected to database at {args.db}")
+    migrate(conn)
+
+    reviewed, stations = update_sentiment(conn, full=args.full, workers=args.workers)
+    conn.close()
 
-print("\n🔹 First 10 rows of charging_stations table:")
-print(stations_df.head(10))
+    if not reviewed:
+        print("✅ Sentiment scores are up to date.")
+    else:
+        print(f"✅ Scored {reviewed} new or changed reviews and updated {stations} stations.")
 
-conn.commit()
-conn.close()
 
-print("\n🎉 Sentiment analysis complete!")
-print(f"Updated {len(avg_df)} stations with average sentiment scores.")
+if __name__ == "__main__":
+    main()
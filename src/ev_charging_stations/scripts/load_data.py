@@ -1,6 +1,39 @@
+"""
+Load the station and review CSVs into SQLite.
+
+Rows are streamed in fixed-size chunks with explicit dtypes and upserted
+(`INSERT ... ON CONFLICT`) into shadow tables, one transaction per chunk. The
+shadow tables then replace the live ones in a single transaction, so memory
+stays flat whatever the file size and readers (WAL mode) keep seeing the old
+data until the swap commits.
+
+With --shards (default: the `shard_dir` setting) the geohash shards of the
+new catalogue are published as well, so search workers can open them at once.
+
+    python -m src.ev_charging_stations.scripts.load_data [--chunk-size N] [--shards DIR]
+"""
+
+import argparse
 import sqlite3
 import pandas as pd
 from pathlib import Path
+from typing import Callable, Iterator, Optional
+from src.ev_charging_stations.services.migrations import (
+    REVIEWS_DDL,
+    STATIONS_DDL,
+    create_feature_triggers,
+    create_name_triggers,
+    create_review_indexes,
+    create_rtree_triggers,
+    create_station_indexes,
+    fill_rtree,
+    fill_station_names,
+    migrate,
+)
+from src.ev_charging_stations.services.opening_hours import parse_hours
+from src.ev_charging_stations.services.shards import publish_shard_set
+from src.ev_charging_stations.services.station_features import refresh_station_features
+from src.ev_charging_stations.utils.config import settings
 
 # ============================
 # CONFIG
@@ -12,82 +45,213 @@ DB_FILE = BASE_DIR / "ev_charging.db"
 CHARGING_CSV = DATA_DIR / "ev_stations.csv"
 REVIEWS_CSV = DATA_DIR / "user_reviews.csv"
 
-# ============================
-# LOAD CSV FILES
-# ============================
-charging_df = pd.read_csv(CHARGING_CSV)
-reviews_df = pd.read_csv(REVIEWS_CSV)
+CHUNK_SIZE = 50_000
 
-# ============================
-# CLEAN COLUMN NAMES
-# ============================
-# Convert spaces to underscores, lowercase, and strip
-charging_df.columns = [c.strip().replace(" ", "_").lower() for c in charging_df.columns]
-reviews_df.columns = [c.strip().replace(" ", "_").lower() for c in reviews_df.columns]
+STATION_DTYPES = {
+    "station_id": "Int64",
+    "provider": "string",
+    "location_name": "string",
+    "latitude": "float64",
+    "longitude": "float64",
+    "charging_speed": "string",
+    "available_chargers": "Int64",
+    "charging_types": "string",
+    "accessibility": "string",
+    "operating_hours": "string",
+    "avg_sentiment": "float64",
+    "num_reviews": "Int64",
+}
 
-# ============================
-# CONNECT TO SQLITE
-# ============================
-conn = sqlite3.connect(DB_FILE)
-cursor = conn.cursor()
+REVIEW_DTYPES = {
+    "review_id": "Int64",
+    "user_id": "string",
+    "station_id": "Int64",
+    "preferred_charging_speed": "string",
+    "preferred_charging_type": "string",
+    "feedback": "string",
+    "sentiment_score": "float64",
+    "created_at": "string",
+}
 
-# ============================
-# CREATE TABLES
-# ============================
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS charging_stations (
-    station_id INTEGER PRIMARY KEY,
-    provider TEXT,
-    location_name TEXT,
-    latitude REAL,
-    longitude REAL,
-    charging_speed TEXT,
-    available_chargers INTEGER,
-    charging_types TEXT,
-    accessibility TEXT,
-    operating_hours TEXT,
-    avg_sentiment REAL
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS user_reviews (
-    review_id INTEGER PRIMARY KEY,
-    user_id TEXT,
-    station_id INTEGER,
-    preferred_charging_speed TEXT,
-    preferred_charging_type TEXT,
-    feedback TEXT,
-    sentiment REAL,
-    FOREIGN KEY(station_id) REFERENCES charging_stations(station_id)
-)
-""")
+# Scores computed for the live rows survive a reload, with the running sum
+# they were computed from (unless the file brings its own review counts, in
+# which case compute_sentiment reseeds it); compute_sentiment rescores
+# reviews whose feedback changed. A review keeps the timestamp it was first
+# stored with.
+CARRY_OVER_STATIONS = """
+UPDATE charging_stations__shadow SET
+    avg_sentiment = COALESCE(charging_stations__shadow.avg_sentiment, live.avg_sentiment),
+    num_reviews = COALESCE(charging_stations__shadow.num_reviews, live.num_reviews),
+    sentiment_sum = COALESCE(
+        charging_stations__shadow.sentiment_sum,
+        CASE WHEN charging_stations__shadow.num_reviews IS NULL THEN live.sentiment_sum END
+    )
+FROM charging_stations AS live
+WHERE live.station_id = charging_stations__shadow.station_id
+"""
 
-conn.commit()
+CARRY_OVER_REVIEWS = """
+UPDATE user_reviews__shadow SET
+    sentiment_score = COALESCE(user_reviews__shadow.sentiment_score, live.sentiment_score),
+    feedback_hash = live.feedback_hash,
+    created_at = COALESCE(live.created_at, user_reviews__shadow.created_at)
+FROM user_reviews AS live
+WHERE live.review_id = user_reviews__shadow.review_id AND live.station_id = user_reviews__shadow.station_id
+"""
+
+
+def clean_column(name: str) -> str:
+    # Convert spaces to underscores, lowercase, and strip
+    return name.strip().replace(" ", "_").lower()
+
+
+def read_chunks(path: Path, dtypes: dict, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Known columns of `path`, cleaned and typed, `chunk_size` rows at a time."""
+    header = pd.read_csv(path, nrows=0).columns
+    raw = {name: clean_column(name) for name in header if clean_column(name) in dtypes}
+    reader = pd.read_csv(
+        path,
+        usecols=list(raw),
+        dtype={name: dtypes[column] for name, column in raw.items()},
+        chunksize=chunk_size,
+    )
+    for chunk in reader:
+        yield chunk.rename(columns=raw)
+
+
+def upsert_sql(table: str, columns: list[str], key: tuple[str, ...]) -> str:
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c not in key)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+    )
+
+
+def ingest(
+    conn: sqlite3.Connection,
+    path: Path,
+    table: str,
+    dtypes: dict,
+    key: tuple[str, ...],
+    chunk_size: int = CHUNK_SIZE,
+    on_chunk: Optional[Callable[[pd.DataFrame], None]] = None,
+) -> int:
+    """Upsert every row of `path` into `table`, one transaction per chunk."""
+    rows = 0
+    for chunk in read_chunks(path, dtypes, chunk_size):
+        chunk = chunk.dropna(subset=list(key))
+        values = chunk.astype(object).where(chunk.notna(), None)
+        with conn:
+            conn.executemany(upsert_sql(table, list(chunk.columns), key), values.itertuples(index=False, name=None))
+        rows += len(chunk)
+        if on_chunk is not None:
+            on_chunk(chunk)
+    return rows
+
+
+def swap_in_shadow_tables(conn: sqlite3.Connection):
+    """
+    Replace the live tables with the shadows, with indexes, R*Tree, name
+    index and station features, atomically.
+    """
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(CARRY_OVER_STATIONS)
+            conn.execute(CARRY_OVER_REVIEWS)
+            conn.execute("DROP TABLE user_reviews")
+            conn.execute("DROP TABLE charging_stations")
+            conn.execute("ALTER TABLE charging_stations__shadow RENAME TO charging_stations")
+            conn.execute("ALTER TABLE user_reviews__shadow RENAME TO user_reviews")
+            create_station_indexes(conn)
+            create_review_indexes(conn)
+            conn.execute("DELETE FROM station_rtree")
+            fill_rtree(conn)
+            create_rtree_triggers(conn)
+            fill_station_names(conn)
+            create_name_triggers(conn)
+            create_feature_triggers(conn)
+            refresh_station_features(conn, full=True)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def load_csvs(
+    conn: sqlite3.Connection,
+    stations_csv: Path = CHARGING_CSV,
+    reviews_csv: Path = REVIEWS_CSV,
+    chunk_size: int = CHUNK_SIZE,
+    on_station_chunk: Optional[Callable[[pd.DataFrame], None]] = None,
+) -> tuple[int, int]:
+    """Stream both CSVs into shadow tables and swap them in. Returns row counts."""
+    migrate(conn)
+    for table, ddl in (("charging_stations", STATIONS_DDL), ("user_reviews", REVIEWS_DDL)):
+        conn.execute(f"DROP TABLE IF EXISTS {table}__shadow")
+        conn.execute(ddl.format(name=f"{table}__shadow"))
+    conn.commit()
+
+    stations = ingest(conn, stations_csv, "charging_stations__shadow", STATION_DTYPES, ("station_id",),
+                      chunk_size, on_station_chunk)
+    reviews = ingest(conn, reviews_csv, "user_reviews__shadow", REVIEW_DTYPES, ("review_id", "station_id"),
+                     chunk_size)
+    swap_in_shadow_tables(conn)
+    return stations, reviews
 
-# ============================
-# INSERT DATA INTO TABLES
-# ============================
-charging_df.to_sql("charging_stations", conn, if_exists="replace", index=False)
-reviews_df.to_sql("user_reviews", conn, if_exists="replace", index=False)
 
 # ============================
 # FIND UNIQUE VALUES FOR SELECTED COLUMNS
 # ============================
-def print_unique_values(df, columns, title):
+def collect_unique_values(columns: list[str]) -> tuple[dict, Callable[[pd.DataFrame], None]]:
+    uniques = {col: {} for col in columns}
+
+    def update(chunk: pd.DataFrame):
+        for col in columns:
+            if col in chunk.columns:
+                uniques[col].update(dict.fromkeys(chunk[col].dropna().unique().tolist()))
+
+    return uniques, update
+
+
+def print_unique_values(uniques: dict, title: str):
     print(f"\n=== Unique values for {title} ===")
-    for col in columns:
-        if col in df.columns:
-            uniques = df[col].dropna().unique().tolist()
-            print(f"{col}: {uniques}")
-        else:
-            print(f"{col}: [Column not found]")
+    for col, values in uniques.items():
+        print(f"{col}: {list(values) if values else '[Column not found]'}")
 
-charging_columns = ["provider", "location_name", "charging_speed", "charging_types", "accessibility"]
-print_unique_values(charging_df, charging_columns, "Charging Stations")
 
-# ============================
-# CLOSE CONNECTION
-# ============================
-conn.close()
-print("\n✅ Database created and data inserted at", DB_FILE)
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", type=Path, default=DB_FILE)
+    parser.add_argument("--stations-csv", type=Path, default=CHARGING_CSV)
+    parser.add_argument("--reviews-csv", type=Path, default=REVIEWS_CSV)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--shards", type=Path, default=settings.shard_dir, help="publish geohash shards here")
+    args = parser.parse_args()
+
+    # Location names are left out: they are unique per station.
+    uniques, on_chunk = collect_unique_values(
+        ["provider", "charging_speed", "charging_types", "accessibility", "operating_hours"]
+    )
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode=WAL")
+    try:
+        stations, reviews = load_csvs(conn, args.stations_csv, args.reviews_csv, args.chunk_size, on_chunk)
+    finally:
+        conn.close()
+
+    print_unique_values(uniques, "Charging Stations")
+    unreadable = [hours for hours in uniques["operating_hours"] if parse_hours(hours) is None]
+    if unreadable:
+        print(f"\n⚠️ Operating hours not understood (never matched by open_at): {unreadable}")
+    print(f"\n✅ Loaded {stations} stations and {reviews} reviews into {args.db}")
+    if args.shards:
+        print(f"✅ Published shards to {publish_shard_set(args.db, args.shards)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Live charger availability on top of the static catalogue.
+
+`available_chargers` in `charging_stations` is whatever the last CSV load
+said. Status updates (absolute counts or +/- deltas) go into an in-memory
+overlay instead: a per-station dict plus an array aligned with the current
+station index, so the `min_available` filter is one vectorised compare and
+records report the live count. Updates are coalesced per station and
+checkpointed in batches to a sidecar SQLite file, which is reloaded on
+start; the catalogue database is never written, so readers and the index
+snapshot are untouched. Clients subscribed to stations get their changes
+pushed (see the SSE endpoint in `api`).
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from src.ev_charging_stations.services.metrics import registry
+from src.ev_charging_stations.utils.config import settings
+
+updates_applied = registry.counter("ev_availability_updates_total", "Availability updates applied to the overlay.")
+rows_checkpointed = registry.counter("ev_availability_checkpointed_total", "Station rows written by checkpoints.")
+
+AVAILABILITY_DDL = """
+CREATE TABLE IF NOT EXISTS station_availability (
+    station_id INTEGER PRIMARY KEY,
+    available INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+UPSERT_AVAILABILITY = """
+INSERT INTO station_availability (station_id, available, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(station_id) DO UPDATE SET available = excluded.available, updated_at = excluded.updated_at
+"""
+
+
+def availability_file(db_file: Optional[Path] = None) -> Path:
+    """Sidecar checkpoint file: `availability_db_file`, or `<db>-availability.db` next to the catalogue."""
+    if settings.availability_db_file:
+        return Path(settings.availability_db_file)
+    db_file = Path(db_file or settings.db_file)
+    return db_file.with_name(f"{db_file.stem}-availability{db_file.suffix}")
+
+
+def min_available(filters: dict) -> Optional[int]:
+    """Least number of free chargers the filters ask for, or None."""
+    if filters.get("min_available"):
+        return int(filters["min_available"])
+    return 1 if filters.get("available_only") else None
+
+
+class Subscription:
+    """
+    Live counts for a set of stations, for one client. Changes are merged
+    until the client reads them, so a slow client gets the latest count per
+    station rather than an ever-growing queue.
+    """
+
+    def __init__(self, station_ids: Iterable[int]):
+        self.station_ids = frozenset(station_ids)
+        self._loop = asyncio.get_running_loop()
+        self._pending: dict = {}
+        self._ready = asyncio.Event()
+
+    def _push(self, changes: dict):
+        self._pending.update(changes)
+        self._ready.set()
+
+    def notify(self, changes: dict):
+        """Safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._push, changes)
+
+    async def changes(self, timeout: Optional[float] = None) -> dict:
+        """{station_id: available} since the last call; empty if `timeout` passes first."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        changes, self._pending = self._pending, {}
+        return changes
+
+
+class AvailabilityOverlay:
+    """
+    Live available-charger counts keyed by station_id. `apply` takes a batch
+    of updates; `live(index)` gives the counts aligned with an index's
+    positions (NaN where unknown), for every index in use (the full index,
+    or the shard set and its shards). A background thread checkpoints
+    changed stations every `checkpoint_seconds`.
+    """
+
+    def __init__(self, path: Path, checkpoint_seconds: Optional[float] = None):
+        self.path = Path(path)
+        self.checkpoint_seconds = checkpoint_seconds or settings.availability_checkpoint_seconds
+        self.version = 0
+        self._values: dict = {}
+        self._pending: dict = {}
+        self._subscribers: dict = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # index -> (live array, sorted station ids, their positions); shards each have their own
+        self._aligned = weakref.WeakKeyDictionary()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self.path.exists():
+            conn = sqlite3.connect(self.path)
+            try:
+                conn.execute(AVAILABILITY_DDL)
+                self._values = dict(conn.execute("SELECT station_id, available FROM station_availability"))
+            finally:
+                conn.close()
+
+    def _align(self, index):
+        """Live array for `index`: its stored counts with every overlay value applied. Lock held."""
+        live = np.array(index.stored_availability(), dtype=np.float64)
+        ids = index.station_ids(np.arange(index.size))
+        order = np.argsort(ids, kind="stable")
+        aligned = self._aligned[index] = (live, ids[order], order)
+        if self._values:
+            self._write(aligned, self._values)
+        return aligned
+
+    @staticmethod
+    def _positions(aligned, station_ids: np.ndarray) -> np.ndarray:
+        """Positions of `station_ids` in an aligned index, -1 for unknown ids."""
+        _, sorted_ids, order = aligned
+        if not len(sorted_ids):
+            return np.full(len(station_ids), -1, dtype=np.int64)
+        at = np.minimum(np.searchsorted(sorted_ids, station_ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[at] == station_ids, order[at], -1)
+
+    def _write(self, aligned, values: dict):
+        positions = self._positions(aligned, np.fromiter(values, dtype=np.int64, count=len(values)))
+        counts = np.fromiter(values.values(), dtype=np.float64, count=len(values))
+        aligned[0][positions[positions >= 0]] = counts[positions >= 0]
+
+    def _aligned_to(self, index):
+        aligned = self._aligned.get(index)
+        return self._align(index) if aligned is None else aligned
+
+    def live(self, index) -> np.ndarray:
+        """Available chargers per position of `index`; NaN where neither the catalogue nor a live update says."""
+        with self._lock:
+            return self._aligned_to(index)[0]
+
+    def counts(self, index, station_ids: list) -> dict:
+        """{station_id: available chargers} for the known stations among `station_ids`."""
+        with self._lock:
+            aligned = self._aligned_to(index)
+            live = aligned[0]
+            positions = self._positions(aligned, np.asarray(station_ids, dtype=np.int64))
+        return {
+            station_id: None if np.isnan(live[position]) else int(live[position])
+            for station_id, position in zip(station_ids, positions.tolist()) if position >= 0
+        }
+
+    def apply(self, index, updates: list) -> tuple[dict, list]:
+        """
+        Apply (station_id, available, delta) updates in order: `available`
+        sets the count, otherwise `delta` moves it; counts stay >= 0.
+        Returns ({station_id: new count}, unknown station_ids).
+        """
+        now = time.time()
+        changed, unknown = {}, []
+        with self._lock:
+            primary = self._aligned_to(index)
+            live = primary[0]
+            positions = self._positions(primary, np.fromiter((u[0] for u in updates), dtype=np.int64, count=len(updates)))
+            for (station_id, available, delta), position in zip(updates, positions.tolist()):
+                if position < 0:
+                    unknown.append(station_id)
+                    continue
+                if available is None:
+                    current = live[position]
+                    available = (0 if np.isnan(current) else int(current)) + delta
+                available = max(int(available), 0)
+                live[position] = available
+                self._values[station_id] = available
+                self._pending[station_id] = (available, now)
+                changed[station_id] = available
+            if changed:
+                self.version += 1
+                for aligned in list(self._aligned.values()):
+                    if aligned is not primary:
+                        self._write(aligned, changed)
+            notify = {}
+            for station_id, available in changed.items():
+                for subscription in self._subscribers.get(station_id, ()):
+                    notify.setdefault(subscription, {})[station_id] = available
+        for subscription, changes in notify.items():
+            subscription.notify(changes)
+        updates_applied.inc(len(changed))
+        if changed:
+            self._start_checkpoints()
+        return changed, unknown
+
+    def subscribe(self, station_ids: Iterable[int]) -> Subscription:
+        """Push future changes of `station_ids` to a new subscription (call from the event loop)."""
+        subscription = Subscription(station_ids)
+        with self._lock:
+            for station_id in subscription.station_ids:
+                self._subscribers.setdefault(station_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for station_id in subscription.station_ids:
+                subscribers = self._subscribers.get(station_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[station_id]
+
+    def checkpoint(self) -> int:
+        """Write every station changed since the last checkpoint in one transaction; returns rows written."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                if self._conn is None:
+                    self._conn = sqlite3.connect(self.path, timeout=settings.db_timeout_seconds, check_same_thread=False)
+                    self._conn.execute("PRAGMA journal_mode=WAL")
+                    self._conn.execute("PRAGMA synchronous=NORMAL")
+                    self._conn.execute(AVAILABILITY_DDL)
+                with self._conn:
+                    self._conn.executemany(
+                        UPSERT_AVAILABILITY, [(station_id, *row) for station_id, row in pending.items()]
+                    )
+            except sqlite3.Error:
+                with self._lock:
+                    # keep anything newer that arrived meanwhile
+                    self._pending = {**pending, **self._pending}
+                raise
+            rows_checkpointed.inc(len(pending))
+            return len(pending)
+
+    def _start_checkpoints(self):
+        if self._thread is not None:
+            return
+        with self._write_lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="availability-checkpoint", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.checkpoint_seconds):
+            try:
+                self.checkpoint()
+            except sqlite3.Error as e:
+                # pending updates are kept; the next round retries
+                print(f"⚠️ Availability checkpoint failed: {e}")
+
+    def close(self):
+        """Stop the checkpoint thread and write what is left."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.checkpoint()
+        with self._write_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_overlay: Optional[AvailabilityOverlay] = None
+_overlay_lock = threading.Lock()
+
+
+def get_availability() -> AvailabilityOverlay:
+    """Shared overlay for `settings.db_file`, loaded from its checkpoint file on first use."""
+    global _overlay
+    if _overlay is None:
+        with _overlay_lock:
+            if _overlay is None:
+                _overlay = AvailabilityOverlay(availability_file())
+    return _overlay
+
+
+def close_availability():
+    global _overlay
+    with _overlay_lock:
+        if _overlay is not None:
+            _overlay.close()
+            _overlay = None
@@ -1,14 +1,22 @@
-import sqlite3
-from pathlib import Path
-from typing import List
+import asyncio
+from functools import lru_cache
+from typing import Iterator, List, Optional
 from src.ev_charging_stations.models.query_models import StationOutput
+from src.ev_charging_stations.services.db_pool import get_pool
+from src.ev_charging_stations.services.name_search import name_matches
+from src.ev_charging_stations.services.station_features import review_scores
+from src.ev_charging_stations.services.shards import get_search_index
+from src.ev_charging_stations.services.station_index import FILTER_COLUMNS, StationIndex, get_station_index
+from src.ev_charging_stations.services.station_store import StationStore
+from src.ev_charging_stations.utils.config import settings
 import math
-
-# Path to your DB (adjust if needed)
-DB_FILE = Path(__file__).resolve().parent.parent.parent.parent / "ev_charging.db"
+import numpy as np
 
 def haversine(lat1, lon1, lat2, lon2):
-    """Calculate distance in km between two lat/lon points"""
+    """
+    Calculate distance in km between two lat/lon points.
+    For many points at once use `station_store.haversine_distances`.
+    """
     R = 6371  # Earth radius in km
     phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
@@ -16,42 +24,258 @@ def haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
     return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1-a))
 
-def find_stations(filters: dict, initial_radius=20, max_radius=600, step=30) -> List[StationOutput]:
+@lru_cache(maxsize=None)
+def station_filter_query(filter_keys: tuple[str, ...]) -> str:
+    """
+    SQL for one combination of active filters. Building the text once per
+    combination keeps it byte-identical, so each pooled connection reuses its
+    prepared statement instead of re-parsing.
+    """
+    query = "SELECT * FROM charging_stations WHERE 1=1"
+    for key in filter_keys:
+        query += f" AND {FILTER_COLUMNS[key]} = ?"
+    # Index lookups return rows in index order; keep catalogue order.
+    return query + " ORDER BY station_id"
+
+@lru_cache(maxsize=None)
+def station_bbox_query(filter_keys: tuple[str, ...]) -> str:
+    """SQL for stations inside a lat/lon box, resolved through the R*Tree."""
+    query = (
+        "SELECT s.* FROM station_rtree r JOIN charging_stations s ON s.station_id = r.station_id"
+        " WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lon >= ? AND r.max_lon <= ?"
+    )
+    for key in filter_keys:
+        query += f" AND s.{FILTER_COLUMNS[key]} = ?"
+    return query + " ORDER BY s.station_id"
+
+def rank_corridor_positions(filters: dict, index: Optional[StationIndex] = None
+                            ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Corridor mode: stations within `filters["corridor_km"]` (default
+    `settings.corridor_buffer_km`) of `filters["route"]`, in route order, as
+    (positions, km off the route).
+    """
+    index = index or get_search_index()
+    positions, off_route, _ = index.corridor(filters, filters.get("corridor_km") or settings.corridor_buffer_km)
+    return positions, off_route
+
+def match_station_positions(filters: dict, initial_radius=20, max_radius=600, step=30,
+                            index: Optional[StationIndex] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    The stations `rank_station_positions` returns, before ranking: their
+    positions (catalogue order, or route order with a `route`) and the sort
+    keys that rank them, lowest first with ties kept in that order. Keys are
+    None when the positions are already in rank order.
+    """
+    index = index or get_search_index()
+    if filters.get("route"):
+        positions, _ = rank_corridor_positions(filters, index)
+    else:
+        positions = index.search(filters, initial_radius, max_radius, step)
+    if filters.get("sort_by_reviews"):
+        # best review_score first, ties in catalogue order (see station_features)
+        return positions, index.features.rank[positions]
+    if not filters.get("route"):
+        named = name_matches(filters)
+        if named is not None:
+            return positions, -named.score_of(index.station_ids(positions))
+    return positions, None
+
+def rank_station_positions(filters: dict, initial_radius=20, max_radius=600, step=30,
+                           index: Optional[StationIndex] = None) -> np.ndarray:
+    """
+    Catalogue positions of the stations `find_stations` returns, in the same
+    order, without building any output models. With a `route` the search is a
+    corridor along it instead of rings around a point. With a `provider` or
+    `name_query`, the best name matches come first.
+    """
+    index = index or get_search_index()
+    positions, keys = match_station_positions(filters, initial_radius, max_radius, step, index)
+    if keys is None:
+        return positions
+    if filters.get("sort_by_reviews"):
+        return index.features.best_first(positions)
+    return positions[np.argsort(keys, kind="stable")]
+
+def ranked_chunks(positions: np.ndarray, keys: Optional[np.ndarray], start: int, stop: int,
+                  size: int) -> Iterator[np.ndarray]:
+    """
+    `positions[start:stop]` in rank order (see `match_station_positions`),
+    `size` at a time. The first chunk is picked with a partial sort, one
+    linear pass, and only then is the rest of the page sorted.
+    """
+    stop = min(stop, len(positions))
+    if start >= stop:
+        return
+    if keys is None:
+        for i in range(start, stop, size):
+            yield positions[i:min(i + size, stop)]
+        return
+    rest = np.arange(len(positions))
+    if start:
+        _, rest = _take_smallest(keys, rest, start)
+    first, rest = _take_smallest(keys, rest, min(size, stop - start))
+    yield positions[first]
+    rest = rest[np.argsort(keys[rest], kind="stable")][:stop - start - len(first)]
+    for i in range(0, len(rest), size):
+        yield positions[rest[i:i + size]]
+
+def _take_smallest(keys: np.ndarray, rest: np.ndarray, n: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The `n` entries of `rest` with the lowest keys, sorted (ties in `rest`
+    order), and the others. Entries with equal keys stay in `rest` order.
+    """
+    if n >= len(rest):
+        return rest[np.argsort(keys[rest], kind="stable")], rest[:0]
+    values = keys[rest]
+    threshold = np.partition(values, n - 1)[n - 1]
+    below, at = rest[values < threshold], rest[values == threshold]
+    need = n - len(below)
+    taken = np.concatenate([below[np.argsort(keys[below], kind="stable")], at[:need]])
+    return taken, np.concatenate([at[need:], rest[values > threshold]])
+
+# Ranked mode with sort_by_reviews: score = distance * (1 - REVIEW_WEIGHT * quality),
+# quality in [0, 1] from the station's smoothed, recency-weighted review score
+# and, when the query names a charging speed or type, how many of its reviewers
+# prefer it (see StationFeatures.quality).
+REVIEW_WEIGHT = 0.5
+
+def combined_score(distances: np.ndarray, quality: np.ndarray) -> np.ndarray:
+    """Lower is better: a well-reviewed station counts as up to REVIEW_WEIGHT closer."""
+    return distances * (1 - REVIEW_WEIGHT * quality)
+
+def rank_nearest_positions(filters: dict, k: int = 10, max_radius=600,
+                           index: Optional[StationIndex] = None) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Ranked mode: the k best stations matching `filters` within `max_radius` km,
+    as (positions, distances in km). Closest first, or by `combined_score`
+    when `sort_by_reviews` is set; with a `provider` or `name_query` that
+    score is divided by the name match score, so a weaker match counts as
+    farther. Without a location there are no distances and the first k
+    matches (by reviews or name if asked) are returned. With a `route`, the
+    first k stations along it (best-reviewed first if asked), with their
+    distance off the route.
+    """
+    index = index or get_search_index()
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), None
+    if filters.get("route"):
+        positions, off_route = rank_corridor_positions(filters, index)
+        if filters.get("sort_by_reviews"):
+            order = np.argsort(index.features.rank[positions], kind="stable")
+            positions, off_route = positions[order], off_route[order]
+        return positions[:k], off_route[:k]
+    if not (filters.get("latitude") and filters.get("longitude")):
+        return rank_station_positions(filters, index=index)[:k], None
+    reviews, named = filters.get("sort_by_reviews"), name_matches(filters)
+    if not reviews and named is None:
+        return index.nearest(filters, k, max_radius)
+
+    def scored(positions, distances):
+        scores = combined_score(distances, index.features.quality(positions, filters)) if reviews else distances
+        return scores if named is None else scores / named.score_of(index.station_ids(positions))
+
+    # Name scores are at most 1, so every unseen station (at least as far as
+    # the last candidate) scores at least last_distance * (1 - REVIEW_WEIGHT)
+    # with reviews, last_distance without; widen until the k-th best score
+    # cannot be beaten, or every candidate has been fetched.
+    floor = 1 - REVIEW_WEIGHT if reviews else 1.0
+    candidates = index.size if named is None else min(index.size, len(named.station_ids))
+    fetch = min(k, max(candidates, 1))
+    while True:
+        positions, distances = index.nearest(filters, fetch, max_radius)
+        scores = scored(positions, distances)
+        order = np.argsort(scores, kind="stable")[:k]
+        if len(positions) < fetch or fetch >= candidates or scores[order[-1]] <= distances[-1] * floor:
+            return positions[order], distances[order]
+        fetch = min(fetch * 4, candidates)
+
+def find_nearest_stations(filters: dict, k: int = 10, max_radius=600,
+                          index: Optional[StationIndex] = None) -> List[StationOutput]:
+    """The k nearest (or best-scored) matching stations with `distance_km` set."""
+    index = index or get_search_index()
+    return index.to_outputs(*rank_nearest_positions(filters, k, max_radius, index))
+
+def find_stations_along_route(route: List[tuple[float, float]], buffer_km: Optional[float] = None,
+                              filters: dict = None, index: Optional[StationIndex] = None) -> List[StationOutput]:
+    """
+    Stations matching `filters` within `buffer_km` of the polyline through
+    `route` ((lat, lon) stops in travel order), in order along it, each with
+    its distance off the route as `distance_km`.
+    """
+    index = index or get_search_index()
+    filters = {**(filters or {}), "route": route, "corridor_km": buffer_km}
+    return index.to_outputs(*rank_corridor_positions(filters, index))
+
+def find_stations(filters: dict, initial_radius=20, max_radius=600, step=30,
+                  index: Optional[StationIndex] = None) -> List[StationOutput]:
     """
     Find stations matching filters. If no results, expand search radius incrementally.
+
+    Served from the in-memory station index (pass `index` to pin a snapshot);
+    see `find_stations_scan` for the equivalent table-scan implementation.
     """
+    index = index or get_search_index()
+    return index.to_outputs(rank_station_positions(filters, initial_radius, max_radius, step, index))
 
-    DB_FILE = Path(__file__).resolve().parent.parent.parent.parent / "ev_charging.db"
+async def find_stations_async(filters: dict, initial_radius=20, max_radius=600, step=30) -> List[StationOutput]:
+    """`find_stations` on a worker thread, for use from async handlers."""
+    return await asyncio.to_thread(find_stations, filters, initial_radius, max_radius, step)
 
-    def haversine(lat1, lon1, lat2, lon2):
-        R = 6371
-        phi1, phi2 = math.radians(lat1), math.radians(lat2)
-        dphi = math.radians(lat2 - lat1)
-        dlambda = math.radians(lon2 - lon1)
-        a = math.sin(dphi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda/2)**2
-        return 2 * R * math.atan2(math.sqrt(a), math.sqrt(1-a))
+def find_stations_in_radius(filters: dict, latitude: float, longitude: float, radius_km: float) -> List[StationOutput]:
+    """
+    Stations within `radius_km` straight from SQLite, without the in-memory
+    index: the R*Tree narrows to a bounding box, then haversine is exact.
+    """
+    dlat = radius_km / 111.195
+    min_lat, max_lat = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 89.9:
+        min_lon, max_lon = -180.0, 180.0
+    else:
+        dlon = dlat / math.cos(math.radians(widest))
+        min_lon, max_lon = longitude - dlon, longitude + dlon
+        if min_lon < -180 or max_lon > 180:  # box crosses the antimeridian
+            min_lon, max_lon = -180.0, 180.0
 
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    keys = tuple(key for key in FILTER_COLUMNS if filters.get(key))
+    params = [min_lat, max_lat, min_lon, max_lon] + [filters[key] for key in keys]
+    with get_pool().connection() as conn:
+        cursor = conn.execute(station_bbox_query(keys), params)
+        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
 
-    query = "SELECT * FROM charging_stations WHERE 1=1"
-    params = []
+    store = StationStore(rows, columns)
+    distances = store.distances(latitude, longitude)
+    return store.to_outputs(np.flatnonzero(distances <= radius_km))
 
-    if filters.get("charging_speed"):
-        query += " AND charging_speed = ?"
-        params.append(filters["charging_speed"])
+def nearest_stations_many(points: List[tuple[float, float]], k: int = 10, filters: dict = None) -> List[List[StationOutput]]:
+    """
+    The k nearest stations matching `filters` for each (lat, lon) in `points`,
+    closest first. All points are scored against the catalogue in one
+    vectorised (n_points x n_stations) pass, for bulk routing and precompute jobs.
+    """
+    if not points:
+        return []
+    index = get_station_index()
+    mask = index.filter_mask(filters or {})
+    lats, lons = zip(*points)
+    positions, _ = index.store.nearest(lats, lons, k, mask)
+    return [index.to_outputs(row) for row in positions]
 
-    if filters.get("charging_type"):
-        query += " AND charging_types = ?"
-        params.append(filters["charging_type"])
+def find_stations_scan(filters: dict, initial_radius=20, max_radius=600, step=30) -> List[StationOutput]:
+    """
+    Reference implementation of `find_stations`: full table scan with a
+    Python haversine per station and radius step. Kept for benchmarks.
+    """
 
-    if filters.get("accessibility"):
-        query += " AND accessibility = ?"
-        params.append(filters["accessibility"])
+    keys = tuple(key for key in FILTER_COLUMNS if filters.get(key))
+    params = [filters[key] for key in keys]
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    columns = [desc[0] for desc in cursor.description]
+    with get_pool().connection() as conn:
+        cursor = conn.execute(station_filter_query(keys), params)
+        rows = cursor.fetchall()
+        columns = [desc[0] for desc in cursor.description]
 
     stations = [
         StationOutput(
@@ -87,11 +311,9 @@ def find_stations(filters: dict, initial_radius=20, max_radius=600, step=30) ->
                 radius += step  # expand radius
         stations = filtered
     if filters.get("sort_by_reviews"):
-        stations.sort(
-            key=lambda s: ((s.avg_sentiment or 0), (s.num_reviews or 0)),
-            reverse=True
-        )
+        with get_pool().connection() as conn:
+            scores, unreviewed = review_scores(conn)
+        stations.sort(key=lambda s: scores.get(s.station_id, unreviewed), reverse=True)
 
-    conn.close()
     return stations
 
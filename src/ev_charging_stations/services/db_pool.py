@@ -0,0 +1,101 @@
+"""Pooled, read-only SQLite connections for the request path."""
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from src.ev_charging_stations.utils.config import settings
+
+
+def enable_wal(db_file: Path):
+    """
+    Switch the database to WAL journaling so readers never block on a writer.
+    The mode is stored in the file, so this is a one-off write done by the
+    loader and at app startup, never by the read-only pool.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of read-only connections, safe to share between threads.
+    Connections are opened lazily and reused, so each keeps its own cache of
+    prepared statements.
+    """
+
+    def __init__(self, db_file: Optional[Path] = None, size: Optional[int] = None,
+                 mmap_size: Optional[int] = None):
+        self.db_file = Path(db_file or settings.db_file)
+        self.size = size or settings.db_pool_size
+        self.mmap_size = settings.sqlite_mmap_size if mmap_size is None else mmap_size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"{self.db_file.as_uri()}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._connect()
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Shared pool for the configured database."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
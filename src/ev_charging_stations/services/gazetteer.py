@@ -0,0 +1,106 @@
+"""Offline city-name to coordinates lookup."""
+
+import csv
+import difflib
+import re
+import unicodedata
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from src.ev_charging_stations.utils.config import settings
+
+
+def normalize_place(name: str) -> str:
+    """Lowercase, accent-free, punctuation-free form used for lookups."""
+    text = unicodedata.normalize("NFKD", name or "").encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+# Country codes used in the gazetteer file -> names a query may qualify a city with
+COUNTRY_NAMES = {
+    "AE": "United Arab Emirates|UAE", "AR": "Argentina", "AT": "Austria", "AU": "Australia",
+    "BE": "Belgium", "BR": "Brazil", "CA": "Canada", "CD": "Congo|DR Congo|DRC", "CH": "Switzerland",
+    "CI": "Ivory Coast|Cote d'Ivoire", "CL": "Chile", "CN": "China", "CO": "Colombia",
+    "CZ": "Czech Republic|Czechia", "DE": "Germany|Deutschland", "DK": "Denmark", "EC": "Ecuador",
+    "EG": "Egypt", "ES": "Spain", "ET": "Ethiopia", "FI": "Finland", "FR": "France",
+    "GB": "United Kingdom|UK|Great Britain|Britain", "GH": "Ghana", "GR": "Greece", "HK": "Hong Kong",
+    "HU": "Hungary", "ID": "Indonesia", "IE": "Ireland", "IL": "Israel", "IN": "India", "IT": "Italy",
+    "JP": "Japan", "KE": "Kenya", "KR": "South Korea|Korea", "MA": "Morocco", "MU": "Mauritius",
+    "MX": "Mexico", "MY": "Malaysia", "MZ": "Mozambique", "NA": "Namibia", "NG": "Nigeria",
+    "NL": "Netherlands|Holland", "NO": "Norway", "NZ": "New Zealand", "PE": "Peru", "PH": "Philippines",
+    "PL": "Poland", "PT": "Portugal", "PY": "Paraguay", "RO": "Romania", "RU": "Russia", "SE": "Sweden",
+    "SG": "Singapore", "SK": "Slovakia", "TH": "Thailand", "TR": "Turkey|Turkiye", "TW": "Taiwan",
+    "TZ": "Tanzania", "US": "United States|United States of America|USA|America", "UY": "Uruguay",
+    "VE": "Venezuela", "VN": "Vietnam", "ZA": "South Africa", "ZM": "Zambia", "ZW": "Zimbabwe",
+}
+
+
+class Place(NamedTuple):
+    coords: tuple[float, float]
+    qualifiers: frozenset[str]  # normalized country code, country and region names
+
+
+def _names(value: Optional[str]) -> list[str]:
+    return [name for name in (value or "").split("|") if name]
+
+
+class Gazetteer:
+    """
+    Compact table of city names (and aliases) to coordinates with exact,
+    prefix and fuzzy matching. A qualified name ("Portland, Maine") only
+    matches a city in that country or region; anything else is left to the
+    remote geocoder.
+    """
+
+    def __init__(self, entries: dict[str, Place]):
+        self.entries = entries
+        self.names = sorted(entries)
+
+    @classmethod
+    def from_csv(cls, path: Path) -> "Gazetteer":
+        entries = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                country = row["country"]
+                qualifiers = [country, *_names(COUNTRY_NAMES.get(country)), *_names(row.get("region"))]
+                place = Place(
+                    (float(row["latitude"]), float(row["longitude"])),
+                    frozenset(normalize_place(name) for name in qualifiers),
+                )
+                for name in [row["name"], *_names(row.get("aliases"))]:
+                    entries.setdefault(normalize_place(name), place)
+        return cls(entries)
+
+    def _match(self, key: str, fuzzy_cutoff: float) -> Optional[Place]:
+        if key in self.entries:
+            return self.entries[key]
+
+        prefixed = {self.entries[n] for n in self.names if n.startswith(key + " ") or (len(key) >= 4 and n.startswith(key))}
+        if len(prefixed) == 1:
+            return prefixed.pop()
+
+        close = difflib.get_close_matches(key, self.names, n=1, cutoff=fuzzy_cutoff)
+        if close:
+            return self.entries[close[0]]
+        return None
+
+    def lookup(self, name: str, fuzzy_cutoff: float = 0.85) -> Optional[tuple[float, float]]:
+        # "Portland, Oregon, USA" -> "portland" qualified by {"oregon", "usa"}
+        city, *qualifiers = (normalize_place(part) for part in (name or "").split(","))
+        if not city:
+            return None
+        place = self._match(city, fuzzy_cutoff)
+        if place is None or not place.qualifiers.issuperset(filter(None, qualifiers)):
+            return None
+        return place.coords
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def get_gazetteer() -> Gazetteer:
+    """Shared gazetteer, loaded from the bundled file on first use."""
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer.from_csv(settings.gazetteer_file)
+    return _gazetteer
@@ -1,19 +1,127 @@
-import requests
+import json
+import logging
+import httpx
 from typing import Optional
 import os
+from src.ev_charging_stations.services.gazetteer import get_gazetteer, normalize_place
+from src.ev_charging_stations.services.http_client import UpstreamUnavailable, upstream
+from src.ev_charging_stations.services.metrics import registry, upstream_errors
+from src.ev_charging_stations.services.query_cache import SQLiteCache, TieredCache, TTLCache
+from src.ev_charging_stations.services.singleflight import SingleFlight
+from src.ev_charging_stations.utils.config import settings
 
 OPENCAGE_API_KEY = os.getenv("OPENCAGE_API_KEY")
+logger = logging.getLogger(__name__)
+
+# Remote results (including "not found") keyed on the normalized city name.
+geocode_cache = TieredCache(
+    TTLCache(maxsize=4096, ttl=settings.geocode_cache_ttl_seconds),
+    SQLiteCache(settings.geocode_cache_file, ttl=settings.geocode_cache_ttl_seconds)
+    if settings.geocode_cache_file else None,
+)
+registry.register_cache("geocode", lambda: geocode_cache)
+# Concurrent lookups of the same uncached place share one OpenCage call.
+geocode_flight = SingleFlight("geocode")
+
+
+def _local_lookup(city_name: str) -> tuple[str, Optional[tuple[float, float]], bool]:
+    """(cache key, coordinates, found) from the gazetteer or the cache."""
+    key, coords = _from_gazetteer(city_name)
+    if coords or not key:
+        return key, coords, True
+    return _from_cache(key, geocode_cache.get(key))
+
+
+async def _local_lookup_async(city_name: str) -> tuple[str, Optional[tuple[float, float]], bool]:
+    """`_local_lookup`, reading the disk cache off the event loop."""
+    key, coords = _from_gazetteer(city_name)
+    if coords or not key:
+        return key, coords, True
+    return _from_cache(key, await geocode_cache.get_async(key))
+
+
+def _from_gazetteer(city_name: str) -> tuple[str, Optional[tuple[float, float]]]:
+    return normalize_place(city_name), get_gazetteer().lookup(city_name)
+
+
+def _from_cache(key: str, cached: Optional[str]) -> tuple[str, Optional[tuple[float, float]], bool]:
+    if cached is None:
+        return key, None, False
+    value = json.loads(cached)
+    return key, tuple(value) if value else None, True
+
 
 def geocode_city(city_name: str) -> Optional[tuple[float, float]]:
-    url = "https://api.opencagedata.com/geocode/v1/json"
+    """
+    Coordinates for a city: the offline gazetteer answers known cities with no
+    network round trip; anything else goes through the cache to OpenCage.
+    """
+    key, coords, found = _local_lookup(city_name)
+    if found:
+        return coords
+    return geocode_flight.do(key, lambda: _geocode_and_cache(city_name, key))
+
+
+def _geocode_and_cache(city_name: str, key: str) -> Optional[tuple[float, float]]:
+    try:
+        coords = geocode_remote(city_name)
+    except UpstreamUnavailable as e:
+        # Provider outage, timeout or quota: answer without coordinates, don't cache.
+        upstream_errors.inc(service="opencage", error=type(e.__cause__ or e).__name__)
+        logger.warning("OpenCage lookup for %r failed: %s", city_name, e)
+        return None
+    geocode_cache.set(key, json.dumps(coords))
+    return coords
+
+
+def geocode_remote(city_name: str) -> Optional[tuple[float, float]]:
+    """Look a city up with OpenCage. Raises UpstreamUnavailable on failure."""
     params = {"q": city_name, "key": OPENCAGE_API_KEY, "limit": 1}
-    r = requests.get(url, params=params)
-    if r.status_code == 200:
-        data = r.json()
-        if data["results"]:
-            lat = data["results"][0]["geometry"]["lat"]
-            lng = data["results"][0]["geometry"]["lng"]
-            print("lat and len is ", lat, len)
-            return lat, lng
-    
+    r = upstream("opencage").request(
+        "GET",
+        settings.opencage_url,
+        params=params,
+        timeout=(settings.upstream_connect_timeout, settings.upstream_read_timeout),
+    )
+    return _parse_response(r)
+
+
+async def geocode_city_async(city_name: str) -> Optional[tuple[float, float]]:
+    """`geocode_city` using the shared async HTTP client for the remote call."""
+    key, coords, found = await _local_lookup_async(city_name)
+    if found:
+        return coords
+    return await geocode_flight.do_async(key, lambda: _geocode_and_cache_async(city_name, key))
+
+
+async def _geocode_and_cache_async(city_name: str, key: str) -> Optional[tuple[float, float]]:
+    try:
+        response = await upstream("opencage").request_async(
+            "GET",
+            settings.opencage_url,
+            params={"q": city_name, "key": OPENCAGE_API_KEY, "limit": 1},
+            timeout=httpx.Timeout(settings.upstream_read_timeout, connect=settings.upstream_connect_timeout),
+        )
+        coords = _parse_response(response)
+    except UpstreamUnavailable as e:
+        upstream_errors.inc(service="opencage", error=type(e.__cause__ or e).__name__)
+        logger.warning("OpenCage lookup for %r failed: %s", city_name, e)
+        return None
+    await geocode_cache.set_async(key, json.dumps(coords))
+    return coords
+
+
+def _parse_response(response) -> Optional[tuple[float, float]]:
+    """The first result of an OpenCage answer; a body that is not one counts as an upstream failure."""
+    try:
+        return _first_result(response.json())
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        raise UpstreamUnavailable(f"opencage: malformed response ({type(e).__name__}: {e})") from e
+
+
+def _first_result(data: dict) -> Optional[tuple[float, float]]:
+    if data["results"]:
+        lat = data["results"][0]["geometry"]["lat"]
+        lng = data["results"][0]["geometry"]["lng"]
+        return lat, lng
     return None
@@ -0,0 +1,311 @@
+"""
+Shared HTTP clients for upstream APIs, and the policies every upstream call
+goes through.
+
+`upstream(name)` returns the `Upstream` for a provider: connect/read
+timeouts, retries with exponential backoff and full jitter on transport
+errors, 429 and 5xx, a circuit breaker that fails fast while the provider is
+down, and a token bucket sized to its quota. Sync calls share one pooled
+`requests.Session`; async calls share one `httpx.AsyncClient` per event loop.
+"""
+
+import asyncio
+import random
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.ev_charging_stations.services.metrics import registry
+from src.ev_charging_stations.utils.config import settings
+
+# Pooled connections belong to the event loop that opened them, so keep one
+# client per running loop (normally just the server's).
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+_transport: Optional[httpx.AsyncBaseTransport] = None
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+upstream_retries = registry.counter("ev_upstream_retries_total", "Upstream calls retried after a failed attempt.")
+upstream_rejected = registry.counter(
+    "ev_upstream_rejected_total", "Upstream calls refused locally by the circuit breaker or rate limiter."
+)
+
+
+class UpstreamUnavailable(Exception):
+    """The upstream could not answer; the original error, if any, is `__cause__`."""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class RateLimited(UpstreamUnavailable):
+    pass
+
+
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.http_max_connections,
+                max_keepalive_connections=settings.http_max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(settings.upstream_read_timeout, connect=settings.upstream_connect_timeout),
+            transport=_transport,
+        )
+        _clients[loop] = client
+    return client
+
+
+def get_session() -> requests.Session:
+    """One keep-alive session for all sync upstream calls."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.http_max_keepalive_connections)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def set_transport(transport: Optional[httpx.AsyncBaseTransport]):
+    """Route new clients through `transport` (e.g. httpx.MockTransport in tests)."""
+    global _transport
+    _transport = transport
+    _clients.clear()
+
+
+async def close_async_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: Callable[[], float] = random.random) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt))."""
+    return rng() * min(cap, base * 2 ** attempt)
+
+
+class CircuitBreaker:
+    """
+    Closed until `failure_threshold` consecutive failures, then open (calls
+    fail fast) for `reset_timeout` seconds, then half-open: one probe call
+    decides whether it closes again or reopens.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            if self.state == "open" and self._clock() - self._opened_at >= self.reset_timeout:
+                self.state, self._probing = "half_open", False
+            if self.state == "open" or (self.state == "half_open" and self._probing):
+                raise CircuitOpenError("circuit open")
+            if self.state == "half_open":
+                self._probing = True
+
+    def release(self):
+        """The admitted call never got an answer (refused, cancelled, crashed); let another caller probe."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = "closed", 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state, self._opened_at, self._probing = "open", self._clock(), False
+
+
+class TokenBucket:
+    """
+    `rate` requests per second with bursts of up to `burst`. Callers reserve a
+    token and wait their turn, or are refused if that wait exceeds `max_wait`.
+    A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = clock()
+
+    def reserve(self, max_wait: float) -> float:
+        """Seconds to wait before the reserved call may go out. Raises RateLimited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                raise RateLimited(f"rate limit: next slot in {wait:.2f}s")
+            self._tokens -= 1
+            return wait
+
+
+class Upstream:
+    """Timeouts, retries, circuit breaker and rate limit for one provider."""
+
+    def __init__(self, name: str, rate: float = 0.0, burst: int = 1, retries: int = 2,
+                 backoff_base: float = 0.2, backoff_max: float = 2.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, max_wait: float = 2.0):
+        self.name = name
+        self.retries = retries
+        self.backoff_base, self.backoff_max = backoff_base, backoff_max
+        self.max_wait = max_wait
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.limiter = TokenBucket(rate, burst)
+
+    def _admit(self) -> float:
+        try:
+            self.breaker.before_call()
+            try:
+                return self.limiter.reserve(self.max_wait)
+            except RateLimited:
+                self.breaker.release()
+                raise
+        except UpstreamUnavailable as e:
+            upstream_rejected.inc(service=self.name, reason=type(e).__name__)
+            raise
+
+    def _settle(self, status: Optional[int], error: Optional[Exception], attempt: int) -> Optional[float]:
+        """
+        Record the outcome of one attempt. Returns None when the call is done
+        (success, or a failure not worth retrying), else the delay before the
+        next attempt. Only outages (transport errors, 5xx) count against the
+        breaker; 4xx answers show the provider is up.
+        """
+        if error is None:
+            self.breaker.record_success()
+            return None
+        if status is None or status >= 500:
+            self.breaker.record_failure()
+        elif status != 429:
+            self.breaker.record_success()
+        if (status is not None and status not in RETRY_STATUSES) or attempt >= self.retries:
+            return None
+        upstream_retries.inc(service=self.name)
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+    def _retry_after(self, headers, delay: float) -> float:
+        """Honour a 429's Retry-After (in seconds), up to `backoff_max`."""
+        try:
+            return max(delay, min(float(headers.get("Retry-After", 0)), self.backoff_max))
+        except ValueError:
+            return delay
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sync call on the shared session. Raises UpstreamUnavailable after the last failure."""
+        kwargs.setdefault("timeout", (settings.upstream_connect_timeout, settings.upstream_read_timeout))
+        for attempt in range(self.retries + 1):
+            wait = self._admit()
+            response, status = None, None
+            try:
+                time.sleep(wait)
+                response = get_session().request(method, url, **kwargs)
+                status = response.status_code
+                response.raise_for_status()
+                error = None
+            except requests.RequestException as e:
+                error = e
+            except BaseException:
+                self.breaker.release()
+                raise
+            delay = self._settle(status, error, attempt)
+            if error is None:
+                return response
+            if delay is None:
+                raise UpstreamUnavailable(f"{self.name}: {error}") from error
+            time.sleep(self._retry_after(response.headers, delay) if status == 429 else delay)
+
+    async def request_async(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        `request` on the loop's shared httpx client. An attempt that ends
+        without an answer (cancelled, or an error other than httpx's) gives
+        back its half-open probe slot instead of holding it forever.
+        """
+        for attempt in range(self.retries + 1):
+            wait = self._admit()
+            response, status = None, None
+            try:
+                await asyncio.sleep(wait)
+                response = await get_async_client().request(method, url, **kwargs)
+                status = response.status_code
+                response.raise_for_status()
+                error = None
+            except httpx.HTTPError as e:
+                error = e
+            except BaseException:
+                self.breaker.release()
+                raise
+            delay = self._settle(status, error, attempt)
+            if error is None:
+                return response
+            if delay is None:
+                raise UpstreamUnavailable(f"{self.name}: {error}") from error
+            await asyncio.sleep(self._retry_after(response.headers, delay) if status == 429 else delay)
+
+
+_upstreams: dict[str, Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name: str) -> Upstream:
+    """The shared Upstream for "openrouter" or "opencage", built from settings on first use."""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream(
+                name,
+                rate=getattr(settings, f"{name}_rate_per_second"),
+                burst=getattr(settings, f"{name}_burst"),
+                retries=settings.upstream_retries,
+                backoff_base=settings.upstream_backoff_base,
+                backoff_max=settings.upstream_backoff_max,
+                failure_threshold=settings.circuit_failure_threshold,
+                reset_timeout=settings.circuit_reset_seconds,
+                max_wait=settings.rate_limit_max_wait,
+            )
+        return _upstreams[name]
+
+
+def reset_upstreams():
+    """Forget breaker and limiter state (new settings apply on next use)."""
+    with _upstreams_lock:
+        _upstreams.clear()
+
+
+def _circuit_states():
+    yield "# HELP ev_upstream_circuit_open 1 while the upstream's circuit breaker is open or half-open."
+    yield "# TYPE ev_upstream_circuit_open gauge"
+    for name, up in list(_upstreams.items()):
+        yield f'ev_upstream_circuit_open{{service="{name}"}} {int(up.breaker.state != "closed")}'
+
+
+registry.register_collector(_circuit_states)
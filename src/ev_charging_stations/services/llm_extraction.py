@@ -1,13 +1,48 @@
 import json
-import requests
+import logging
+import httpx
 from dotenv import load_dotenv
 import os
 from src.ev_charging_stations.models.query_models import UserQuery
+from src.ev_charging_stations.services.http_client import UpstreamUnavailable, upstream
+from src.ev_charging_stations.services.metrics import registry, upstream_errors
+from src.ev_charging_stations.services.query_cache import SQLiteCache, TieredCache, TTLCache
+from src.ev_charging_stations.services.rule_extraction import extract_filters
+from src.ev_charging_stations.services.singleflight import SingleFlight
+from src.ev_charging_stations.utils.config import settings
 import re
+import unicodedata
+from typing import Optional
 
 
 load_dotenv()
 OPENROUTER_KEY = os.getenv("OPENROUTER_API_KEY")
+logger = logging.getLogger(__name__)
+
+# Parsed queries keyed on normalized question text, stored as JSON so callers
+# always get a fresh UserQuery they are free to mutate.
+llm_cache = TieredCache(
+    TTLCache(maxsize=settings.llm_cache_size, ttl=settings.llm_cache_ttl_seconds),
+    SQLiteCache(settings.llm_cache_file, ttl=settings.llm_cache_ttl_seconds) if settings.llm_cache_file else None,
+)
+rule_hits = 0
+# Identical questions arriving together share one extraction (and LLM call).
+llm_flight = SingleFlight("llm")
+degraded = registry.counter(
+    "ev_llm_degraded_total", "Questions answered by the lenient rule extractor because the LLM was unavailable."
+)
+registry.register_cache("llm", lambda: llm_cache)
+registry.register_collector(lambda: [
+    "# HELP ev_llm_rule_hits_total Questions answered by the rule extractor instead of the LLM.",
+    "# TYPE ev_llm_rule_hits_total counter", f"ev_llm_rule_hits_total {rule_hits}",
+])
+
+
+def normalize_question(question: str) -> str:
+    """Cache key: case, accents, punctuation and spacing differences are ignored."""
+    text = unicodedata.normalize("NFKD", question or "").encode("ascii", "ignore").decode()
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
 
 def extract_json_from_response(text: str) -> str:
     """
@@ -19,7 +54,91 @@ def extract_json_from_response(text: str) -> str:
     return text.strip()
 
 
+def _from_cache_or_rules(question: str) -> tuple[str, Optional[str]]:
+    """Cache key for the question, and its filters (JSON) if answerable without the LLM."""
+    key = normalize_question(question)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        return key, cached
+    cached = _from_rules(question)
+    if cached is not None:
+        llm_cache.set(key, cached)
+    return key, cached
+
+
+async def _from_cache_or_rules_async(question: str) -> tuple[str, Optional[str]]:
+    """`_from_cache_or_rules`, reading and writing the disk cache off the event loop."""
+    key = normalize_question(question)
+    cached = await llm_cache.get_async(key)
+    if cached is not None:
+        return key, cached
+    cached = _from_rules(question)
+    if cached is not None:
+        await llm_cache.set_async(key, cached)
+    return key, cached
+
+
+def _from_rules(question: str) -> Optional[str]:
+    global rule_hits
+    parsed = extract_filters(question)
+    if parsed is None:
+        return None
+    rule_hits += 1
+    return parsed.model_dump_json()
+
+
+def _degrade(question: str) -> str:
+    """Best-effort filters while the LLM is down; not cached, so it is asked again later."""
+    degraded.inc()
+    return extract_filters(question, strict=False).model_dump_json()
+
+
+def _extract(question: str) -> Optional[str]:
+    key, cached = _from_cache_or_rules(question)
+    if cached is None:
+        try:
+            parsed = call_llm(question)
+        except UpstreamUnavailable:
+            return _degrade(question)
+        if parsed is not None:
+            cached = parsed.model_dump_json()
+            llm_cache.set(key, cached)
+    return cached
+
+
+async def _extract_async(question: str) -> Optional[str]:
+    key, cached = await _from_cache_or_rules_async(question)
+    if cached is None:
+        try:
+            parsed = await call_llm_async(question)
+        except UpstreamUnavailable:
+            return _degrade(question)
+        if parsed is not None:
+            cached = parsed.model_dump_json()
+            await llm_cache.set_async(key, cached)
+    return cached
+
+
 def parse_user_question(question: str) -> UserQuery:
+    """
+    Structured filters for a question. Served from the cache when possible,
+    then from the rule-based extractor, and only then from the LLM; when the
+    LLM cannot be reached, from the lenient rule extractor. None if the LLM
+    answered with something unusable. Concurrent calls for the same
+    (normalized) question share one extraction.
+    """
+    cached = llm_flight.do(normalize_question(question), lambda: _extract(question))
+    return UserQuery.model_validate_json(cached) if cached is not None else None
+
+
+async def parse_user_question_async(question: str) -> UserQuery:
+    """`parse_user_question` using the shared async HTTP client for the LLM call."""
+    cached = await llm_flight.do_async(normalize_question(question), lambda: _extract_async(question))
+    return UserQuery.model_validate_json(cached) if cached is not None else None
+
+
+def build_llm_request(question: str) -> tuple[dict, dict]:
+    """Headers and JSON body for the OpenRouter extraction call."""
     CHARGING_SPEEDS = ["Fast", "Supercharger"]
     CHARGING_TYPES = ["Type 1", "Type 2", "DC Fast Charge"]
     ACCESSIBILITY = ["Public", "Restricted"]
@@ -32,13 +151,19 @@ Extract these fields from this question:
 "charging_type": one of {CHARGING_TYPES} or null,
 "accessibility": one of {ACCESSIBILITY} or null,
 "sort_by_reviews": boolean, true if user wants stations with better reviews, false otherwise
+"available_only": boolean, true if user wants stations with a free charger right now, false otherwise
+"open_at": string or null, when the station must be open: "now", "HH:MM" for today (e.g. "23:00" for "open late tonight"), or a weekday and time like "Sat 09:00"
+"origin": string or null, the start city if the user asks for stations along a route (e.g. "from Munich to Berlin", "between Munich and Berlin"),
+"destination": string or null, the end city of that route,
+"waypoints": list of city names the route passes through, in order, or null
+"provider": string or null, the charging network or operator the user names (e.g. "ChargeCo"),
+"name_query": string or null, a station or place name to match against station names (e.g. "Downtown Station"), not the city
 
-Return JSON with ONLY these keys. Use null for missing values, and true/false for "sort_by_reviews". Only return a JSON object without any extra text.
+Return JSON with ONLY these keys. Use null for missing values, and true/false for "sort_by_reviews" and "available_only". Only return a JSON object without any extra text.
 
 Question: {question}
 """
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {OPENROUTER_KEY}",
         "Content-Type": "application/json"
@@ -48,17 +173,53 @@ Question: {question}
         "messages": [{"role": "user", "content": prompt}],
         "temperature": 0
     }
+    return headers, data
+
+
+def parse_llm_response(body: dict) -> UserQuery:
+    content = body["choices"][0]["message"]["content"]
+    clean_json = extract_json_from_response(content)
+    parsed = json.loads(clean_json)
+    return UserQuery(**parsed)
 
+
+def call_llm(question: str) -> UserQuery:
+    """
+    Ask the LLM to extract the filters; None if its answer cannot be parsed.
+    Raises UpstreamUnavailable if the LLM cannot be reached.
+    """
+    headers, data = build_llm_request(question)
+    try:
+        response = upstream("openrouter").request(
+            "POST", settings.openrouter_url, headers=headers, json=data,
+            timeout=(settings.upstream_connect_timeout, settings.llm_timeout_seconds),
+        )
+    except UpstreamUnavailable as e:
+        upstream_errors.inc(service="openrouter", error=type(e.__cause__ or e).__name__)
+        logger.warning("OpenRouter call failed: %s", e)
+        raise
+    return _parse_or_none(response)
+
+
+async def call_llm_async(question: str) -> UserQuery:
+    """Async `call_llm` on the shared connection pool."""
+    headers, data = build_llm_request(question)
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        print("Raw LLM output:", content)  # 👈 helpful debug
-        clean_json = extract_json_from_response(content)
-        print("Clean JSON:", clean_json)   # 👈 confirm cleaned version
-        parsed = json.loads(clean_json)
-        return UserQuery(**parsed)
+        response = await upstream("openrouter").request_async(
+            "POST", settings.openrouter_url, headers=headers, json=data,
+            timeout=httpx.Timeout(settings.llm_timeout_seconds, connect=settings.upstream_connect_timeout),
+        )
+    except UpstreamUnavailable as e:
+        upstream_errors.inc(service="openrouter", error=type(e.__cause__ or e).__name__)
+        logger.warning("OpenRouter call failed: %s", e)
+        raise
+    return _parse_or_none(response)
 
+
+def _parse_or_none(response) -> Optional[UserQuery]:
+    try:
+        return parse_llm_response(response.json())
     except Exception as e:
-        print("❌ Error calling OpenRouter:", e)
-        return None  # <- return None instead of empty UserQuery
+        upstream_errors.inc(service="openrouter", error=type(e).__name__)
+        logger.warning("Unusable OpenRouter answer: %s: %s", type(e).__name__, e)
+        return None
@@ -0,0 +1,284 @@
+"""
+In-process metrics for the query pipeline, rendered in the Prometheus text format.
+
+`span(stage)` times one pipeline stage into the `ev_stage_duration_seconds`
+histogram, counts failures, and records the duration for the current
+request's `Server-Timing` header. Counts are per process; Prometheus scrapes
+and sums each worker.
+"""
+
+import bisect
+import collections
+import contextvars
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                          for k, v in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: dict[tuple, float] = collections.defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}{_label_text(labels)} {value:g}"
+
+
+class Histogram:
+    """
+    Cumulative buckets (aggregatable across workers) plus p50/p95/p99 over the
+    most recent `window` observations, exported as a separate gauge family.
+    """
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS, window: int = 2048):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self.window = window
+        self._series: dict[tuple, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0,
+                    "recent": collections.deque(maxlen=self.window),
+                }
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        series = self._series.get(tuple(sorted(labels.items())))
+        if not series or not series["recent"]:
+            return None
+        recent = sorted(series["recent"])
+        return recent[min(int(q * len(recent)), len(recent) - 1)]
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series["count"] if series else 0
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = {key: (list(s["counts"]), s["sum"], s["count"], sorted(s["recent"]))
+                        for key, s in self._series.items()}
+        for labels, (counts, total, count, _) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket{_label_text(labels + (('le', le),))} {cumulative}"
+            yield f"{self.name}_sum{_label_text(labels)} {total:g}"
+            yield f"{self.name}_count{_label_text(labels)} {count}"
+        yield f"# HELP {self.name}_recent Quantiles over the last {self.window} observations."
+        yield f"# TYPE {self.name}_recent gauge"
+        for labels, (_, _, _, recent) in sorted(snapshot.items()):
+            for q in QUANTILES:
+                value = recent[min(int(q * len(recent)), len(recent) - 1)]
+                yield f"{self.name}_recent{_label_text(labels + (('quantile', f'{q:g}'),))} {value:g}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+        self.collectors: list[Callable[[], Iterable[str]]] = []
+        self.caches: dict[str, Callable[[], object]] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, **kwargs) -> Histogram:
+        metric = Histogram(name, help, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[str]]):
+        """`collector()` yields extra exposition lines at scrape time (e.g. cache stats)."""
+        self.collectors.append(collector)
+
+    def register_cache(self, name: str, get_cache: Callable[[], object]):
+        """Scrape a TieredCache's per-tier hits and misses as `cache=name` (nothing while `get_cache` gives None)."""
+        self.caches[name] = get_cache
+
+    def _render_caches(self) -> Iterable[str]:
+        samples = []
+        for name, get_cache in self.caches.items():
+            cache = get_cache()
+            if cache is None:
+                continue
+            for tier, stats in cache.stats().items():
+                hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+                samples.append((_label_text((("cache", name), ("tier", tier))), hits, misses))
+        families = (
+            ("ev_cache_hits_total", "counter", "Cache lookups answered, by cache and tier.",
+             lambda hits, misses: hits),
+            ("ev_cache_misses_total", "counter", "Cache lookups not answered, by cache and tier.",
+             lambda hits, misses: misses),
+            ("ev_cache_hit_ratio", "gauge", "Share of cache lookups answered, by cache and tier.",
+             lambda hits, misses: hits / (hits + misses) if hits + misses else 0),
+        )
+        for family, kind, help, value in families:
+            yield f"# HELP {family} {help}"
+            yield f"# TYPE {family} {kind}"
+            for labels, hits, misses in samples:
+                yield f"{family}{labels} {value(hits, misses):g}"
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.extend(self._render_caches())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+stage_duration = registry.histogram("ev_stage_duration_seconds", "Time spent in each query pipeline stage.")
+stage_errors = registry.counter("ev_stage_errors_total", "Pipeline stages that raised, by exception type.")
+request_duration = registry.histogram("ev_request_duration_seconds", "HTTP request latency by route.")
+upstream_errors = registry.counter("ev_upstream_errors_total", "Failed calls to external services.")
+
+# (stage, seconds) pairs for the request being served, for Server-Timing.
+_request_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage; works around sync code and `await`s alike."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        stage_errors.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def start_request_timings() -> list:
+    """Collect this request's spans (including those on worker threads)."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: list, total: float) -> str:
+    merged = collections.defaultdict(float)
+    for stage, elapsed in timings:
+        merged[stage] += elapsed
+    merged["total"] = total
+    return ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in merged.items())
+
+
+class StackSampler:
+    """
+    Opt-in sampling profiler: while at least one sampled request is running,
+    a background thread records every thread's stack each `interval` seconds.
+    The thread exits when the last sampled request ends (or on `close`).
+    Stacks are kept in collapsed ("a;b;c count") form for flame graphs.
+    """
+
+    def __init__(self, rate: float, interval: float = 0.005, max_stacks: int = 5000):
+        self.rate = rate
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks: collections.Counter = collections.Counter()
+        self._active = 0
+        self._lock = threading.Lock()  # _active and _thread
+        self._stacks_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def should_sample(self) -> bool:
+        return self.rate > 0 and random.random() < self.rate
+
+    @contextmanager
+    def sampling(self):
+        with self._lock:
+            self._active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active or self._stop.is_set():
+                    self._thread = None
+                    return
+            keys = []
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                keys.append(";".join(reversed(stack)))
+            with self._stacks_lock:
+                for key in keys:
+                    if key in self.stacks or len(self.stacks) < self.max_stacks:
+                        self.stacks[key] += 1
+            self._stop.wait(self.interval)
+
+    def close(self):
+        """Stop the sampler thread, if running, and wait for it to exit."""
+        with self._lock:
+            thread = self._thread
+        self._stop.set()
+        if thread is not None:
+            thread.join()
+        self._stop.clear()
+
+    def collapsed(self, top: int = 200) -> str:
+        with self._stacks_lock:
+            stacks = self.stacks.copy()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common(top))
+
+    def reset(self):
+        with self._stacks_lock:
+            self.stacks.clear()
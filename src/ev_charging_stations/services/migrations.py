@@ -0,0 +1,289 @@
+"""
+Versioned schema for the SQLite database.
+
+The applied version is stored in `PRAGMA user_version`; `migrate` runs every
+newer migration in order, each in its own transaction.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Callable, Union
+
+from src.ev_charging_stations.services.station_features import refresh_station_features
+from src.ev_charging_stations.utils.config import settings
+
+STATIONS_DDL = """
+CREATE TABLE {name} (
+    station_id INTEGER PRIMARY KEY,
+    provider TEXT,
+    location_name TEXT,
+    latitude REAL,
+    longitude REAL,
+    charging_speed TEXT,
+    available_chargers INTEGER,
+    charging_types TEXT,
+    accessibility TEXT,
+    operating_hours TEXT,
+    avg_sentiment REAL,
+    num_reviews INTEGER,
+    sentiment_sum REAL
+)
+"""
+
+# review_id is reused across stations in the source data, so the natural key
+# is (review_id, station_id).
+REVIEWS_DDL = """
+CREATE TABLE {name} (
+    review_id INTEGER NOT NULL,
+    user_id TEXT,
+    station_id INTEGER NOT NULL REFERENCES charging_stations(station_id),
+    preferred_charging_speed TEXT,
+    preferred_charging_type TEXT,
+    feedback TEXT,
+    sentiment_score REAL,
+    feedback_hash TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (review_id, station_id)
+)
+"""
+
+# Sufficient statistics for `services.station_features`, one row per reviewed
+# station; preference counts are JSON objects of value -> reviews.
+FEATURES_DDL = """
+CREATE TABLE station_features (
+    station_id INTEGER PRIMARY KEY,
+    review_count INTEGER NOT NULL,
+    scored_count INTEGER NOT NULL,
+    sentiment_sum REAL NOT NULL,
+    decayed_sum REAL NOT NULL,
+    decayed_weight REAL NOT NULL,
+    last_review_day REAL,
+    speed_counts TEXT NOT NULL,
+    type_counts TEXT NOT NULL
+)
+"""
+
+# Composite indexes cover every combination of the filters find_stations
+# supports: each combination has an index whose leading column it constrains.
+STATION_INDEXES = {
+    "idx_stations_speed_type_access": "charging_speed, charging_types, accessibility",
+    "idx_stations_type_access": "charging_types, accessibility",
+    "idx_stations_access": "accessibility",
+    "idx_stations_lat_lon": "latitude, longitude",
+}
+
+RTREE_TRIGGERS = """
+CREATE TRIGGER station_rtree_insert AFTER INSERT ON charging_stations
+WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+    INSERT OR REPLACE INTO station_rtree VALUES (new.station_id, new.latitude, new.latitude, new.longitude, new.longitude);
+END;
+CREATE TRIGGER station_rtree_update AFTER UPDATE OF station_id, latitude, longitude ON charging_stations BEGIN
+    DELETE FROM station_rtree WHERE station_id = old.station_id;
+    INSERT INTO station_rtree
+    SELECT new.station_id, new.latitude, new.latitude, new.longitude, new.longitude
+    WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+END;
+CREATE TRIGGER station_rtree_delete AFTER DELETE ON charging_stations BEGIN
+    DELETE FROM station_rtree WHERE station_id = old.station_id;
+END;
+"""
+
+# Trigram full-text index over the names users search by, kept in step with
+# charging_stations (an external-content table: it stores only the index),
+# and its per-trigram document counts for typo lookups.
+STATION_NAMES_DDL = """
+CREATE VIRTUAL TABLE station_names USING fts5(
+    provider, location_name, content='charging_stations', content_rowid='station_id', tokenize='trigram'
+)
+"""
+STATION_NAMES_VOCAB_DDL = "CREATE VIRTUAL TABLE station_names_vocab USING fts5vocab(station_names, 'row')"
+
+STATION_NAMES_TRIGGERS = """
+CREATE TRIGGER station_names_insert AFTER INSERT ON charging_stations BEGIN
+    INSERT INTO station_names (rowid, provider, location_name) VALUES (new.station_id, new.provider, new.location_name);
+END;
+CREATE TRIGGER station_names_update AFTER UPDATE OF station_id, provider, location_name ON charging_stations BEGIN
+    INSERT INTO station_names (station_names, rowid, provider, location_name)
+    VALUES ('delete', old.station_id, old.provider, old.location_name);
+    INSERT INTO station_names (rowid, provider, location_name) VALUES (new.station_id, new.provider, new.location_name);
+END;
+CREATE TRIGGER station_names_delete AFTER DELETE ON charging_stations BEGIN
+    INSERT INTO station_names (station_names, rowid, provider, location_name)
+    VALUES ('delete', old.station_id, old.provider, old.location_name);
+END;
+"""
+
+# Queue the stations whose reviews changed for `refresh_station_features`.
+FEATURE_TRIGGERS = """
+CREATE TRIGGER station_features_insert AFTER INSERT ON user_reviews BEGIN
+    INSERT OR IGNORE INTO station_features_dirty VALUES (new.station_id);
+END;
+CREATE TRIGGER station_features_update AFTER UPDATE OF station_id, sentiment_score, preferred_charging_speed,
+    preferred_charging_type, created_at ON user_reviews BEGIN
+    INSERT OR IGNORE INTO station_features_dirty VALUES (old.station_id);
+    INSERT OR IGNORE INTO station_features_dirty VALUES (new.station_id);
+END;
+CREATE TRIGGER station_features_delete AFTER DELETE ON user_reviews BEGIN
+    INSERT OR IGNORE INTO station_features_dirty VALUES (old.station_id);
+END;
+"""
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _rebuild_table(conn: sqlite3.Connection, table: str, ddl: str):
+    """Create `table` from `ddl`, copying rows over from any older definition."""
+    existing = table_columns(conn, table)
+    if not existing:
+        conn.execute(ddl.format(name=table))
+        return
+    conn.execute(ddl.format(name=f"{table}__new"))
+    shared = ", ".join(c for c in table_columns(conn, f"{table}__new") if c in existing)
+    conn.execute(f"INSERT OR REPLACE INTO {table}__new ({shared}) SELECT {shared} FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {table}__new RENAME TO {table}")
+
+
+def create_station_indexes(conn: sqlite3.Connection, table: str = "charging_stations"):
+    for name, columns in STATION_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def create_review_indexes(conn: sqlite3.Connection, table: str = "user_reviews"):
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_reviews_station ON {table} (station_id)")
+
+
+def _create_triggers(conn: sqlite3.Connection, triggers: str):
+    for statement in triggers.split("END;")[:-1]:
+        conn.execute(statement + "END;")
+
+
+def create_rtree_triggers(conn: sqlite3.Connection):
+    _create_triggers(conn, RTREE_TRIGGERS)
+
+
+def create_feature_triggers(conn: sqlite3.Connection):
+    _create_triggers(conn, FEATURE_TRIGGERS)
+
+
+def create_name_triggers(conn: sqlite3.Connection):
+    _create_triggers(conn, STATION_NAMES_TRIGGERS)
+
+
+def fill_rtree(conn: sqlite3.Connection):
+    conn.execute("""
+        INSERT INTO station_rtree
+        SELECT station_id, latitude, latitude, longitude, longitude FROM charging_stations
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """)
+
+
+def fill_station_names(conn: sqlite3.Connection):
+    """Rebuild the name index from charging_stations as it is now."""
+    conn.execute("INSERT INTO station_names (station_names) VALUES ('rebuild')")
+
+
+def _v1_keys(conn: sqlite3.Connection):
+    """Declared primary keys; the old loader replaced tables and dropped them."""
+    _rebuild_table(conn, "charging_stations", STATIONS_DDL)
+    _rebuild_table(conn, "user_reviews", REVIEWS_DDL)
+
+
+def _v2_filter_indexes(conn: sqlite3.Connection):
+    create_station_indexes(conn)
+    create_review_indexes(conn)
+
+
+def _v3_rtree(conn: sqlite3.Connection):
+    conn.execute("CREATE VIRTUAL TABLE station_rtree USING rtree(station_id, min_lat, max_lat, min_lon, max_lon)")
+    fill_rtree(conn)
+    create_rtree_triggers(conn)
+
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, decl: str):
+    if column not in table_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _v4_sentiment_tracking(conn: sqlite3.Connection):
+    """
+    Bookkeeping for incremental sentiment scoring: the hash of the feedback a
+    review was scored from, and a running per-station sum so averages can be
+    updated from deltas. Hashes start empty, so the first run scores every review.
+    """
+    _add_column(conn, "user_reviews", "feedback_hash", "TEXT")
+    _add_column(conn, "charging_stations", "sentiment_sum", "REAL")
+    conn.execute("""
+        UPDATE charging_stations SET
+            sentiment_sum = (SELECT TOTAL(r.sentiment_score) FROM user_reviews r WHERE r.station_id = charging_stations.station_id),
+            num_reviews = (SELECT COUNT(r.sentiment_score) FROM user_reviews r WHERE r.station_id = charging_stations.station_id)
+        WHERE station_id IN (SELECT station_id FROM user_reviews WHERE sentiment_score IS NOT NULL)
+    """)
+
+
+def _v5_station_features(conn: sqlite3.Connection):
+    """
+    Review timestamps for recency, and the materialized per-station feature
+    table with its refresh queue. Reviews already stored count as written now.
+    """
+    _add_column(conn, "user_reviews", "created_at", "TEXT")
+    conn.execute("UPDATE user_reviews SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL")
+    conn.execute(FEATURES_DDL)
+    conn.execute("CREATE TABLE station_features_dirty (station_id INTEGER PRIMARY KEY)")
+    create_feature_triggers(conn)
+    refresh_station_features(conn, full=True)
+
+
+def _v6_station_names(conn: sqlite3.Connection):
+    conn.execute(STATION_NAMES_DDL)
+    conn.execute(STATION_NAMES_VOCAB_DDL)
+    fill_station_names(conn)
+    create_name_triggers(conn)
+
+
+MIGRATIONS: list[tuple[int, Callable[[sqlite3.Connection], None]]] = [
+    (1, _v1_keys),
+    (2, _v2_filter_indexes),
+    (3, _v3_rtree),
+    (4, _v4_sentiment_tracking),
+    (5, _v5_station_features),
+    (6, _v6_station_names),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(target: Union[Path, sqlite3.Connection, None] = None) -> int:
+    """
+    Bring the database up to SCHEMA_VERSION. Accepts a path (defaults to the
+    configured database) or an open connection. Returns the resulting version.
+    """
+    conn = target if isinstance(target, sqlite3.Connection) else sqlite3.connect(target or settings.db_file)
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None  # explicit transactions, so DDL is covered too
+    try:
+        version = schema_version(conn)
+        for number, migration in MIGRATIONS:
+            if number <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            print(f"✅ Applied schema migration {number} ({migration.__name__.lstrip('_')})")
+            version = number
+        return version
+    finally:
+        conn.isolation_level = isolation_level
+        if conn is not target:
+            conn.close()
@@ -0,0 +1,173 @@
+"""
+Provider and station-name lookups on the `station_names` FTS5 index.
+
+The index uses the trigram tokenizer, so a quoted query matches any
+substring of the name (which covers prefixes, "Down" -> "Downtown Station")
+in milliseconds, without a LIKE scan. Only when nothing contains the query
+is it treated as a typo: names sharing enough of its trigrams are fetched
+(groups of trigrams, each led by a rare one, so the candidate query stays
+selective), the part of each name most like the query is scored with
+difflib, and the best corrections scoring at least `name_match_threshold`
+are searched for instead, scoring what they match.
+
+The result is a set of station ids with scores, which the station index
+turns into a mask, so the text filter combines with every other filter and
+the geo search.
+"""
+
+import itertools
+from difflib import SequenceMatcher
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from src.ev_charging_stations.services.db_pool import get_pool
+from src.ev_charging_stations.services.snapshot import source_stamp
+from src.ev_charging_stations.utils.config import settings
+
+# filter key -> FTS5 columns it searches
+NAME_FILTERS = {
+    "provider": ("provider",),
+    "name_query": ("provider", "location_name"),
+}
+
+
+def normalize_name(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def trigrams(text: str) -> set[str]:
+    """Case-folded character trigrams, as the trigram tokenizer indexes them."""
+    text = normalize_name(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _target(columns: tuple[str, ...]) -> str:
+    return "{" + " ".join(columns) + "} : "
+
+
+class NameMatches(NamedTuple):
+    """Matching station ids (sorted) and their scores in (0, 1]."""
+    station_ids: np.ndarray
+    scores: np.ndarray
+
+    def score_of(self, station_ids) -> np.ndarray:
+        """Scores for `station_ids`, 0 for stations that do not match."""
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        if not len(self.station_ids):
+            return np.zeros(len(station_ids))
+        at = np.searchsorted(self.station_ids, station_ids).clip(max=len(self.station_ids) - 1)
+        return np.where(self.station_ids[at] == station_ids, self.scores[at], 0.0)
+
+
+def containing(conn, text: str, columns: tuple[str, ...]) -> np.ndarray:
+    """Stations with `text` somewhere in one of `columns` (case-insensitive)."""
+    if len(text) >= 3:
+        rows = conn.execute("SELECT rowid FROM station_names WHERE station_names MATCH ?",
+                            (_target(columns) + _phrase(text),))
+    else:
+        # too short for trigrams: a prefix of any searched column
+        prefix = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        where = " OR ".join(f"{column} LIKE ? ESCAPE '\\'" for column in columns)
+        rows = conn.execute(f"SELECT rowid FROM station_names WHERE {where}", [prefix] * len(columns))
+    return np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64)
+
+
+def closest_part(query: str, value: str) -> tuple[float, str]:
+    """Best difflib ratio of `query` against a same-length slice of `value` starting at a word, and that slice."""
+    value = normalize_name(value)
+    matcher = SequenceMatcher(None, b=query, autojunk=False)
+    best = (0.0, "")
+    for start in [0] + [i + 1 for i, char in enumerate(value) if char == " "]:
+        part = value[start:start + len(query)]
+        matcher.set_seq1(part)
+        if matcher.real_quick_ratio() > best[0] and matcher.quick_ratio() > best[0]:
+            best = max(best, (matcher.ratio(), part))
+    return best
+
+
+def corrections(conn, query: str, columns: tuple[str, ...]) -> list[tuple[str, float]]:
+    """Name fragments the query is likely a misspelling of, best first, with their scores."""
+    grams = trigrams(query)
+    if len(grams) < 2:
+        return []
+    # A name within the threshold typically keeps at least half of the
+    # query's trigrams, so it contains every trigram of at least one of
+    # len // 2 + 1 groups; leading each group with one of the rarest
+    # trigrams keeps every group selective.
+    frequency = dict(conn.execute(
+        f"SELECT term, doc FROM station_names_vocab WHERE term IN ({', '.join('?' * len(grams))})", sorted(grams)
+    ))
+    ranked = sorted(grams, key=lambda gram: (frequency.get(gram, 0), gram))
+    count = len(ranked) // 2 + 1
+    groups = [" AND ".join(_phrase(gram) for gram in ranked[i::count]) for i in range(count)]
+    rows = conn.execute(
+        f"SELECT {', '.join(columns)} FROM station_names WHERE station_names MATCH ? LIMIT ?",
+        (_target(columns) + "(" + " OR ".join(f"({group})" for group in groups) + ")", settings.name_match_candidates),
+    )
+    found = {}
+    for value in {value for row in rows for value in row if value}:
+        score, part = closest_part(query, value)
+        if score >= settings.name_match_threshold and score > found.get(part, 0):
+            found[part] = score
+    return sorted(found.items(), key=lambda item: (-item[1], item[0]))[:settings.name_match_corrections]
+
+
+def match_names(conn, text: str, columns: tuple[str, ...]) -> NameMatches:
+    """Stations whose `columns` contain `text`, or (failing that) a close misspelling of it."""
+    text = normalize_name(text)
+    station_ids = containing(conn, text, columns)
+    if len(station_ids):
+        return NameMatches(np.sort(station_ids), np.ones(len(station_ids)))
+    found = [(containing(conn, part, columns), score) for part, score in corrections(conn, text, columns)]
+    if not found:
+        return NameMatches(np.empty(0, dtype=np.int64), np.empty(0))
+    station_ids = np.concatenate([ids for ids, _ in found])
+    scores = np.concatenate([np.full(len(ids), score) for ids, score in found])
+    # corrections come best first: keep each station's first (best) score
+    station_ids, first = np.unique(station_ids, return_index=True)
+    return NameMatches(station_ids, scores[first])
+
+
+@lru_cache(maxsize=1024)
+def _lookup(db_file: str, stamp: str, key: str, text: str) -> NameMatches:
+    with get_pool().connection() as conn:
+        return match_names(conn, text, NAME_FILTERS[key])
+
+
+def name_matches(filters: dict) -> Optional[NameMatches]:
+    """
+    Stations matching the `provider` / `name_query` filters, or None if there
+    are none. Every filter must match, and scores multiply. Lookups are
+    cached per filter and database state. A `name_matches` entry,
+    resolved earlier (e.g. before fanning out to shard workers), is used as is.
+    """
+    if filters.get("name_matches") is not None:
+        return filters["name_matches"]
+    terms = [(key, normalize_name(filters[key])) for key in NAME_FILTERS if filters.get(key)]
+    terms = [(key, text) for key, text in terms if text]
+    if not terms:
+        return None
+    db_file = Path(settings.db_file)
+    stamp = source_stamp(db_file)
+    matches = None
+    for key, text in terms:
+        found = _lookup(str(db_file), stamp, key, text)
+        if matches is None:
+            matches = found
+        else:
+            station_ids = np.intersect1d(matches.station_ids, found.station_ids, assume_unique=True)
+            matches = NameMatches(station_ids, matches.score_of(station_ids) * found.score_of(station_ids))
+    return matches
+
+
+def with_name_matches(filters: dict) -> dict:
+    """`filters` with the name lookup resolved, for processes without a database connection."""
+    matches = name_matches(filters)
+    return filters if matches is None else {**filters, "name_matches": matches}
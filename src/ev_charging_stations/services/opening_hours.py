@@ -0,0 +1,166 @@
+"""
+Operating hours as minute-of-week bitsets.
+
+`operating_hours` is free text ("24/7", "06:00 - 22:00", "Mo-Fr 08:00-18:00;
+Sa 09:00-14:00"). Each distinct value is parsed once into 10080 open/closed
+flags, Monday 00:00 first, packed to 1260 bytes. The station store keeps the
+column dictionary-encoded, so "open at minute m" for every station is one bit
+read per distinct value and a gather through the codes.
+"""
+
+import re
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+DAYS = ("mo", "tu", "we", "th", "fr", "sa", "su")
+
+ALWAYS = re.compile(r"^(?:24\s*/\s*7|24\s*h(?:ours|rs)?|always(?: open)?|open 24 hours)$")
+DAY = r"(?:mo|tu|we|th|fr|sa|su)[a-z]*\.?"
+DAY_SPEC = re.compile(rf"^({DAY}(?:\s*-\s*{DAY})?(?:\s*,\s*{DAY}(?:\s*-\s*{DAY})?)*)\s*:?\s+(.*)$")
+TIME = r"(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm)?"
+TIME_RANGE = re.compile(rf"^{TIME}\s*(?:-|–|to)\s*{TIME}$")
+OPEN_AT = re.compile(rf"^(?:({DAY})\s+)?{TIME}$")
+
+
+def _minute(hour: str, minute: Optional[str], meridiem: Optional[str]) -> int:
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(hour)
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    if minute > 59 or hour > 24 or (hour == 24 and minute):
+        raise ValueError(hour)
+    return hour * 60 + minute
+
+
+def _days(spec: str) -> list[int]:
+    days = []
+    for part in spec.split(","):
+        ends = [DAYS.index(day.strip()[:2]) for day in part.split("-")]
+        first, last = ends[0], ends[-1]
+        days.extend((first + i) % 7 for i in range((last - first) % 7 + 1))
+    return days
+
+
+def parse_hours(text) -> Optional[np.ndarray]:
+    """
+    Open flags per minute of the week for one operating-hours string, or
+    None if any part of it is not understood. Rules are separated by ";";
+    each is an optional day list ("Mo-Fr", "Sat,Sun") and time ranges
+    ("08:00-12:00, 13:00-18:00"), "24/7" or "closed". A range that ends at
+    or before its start runs past midnight.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return None
+    flags = np.zeros(MINUTES_PER_WEEK, dtype=bool)
+    for rule in text.lower().split(";"):
+        rule = rule.strip()
+        if not rule:
+            continue
+        if ALWAYS.match(rule):
+            flags[:] = True
+            continue
+        match = DAY_SPEC.match(rule)
+        try:
+            days, times = (_days(match.group(1)), match.group(2).strip()) if match else (list(range(7)), rule)
+        except ValueError:
+            return None
+        if times in ("closed", "off"):
+            for day in days:
+                flags[day * MINUTES_PER_DAY:(day + 1) * MINUTES_PER_DAY] = False
+            continue
+        for piece in times.split(","):
+            piece = piece.strip()
+            if ALWAYS.match(piece):
+                start, end = 0, MINUTES_PER_DAY
+            else:
+                span = TIME_RANGE.match(piece)
+                if not span:
+                    return None
+                try:
+                    start, end = _minute(*span.groups()[:3]), _minute(*span.groups()[3:])
+                except ValueError:
+                    return None
+            length = (end - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+            for day in days:
+                first = day * MINUTES_PER_DAY + start
+                flags[np.arange(first, first + length) % MINUTES_PER_WEEK] = True
+    return flags
+
+
+def minute_of_week(value, now: Optional[datetime] = None) -> int:
+    """
+    Minute of the week (Monday 00:00 = 0) for an `open_at` value: "now",
+    "HH:MM" (today), "Sat 09:00", or an ISO datetime. Station hours are
+    local, so times are taken as they are, without time zones.
+    """
+    now = now or datetime.now()
+    text = str(value).strip().lower()
+    if text == "now":
+        moment = now
+    else:
+        match = OPEN_AT.match(text)
+        if match:
+            day = DAYS.index(match.group(1)[:2]) if match.group(1) else now.weekday()
+            return day * MINUTES_PER_DAY + _minute(*match.groups()[1:]) % MINUTES_PER_DAY
+        moment = datetime.fromisoformat(str(value).strip())
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def normalize_open_at(value) -> Optional[str]:
+    """`value` if `minute_of_week` understands it, else None (for LLM output)."""
+    if value is None:
+        return None
+    try:
+        minute_of_week(value)
+    except (ValueError, TypeError):
+        return None
+    return str(value).strip()
+
+
+class OpeningHours:
+    """
+    Packed open flags for each distinct operating_hours value of a store,
+    used through the column's category codes. Values that cannot be parsed
+    are never open, so an `open_at` filter only returns stations known to be
+    open.
+    """
+
+    ARRAYS = ("table",)
+
+    def __init__(self, table: np.ndarray, codes: Optional[np.ndarray]):
+        self.table = table
+        self.codes = codes
+
+    @classmethod
+    def from_store(cls, store) -> "OpeningHours":
+        column = store.data.get("operating_hours")
+        if column is None:
+            return cls(np.zeros((0, MINUTES_PER_WEEK // 8), dtype=np.uint8), None)
+        flags = np.zeros((len(column.categories), MINUTES_PER_WEEK), dtype=bool)
+        for i, value in enumerate(column.categories):
+            parsed = parse_hours(value)
+            if parsed is not None:
+                flags[i] = parsed
+        return cls(np.packbits(flags, axis=1), column.codes)
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, store) -> "OpeningHours":
+        column = store.data.get("operating_hours")
+        return cls(arrays["table"], None if column is None else column.codes)
+
+    def to_arrays(self) -> dict:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def open_mask(self, minute: int, size: int) -> np.ndarray:
+        """True for the stations open at `minute` of the week."""
+        if self.codes is None:
+            return np.zeros(size, dtype=bool)
+        minute %= MINUTES_PER_WEEK
+        is_open = (self.table[:, minute >> 3] >> (7 - (minute & 7))) & 1
+        # code -1 (NULL) picks the trailing False
+        return np.append(is_open.astype(bool), False)[self.codes]
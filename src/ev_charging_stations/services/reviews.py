@@ -0,0 +1,65 @@
+"""
+Writes for reviews submitted through the API.
+
+The search path only reads (see `db_pool`); a new review is written on its
+own short connection, together with its station's aggregates and features,
+in one transaction. The station index picks the change up on its next check.
+"""
+
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from src.ev_charging_stations.services.sentiment import text_hash
+from src.ev_charging_stations.services.station_features import refresh_station_features
+from src.ev_charging_stations.utils.config import settings
+
+INSERT_REVIEW = """
+INSERT INTO user_reviews (
+    review_id, user_id, station_id, preferred_charging_speed, preferred_charging_type,
+    feedback, sentiment_score, feedback_hash
+)
+SELECT COALESCE(MAX(review_id), 0) + 1, :user_id, :station_id, :preferred_charging_speed,
+       :preferred_charging_type, :feedback, :sentiment_score, :feedback_hash
+FROM user_reviews
+RETURNING review_id
+"""
+
+# One station's reviews are few; regrouping them also seeds a missing running sum.
+RESTATE_STATION = """
+UPDATE charging_stations SET
+    sentiment_sum = (SELECT TOTAL(sentiment_score) FROM user_reviews WHERE station_id = :station_id),
+    num_reviews = (SELECT COUNT(sentiment_score) FROM user_reviews WHERE station_id = :station_id),
+    avg_sentiment = (SELECT AVG(sentiment_score) FROM user_reviews WHERE station_id = :station_id)
+WHERE station_id = :station_id
+RETURNING avg_sentiment, num_reviews
+"""
+
+
+def add_review(review: dict, sentiment_score: Optional[float], db_file: Optional[Path] = None) -> Optional[dict]:
+    """
+    Store a scored review (station_id, feedback, and optional user_id and
+    preferred_charging_speed/type). Returns the stored review with the
+    station's new average, or None if the station does not exist.
+    """
+    params = {
+        "user_id": None, "preferred_charging_speed": None, "preferred_charging_type": None,
+        **review, "sentiment_score": sentiment_score, "feedback_hash": text_hash(review["feedback"]),
+    }
+    conn = sqlite3.connect(db_file or settings.db_file, timeout=settings.db_timeout_seconds)
+    try:
+        with conn:
+            if conn.execute("SELECT 1 FROM charging_stations WHERE station_id = ?", (params["station_id"],)).fetchone() is None:
+                return None
+            (review_id,), = conn.execute(INSERT_REVIEW, params).fetchall()
+            (avg_sentiment, num_reviews), = conn.execute(RESTATE_STATION, params).fetchall()
+            refresh_station_features(conn)
+    finally:
+        conn.close()
+    return {
+        "review_id": review_id,
+        "station_id": params["station_id"],
+        "sentiment_score": sentiment_score,
+        "avg_sentiment": avg_sentiment,
+        "num_reviews": num_reviews,
+    }
@@ -0,0 +1,89 @@
+"""
+Rule-based filter extraction for simple questions.
+
+Handles a city plus the known enum values ("fast Type 2 chargers in Berlin"),
+or a trip between two cities ("chargers from Munich to Berlin"), without
+calling the LLM. Anything it does not fully understand is left to the
+LLM: `extract_filters` returns None unless every word is accounted for.
+With `strict=False` it keeps whatever it recognised instead, which is what
+the pipeline falls back to while the LLM is unavailable.
+"""
+
+import re
+from typing import Optional
+
+from src.ev_charging_stations.models.query_models import UserQuery
+
+CHARGING_SPEEDS = ["Fast", "Supercharger"]
+CHARGING_TYPES = ["Type 1", "Type 2", "DC Fast Charge"]
+ACCESSIBILITY = ["Public", "Restricted"]
+
+# (pattern, field, value); types go first so "DC fast" is not read as a speed.
+PATTERNS = [
+    (r"\bdc[\s-]*fast(?:[\s-]*charg(?:e|er|ers|ing))?\b", "charging_type", "DC Fast Charge"),
+    (r"\btype[\s-]*1\b", "charging_type", "Type 1"),
+    (r"\btype[\s-]*2\b", "charging_type", "Type 2"),
+    (r"\bsuper[\s-]?charg(?:er|ers|ing)\b", "charging_speed", "Supercharger"),
+    (r"\b(?:fast|rapid|quick)\b", "charging_speed", "Fast"),
+    (r"\bpublic(?:ly)?\b", "accessibility", "Public"),
+    (r"\b(?:restricted|private)\b", "accessibility", "Restricted"),
+    (r"\b(?:best|better|top|highest|good|great|well)[\s-]*(?:user[\s-]*)?(?:rated|reviewed|reviews?|ratings?)\b",
+     "sort_by_reviews", True),
+    (r"\b(?:open|opened)\s+(?:right\s+)?now\b", "open_at", "now"),
+    # a free charger right now; "free" alone could mean no charge
+    (r"\b(?:(?:available|free)\s+(?:right\s+)?now|available|availability)\b", "available_only", True),
+]
+
+PLACE = r"(?:[A-Z][\w.'-]*)(?:\s+[A-Z][\w.'-]*){0,3}"
+CITY_PATTERN = re.compile(rf"\b(?i:in|near|around|at)\s+({PLACE})")
+# "from Munich to Berlin", "between Munich and Berlin": a corridor search
+ROUTE_PATTERN = re.compile(rf"\b(?i:from)\s+({PLACE})\s+(?i:to)\s+({PLACE})|\b(?i:between)\s+({PLACE})\s+(?i:and)\s+({PLACE})")
+
+# Words that carry no filter information in a simple question.
+FILLER = {
+    "a", "all", "along", "an", "and", "any", "are", "around", "at", "can", "car", "charge", "charger",
+    "chargers", "charging", "connector", "connectors", "do", "electric", "ev", "find", "for", "get", "give",
+    "has", "have", "i", "i'm", "im", "in", "is", "list", "looking", "m", "me", "my", "near", "nearby",
+    "please", "plug", "plugs", "point", "points", "route", "show", "some", "spot", "spots", "station", "stations",
+    "that", "the", "there", "to", "trip", "user", "users", "want", "way", "where", "which", "what", "with", "you",
+}
+
+
+def extract_filters(question: str, strict: bool = True) -> Optional[UserQuery]:
+    """
+    Filters for a simple "<enums> in <City>" or "<enums> from <City> to
+    <City>" question, or None to defer to the LLM.
+    """
+    route = ROUTE_PATTERN.search(question or "")
+    if route:
+        origin, destination = [place for place in route.groups() if place]
+        places = {"origin": origin.strip(".,'"), "destination": destination.strip(".,'")}
+        text = question[:route.start()] + " " + question[route.end():]
+        city_words = []
+    else:
+        places = {}
+        match = CITY_PATTERN.search(question or "")
+        if not match and strict:
+            return None
+        city_words = match.group(1).split() if match else []
+        text = question[:match.start(1)] + " " + question[match.end(1):] if match else question or ""
+
+    fields = {}
+    conflicts = set()
+    lowered = text.lower()
+    for pattern, field, value in PATTERNS:
+        lowered, count = re.subn(pattern, " ", lowered)
+        if not count:
+            continue
+        if field in fields and fields[field] != value:
+            if strict:
+                return None  # conflicting values, e.g. "Type 1 or Type 2"
+            conflicts.add(field)
+        fields[field] = value
+    for field in conflicts:
+        del fields[field]
+
+    leftover = re.findall(r"[a-z0-9']+", lowered)
+    if strict and any(word not in FILLER for word in leftover):
+        return None
+    return UserQuery(city=" ".join(city_words).strip(".,'") or None, **places, **fields)
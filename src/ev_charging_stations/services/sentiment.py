@@ -0,0 +1,205 @@
+"""
+Sentiment scoring behind one batch interface.
+
+`SentimentService.score(texts)` returns a polarity in [-1, 1] per text (None
+for empty text). Texts are deduplicated by hash and looked up in an optional
+cache first, so a repeated review is scored once; the rest are scored in
+chunks by the configured backend (TextBlob, or VADER when installed), on a
+process pool when there is more than one chunk. `score_async` does the same
+from an event loop without blocking it.
+"""
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Optional
+
+from textblob import TextBlob
+
+from src.ev_charging_stations.services.metrics import registry
+from src.ev_charging_stations.services.query_cache import SQLiteCache, TieredCache, TTLCache
+from src.ev_charging_stations.utils.config import settings
+
+texts_scored = registry.counter("ev_sentiment_texts_scored_total", "Texts run through a sentiment backend.")
+
+
+def text_hash(text) -> str:
+    """Identity of a review text for caching; surrounding whitespace is ignored."""
+    return hashlib.sha1((text or "").strip().encode("utf-8")).hexdigest()
+
+
+class SentimentBackend:
+    """Scores one text; subclasses implement `polarity`."""
+
+    name = ""
+
+    def polarity(self, text: str) -> float:
+        raise NotImplementedError
+
+    def score(self, text) -> Optional[float]:
+        try:
+            if not isinstance(text, str) or not text.strip():
+                return None
+            return round(self.polarity(text), 4)
+        except Exception as e:
+            print(f"Error analyzing: {text[:30]}... ({e})")
+            return None
+
+
+class TextBlobBackend(SentimentBackend):
+    name = "textblob"
+
+    def polarity(self, text: str) -> float:
+        return TextBlob(text).sentiment.polarity  # -1 to +1
+
+
+class VaderBackend(SentimentBackend):
+    """VADER compound score, from the `vaderSentiment` package or NLTK's port (with `vader_lexicon`)."""
+
+    name = "vader"
+
+    def __init__(self):
+        try:
+            from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        except ImportError:
+            try:
+                from nltk.sentiment.vader import SentimentIntensityAnalyzer
+            except ImportError:
+                raise RuntimeError("The vader backend needs `pip install vaderSentiment` (or nltk).") from None
+        try:
+            self._analyzer = SentimentIntensityAnalyzer()
+        except LookupError:
+            raise RuntimeError("NLTK's VADER needs its lexicon: python -m nltk.downloader vader_lexicon") from None
+
+    def polarity(self, text: str) -> float:
+        return self._analyzer.polarity_scores(text)["compound"]
+
+
+BACKENDS = {backend.name: backend for backend in (TextBlobBackend, VaderBackend)}
+
+
+@lru_cache(maxsize=None)
+def get_backend(name: str) -> SentimentBackend:
+    """The backend called `name`, built once per process."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown sentiment backend {name!r}; choose from {sorted(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+def score_chunk(backend: str, texts: list) -> list:
+    """Scores for one chunk; module-level so pool workers can run it."""
+    scorer = get_backend(backend)
+    return [scorer.score(text) for text in texts]
+
+
+class SentimentService:
+    """
+    Batch scoring with one backend. `workers` is the pool size (None: CPU
+    count, 1: score in the calling thread); the pool is started on the first
+    batch that needs it and kept until `close`.
+    """
+
+    def __init__(self, backend: Optional[str] = None, workers: Optional[int] = None,
+                 chunksize: Optional[int] = None, cache: Optional[TieredCache] = None):
+        self.backend = backend or settings.sentiment_backend
+        get_backend(self.backend)  # fail now on an unknown or missing backend
+        self.workers = settings.sentiment_workers if workers is None else workers
+        self.chunksize = chunksize or settings.sentiment_chunk_size
+        self.cache = cache
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _cache_key(self, key: str) -> str:
+        return f"{self.backend}:{key}"
+
+    def score(self, texts: list) -> list:
+        """One score per text, in input order."""
+        keys = [text_hash(text) for text in texts]
+        scores = {}
+        if self.cache is not None:
+            for key in set(keys):
+                cached = self.cache.get(self._cache_key(key))
+                if cached is not None:
+                    scores[key] = json.loads(cached)
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in scores:
+                pending.setdefault(key, text)
+        if pending:
+            for key, score in zip(pending, self._score_unique(list(pending.values()))):
+                scores[key] = score
+                if self.cache is not None:
+                    self.cache.set(self._cache_key(key), json.dumps(score))
+        return [scores[key] for key in keys]
+
+    async def score_async(self, texts: list) -> list:
+        """`score` on a worker thread, for use from async handlers."""
+        return await asyncio.to_thread(self.score, texts)
+
+    def _score_unique(self, texts: list) -> list:
+        texts_scored.inc(len(texts), backend=self.backend)
+        chunks = [texts[i:i + self.chunksize] for i in range(0, len(texts), self.chunksize)]
+        # one chunk is not worth a trip through the pool
+        if self.workers == 1 or len(chunks) <= 1:
+            return score_chunk(self.backend, texts)
+        results = self._get_pool().map(partial(score_chunk, self.backend), chunks)
+        return [score for chunk in results for score in chunk]
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # not fork: the API process has threads (and their locks) that a forked child would inherit
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def __enter__(self) -> "SentimentService":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def build_cache() -> TieredCache:
+    """Score cache from settings: in memory, plus on disk when `sentiment_cache_file` is set."""
+    return TieredCache(
+        TTLCache(maxsize=settings.sentiment_cache_size, ttl=settings.sentiment_cache_ttl_seconds),
+        SQLiteCache(settings.sentiment_cache_file, ttl=settings.sentiment_cache_ttl_seconds)
+        if settings.sentiment_cache_file else None,
+    )
+
+
+_service: Optional[SentimentService] = None
+_service_lock = threading.Lock()
+
+
+def get_sentiment_service() -> SentimentService:
+    """Shared service for the API, built from settings on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SentimentService(cache=build_cache())
+        return _service
+
+
+def close_sentiment_service():
+    global _service
+    with _service_lock:
+        if _service is not None:
+            _service.close()
+            _service = None
+
+
+# reads the service as is: a scrape must not build the pool and cache (nothing is reported until then)
+registry.register_cache("sentiment", lambda: getattr(_service, "cache", None))
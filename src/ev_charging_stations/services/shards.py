@@ -0,0 +1,367 @@
+"""
+Geo-sharded station index.
+
+With `shard_dir` set, the catalogue is split by geohash prefix
+(`shard_precision` characters; stations without coordinates form one more
+shard) and each shard is published as its own index snapshot, next to a
+catalogue-wide snapshot of review features and the position -> shard map.
+`ShardSet` answers the same calls as `StationIndex`, in catalogue positions,
+with identical results: a query only opens the shards whose bounding box
+intersects it, and when those hold at least `shard_fanout_min_stations`
+stations the per-shard work fans out across a process pool (every worker
+memory-maps the same shard files) and the partial results are merged.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from src.ev_charging_stations.models.query_models import StationOutput, StationRecord
+from src.ev_charging_stations.services.availability import min_available
+from src.ev_charging_stations.services.metrics import registry
+from src.ev_charging_stations.services.name_search import with_name_matches
+from src.ev_charging_stations.services.opening_hours import OpeningHours
+from src.ev_charging_stations.services.snapshot import (
+    MANIFEST,
+    SNAPSHOT_FORMAT,
+    DataVersionWatcher,
+    is_published,
+    prune_snapshots,
+    read_snapshot,
+    snapshot_path,
+    write_snapshot,
+)
+from src.ev_charging_stations.services.spatial import chord_to_km, km_to_chord, route_pieces, to_unit_vectors
+from src.ev_charging_stations.services.station_features import StationFeatures
+from src.ev_charging_stations.services.station_index import StationIndex, get_station_index, rescore_features, ring_radius
+from src.ev_charging_stations.utils.config import settings
+
+shard_queries = registry.counter("ev_shard_queries_total", "Per-shard searches, by where they ran.")
+
+GEOHASH_ALPHABET = np.array(list("0123456789bcdefghjkmnpqrstuvwxyz"))
+UNLOCATED = "_"
+
+
+def geohash(lat, lon, precision: int) -> np.ndarray:
+    """Geohash cells (strings of `precision` characters) for arrays of coordinates."""
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+    lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+    bits = 5 * precision
+    lon_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lon_cells = np.clip(((lon + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat_cells = np.clip(((lat + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+    code = np.zeros(len(lat), dtype=np.int64)
+    for bit in range(bits):
+        # bits alternate longitude, latitude, starting with longitude
+        cells, width = (lon_cells, lon_bits) if bit % 2 == 0 else (lat_cells, lat_bits)
+        code = (code << 1) | ((cells >> (width - 1 - bit // 2)) & 1)
+    chars = [GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision)]
+    return np.array(["".join(cell) for cell in zip(*chars)]) if chars else np.full(len(lat), "")
+
+
+def write_shard_set(directory: Path, index: StationIndex, precision: int) -> Path:
+    """Split `index` by geohash prefix and publish the shards, like `write_snapshot`, at `directory`."""
+    directory = Path(directory)
+    tmp = directory.parent / f".{directory.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+    tmp.mkdir(parents=True)
+    try:
+        cells = np.full(index.size, UNLOCATED, dtype=object)
+        located = index.store.located
+        cells[located] = geohash(index.latitude[located], index.longitude[located], precision)
+        prefixes, inverse = np.unique(cells.astype(str), return_inverse=True)
+        members = np.split(np.argsort(inverse, kind="stable"), np.cumsum(np.bincount(inverse))[:-1])
+
+        shard_of = np.empty(index.size, dtype=np.int32)
+        local_of = np.empty(index.size, dtype=np.int64)
+        shards = []
+        for number, (prefix, positions) in enumerate(zip(prefixes.tolist(), members)):
+            store = index.store.take(positions)
+            hours = OpeningHours(index.hours.table, store.data["operating_hours"].codes) \
+                if "operating_hours" in store.data else None
+            shard = StationIndex(store, features=index.features.take(positions), hours=hours)
+            write_snapshot(tmp / prefix, *shard.to_arrays())
+            shard_of[positions], local_of[positions] = number, np.arange(len(positions))
+            bounded = len(shard.tree) > 0
+            shards.append({
+                "prefix": prefix,
+                "size": len(positions),
+                "lo": shard.tree.lo[0].tolist() if bounded else None,
+                "hi": shard.tree.hi[0].tolist() if bounded else None,
+            })
+
+        features, features_meta = index.features.to_arrays()
+        arrays = {f"features.{name}": array for name, array in features.items()}
+        arrays["station_id"] = np.asarray(index.store.data["station_id"], dtype=np.int64)
+        arrays["available_chargers"] = index.stored_availability()
+        write_snapshot(tmp / "catalogue", {**arrays, "shard_of": shard_of, "local_of": local_of},
+                       {"features": features_meta})
+        (tmp / MANIFEST).write_text(json.dumps({
+            "format": SNAPSHOT_FORMAT, "precision": precision, "size": index.size, "shards": shards,
+        }))
+        os.rename(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not is_published(directory):
+            raise
+    return directory
+
+
+def shard_set_path(db_file: Optional[Path] = None, root: Optional[Path] = None) -> Path:
+    """Where the shard set for the current state of `db_file` lives."""
+    return snapshot_path(root or settings.shard_dir, Path(db_file or settings.db_file),
+                         f"shards{settings.shard_precision}")
+
+
+def publish_shard_set(db_file: Optional[Path] = None, root: Optional[Path] = None) -> Path:
+    """Build and publish the shard set for `db_file` unless it is already there."""
+    directory = shard_set_path(db_file, root)
+    if not is_published(directory):
+        write_shard_set(directory, StationIndex.from_database(db_file), settings.shard_precision)
+        prune_snapshots(directory, db_file=db_file or settings.db_file)
+    return directory
+
+
+# shard indexes opened in this process, by shard set directory, most recent set last
+_opened: OrderedDict[str, dict[str, StationIndex]] = OrderedDict()
+_opened_lock = threading.Lock()
+OPEN_SHARD_SETS = 2
+
+
+def open_shard(path: str) -> StationIndex:
+    """
+    A shard's index, memory-mapped once per process (snapshots never change).
+    Shards of the OPEN_SHARD_SETS most recently used shard sets are kept, so
+    queries still running on a replaced set finish without reopening, and
+    older sets are unmapped.
+    """
+    directory = str(Path(path).parent)
+    with _opened_lock:
+        opened = _opened.setdefault(directory, {})
+        _opened.move_to_end(directory)
+        while len(_opened) > OPEN_SHARD_SETS:
+            _opened.popitem(last=False)
+        if path not in opened:
+            opened[path] = StationIndex.from_arrays(*read_snapshot(Path(path)))
+        return opened[path]
+
+
+def run_on_shard(path: str, method: str, args: tuple):
+    """One per-shard call; module-level so pool workers can run it."""
+    return getattr(open_shard(path), method)(*args)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # not fork: the API process has threads (and their locks) that a forked child would inherit
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=settings.shard_workers,
+                                        mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def close_shard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+class ShardSet:
+    """
+    A published shard set, used like a `StationIndex`: `search`, `within`,
+    `nearest` and `corridor` take the same arguments and return catalogue
+    positions, in the same order, and `features` covers the whole catalogue
+    (with a `generation`, as a StationIndex's).
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        meta = json.loads((self.directory / MANIFEST).read_text())
+        self.size = meta["size"]
+        self.shards = meta["shards"]
+        self.paths = [str(self.directory / shard["prefix"]) for shard in self.shards]
+        self.sizes = np.array([shard["size"] for shard in self.shards], dtype=np.int64)
+        # shards without coordinates can never be near anything
+        self.lo = np.array([shard["lo"] or [np.inf] * 3 for shard in self.shards], dtype=np.float64).reshape(-1, 3)
+        self.hi = np.array([shard["hi"] or [-np.inf] * 3 for shard in self.shards], dtype=np.float64).reshape(-1, 3)
+
+        arrays, catalogue_meta = read_snapshot(self.directory / "catalogue")
+        self.features = StationFeatures.from_arrays(
+            {name: arrays[f"features.{name}"] for name in StationFeatures.ARRAYS}, catalogue_meta["features"]
+        )
+        self.generation = 0
+        self.shard_of, self.local_of = arrays["shard_of"], arrays["local_of"]
+        self.station_id = arrays["station_id"]
+        self.available_chargers = arrays["available_chargers"]
+        # catalogue positions of each shard's stations, by shard position
+        by_shard = np.lexsort((self.local_of, self.shard_of))
+        self.catalogue = np.split(by_shard, np.cumsum(self.sizes)[:-1])
+
+    def shard(self, number: int) -> StationIndex:
+        return open_shard(self.paths[number])
+
+    def bounds(self, q: np.ndarray) -> np.ndarray:
+        """Lower bound in km on the distance from `q` to any station of each shard."""
+        d = np.maximum(self.lo - q, 0) + np.maximum(q - self.hi, 0)
+        return chord_to_km(np.sqrt(np.einsum("ij,ij->i", d, d)))
+
+    def _run(self, filters: dict, method: str, shards, args: tuple) -> list:
+        """`method(*args)` on each shard, across the pool when the shards are big enough."""
+        shards = list(shards)
+        fan_out = (
+            len(shards) > 1 and settings.shard_workers != 1
+            and self.sizes[shards].sum() >= settings.shard_fanout_min_stations
+            # live availability is only in this process's overlay
+            and not min_available(filters)
+        )
+        shard_queries.inc(len(shards), where="pool" if fan_out else "local")
+        if fan_out:
+            # workers have no database connection: look names up here, once
+            args = (with_name_matches(filters), *args[1:])
+            return list(_get_pool().map(run_on_shard, [self.paths[s] for s in shards],
+                                        [method] * len(shards), [args] * len(shards)))
+        return [run_on_shard(self.paths[s], method, args) for s in shards]
+
+    def _merge(self, shards, positions: list) -> np.ndarray:
+        if not positions:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.catalogue[s][p] for s, p in zip(shards, positions)])
+
+    def search(self, filters: dict, initial_radius=20, max_radius=600, step=30) -> np.ndarray:
+        """As `StationIndex.search`: rings out to the nearest match, then everything inside that ring."""
+        if not (filters.get("latitude") and filters.get("longitude")):
+            shards = range(len(self.shards))
+            return np.sort(self._merge(shards, self._run(filters, "search", shards, (filters,))))
+
+        bounds = self.bounds(to_unit_vectors(filters["latitude"], filters["longitude"]))
+        nearest = np.inf
+        for number in np.argsort(bounds, kind="stable").tolist():
+            if bounds[number] > min(nearest, max_radius):
+                break
+            _, distances = self.shard(number).nearest(filters, 1, max_radius)
+            if len(distances):
+                nearest = min(nearest, float(distances[0]))
+        if nearest == np.inf:
+            return np.empty(0, dtype=np.int64)
+        radius = ring_radius(nearest, initial_radius, step)
+        if radius > max_radius:
+            return np.empty(0, dtype=np.int64)
+        return self.within(filters, radius, bounds=bounds)
+
+    def within(self, filters: dict, radius: float, bounds: Optional[np.ndarray] = None) -> np.ndarray:
+        """Catalogue positions matching `filters` within `radius` km of the query point, in catalogue order."""
+        if bounds is None:
+            bounds = self.bounds(to_unit_vectors(filters["latitude"], filters["longitude"]))
+        shards = np.flatnonzero(bounds <= radius * (1 + 1e-9)).tolist()
+        return np.sort(self._merge(shards, self._run(filters, "within", shards, (filters, radius))))
+
+    def nearest(self, filters: dict, k: int, max_radius: float = 600) -> tuple[np.ndarray, np.ndarray]:
+        """As `StationIndex.nearest`: each candidate shard's k nearest, merged."""
+        bounds = self.bounds(to_unit_vectors(filters["latitude"], filters["longitude"]))
+        order = np.argsort(bounds, kind="stable")
+        shards = order[bounds[order] <= max_radius * (1 + 1e-9)].tolist()
+        if not shards:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if self.sizes[shards].sum() >= settings.shard_fanout_min_stations:
+            results = self._run(filters, "nearest", shards, (filters, k, max_radius))
+        else:
+            # nearest shards first; stop once a shard cannot beat the k-th best
+            results, found = [], []
+            for number in shards:
+                if len(found) >= k and bounds[number] > np.partition(found, k - 1)[k - 1]:
+                    shards = shards[:len(results)]
+                    break
+                results.append(run_on_shard(self.paths[number], "nearest", (filters, k, max_radius)))
+                found.extend(results[-1][1].tolist())
+        positions = self._merge(shards, [p for p, _ in results])
+        distances = np.concatenate([d for _, d in results])
+        best = np.lexsort((positions, distances))[:k]
+        return positions[best], distances[best]
+
+    def corridor(self, filters: dict, buffer_km: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """As `StationIndex.corridor`, on the shards within `buffer_km` of some piece of the route."""
+        _, _, midpoints, lengths = route_pieces(filters["route"], buffer_km)
+        reach = np.array([km_to_chord(length / 2 + buffer_km) for length in lengths]) * (1 + 1e-9)
+        d = np.maximum(self.lo[:, None] - midpoints[None], 0) + np.maximum(midpoints[None] - self.hi[:, None], 0)
+        shards = np.flatnonzero((np.sqrt(np.einsum("spk,spk->sp", d, d)) <= reach).any(axis=1)).tolist()
+        results = self._run(filters, "corridor", shards, (filters, buffer_km))
+        positions = self._merge(shards, [p for p, _, _ in results])
+        if not len(positions):
+            return positions, np.empty(0), np.empty(0)
+        off_route = np.concatenate([off for _, off, _ in results])
+        along = np.concatenate([a for _, _, a in results])
+        order = np.lexsort((positions, along))
+        return positions[order], off_route[order], along[order]
+
+    def station_ids(self, positions) -> np.ndarray:
+        return self.station_id[np.asarray(positions, dtype=np.int64)]
+
+    def stored_availability(self) -> np.ndarray:
+        return self.available_chargers
+
+    def to_records(self, positions, distances=None) -> List[StationRecord]:
+        """Records in the order of `positions`, each built by its own shard."""
+        positions = np.asarray(positions, dtype=np.int64)
+        shards, local = self.shard_of[positions], self.local_of[positions]
+        records = [None] * len(positions)
+        for number in np.unique(shards).tolist():
+            picked = np.flatnonzero(shards == number)
+            part = self.shard(number).to_records(local[picked], None if distances is None else distances[picked])
+            for i, record in zip(picked.tolist(), part):
+                records[i] = record
+        return records
+
+    def to_outputs(self, positions, distances=None) -> List[StationOutput]:
+        return [record.to_output() for record in self.to_records(positions, distances)]
+
+
+def open_shard_set(db_file: Optional[Path] = None) -> ShardSet:
+    """Shard set for the current state of `db_file`, published first if no worker has done so yet."""
+    return ShardSet(publish_shard_set(db_file))
+
+
+_shards: Optional[ShardSet] = None
+_watcher: Optional[DataVersionWatcher] = None
+_next_check = 0.0
+_shards_lock = threading.Lock()
+
+
+def get_shard_set() -> ShardSet:
+    """Shared shard set, reopened when the database changes (as `get_station_index`)."""
+    global _shards, _watcher, _next_check
+    if _shards is None or time.monotonic() >= _next_check:
+        with _shards_lock:
+            if _watcher is None:
+                _watcher = DataVersionWatcher(Path(settings.db_file))
+            _next_check = time.monotonic() + settings.snapshot_check_interval
+            try:
+                if _shards is None or _watcher.changed():
+                    _shards = open_shard_set(_watcher.db_file)
+                rescore_features(_shards)
+            except Exception as e:
+                if _shards is None:
+                    raise
+                print(f"⚠️ Shard set reload failed: {e}")
+    return _shards
+
+
+def get_search_index():
+    """What searches run on: the shard set when `shard_dir` is set, else the station index."""
+    return get_shard_set() if settings.shard_dir else get_station_index()
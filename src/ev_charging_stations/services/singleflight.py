@@ -0,0 +1,82 @@
+"""
+Request coalescing: concurrent callers asking for the same key share one
+computation instead of each starting their own.
+
+Results are handed to every waiter as-is, so coalesce functions that return
+immutable values (or give each caller its own copy).
+"""
+
+import asyncio
+import threading
+import weakref
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from src.ev_charging_stations.services.metrics import registry
+
+T = TypeVar("T")
+
+coalesced = registry.counter("ev_singleflight_coalesced_total", "Callers served by another caller's in-flight call.")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """At most one in-flight call per key, for threads (`do`) and coroutines (`do_async`)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        # Tasks belong to the loop that created them; normally just the server's.
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """`fn()`, unless another thread is already computing `key`: then wait for its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            coalesced.inc(flight=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await `fn()` as a task shared by every concurrent caller of `key`.
+        Cancelling one caller (timeout, disconnect) does not cancel the others.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.setdefault(loop, {})
+        task = tasks.get(key)
+        if task is None:
+            task = tasks[key] = loop.create_task(fn())
+            task.add_done_callback(lambda t: self._finished(tasks, key, t))
+        else:
+            coalesced.inc(flight=self.name)
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _finished(tasks: dict, key: Hashable, task: asyncio.Task):
+        if tasks.get(key) is task:
+            del tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if every caller gave up waiting
@@ -0,0 +1,150 @@
+"""
+Immutable on-disk snapshots of NumPy arrays, shared between processes.
+
+A snapshot is a directory of `.npy` files plus a `manifest.json`. It is
+written under a temporary name and published with one `rename`, so readers
+only ever see complete snapshots. Loading memory-maps the arrays read-only,
+which lets every API worker share the same pages of the OS page cache.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 6
+MANIFEST = "manifest.json"
+# beside the snapshots of one source: the path of that source file
+SOURCE = "source"
+
+
+def source_stamp(db_file: Path) -> str:
+    """Identifies one state of a SQLite file (and its WAL) by mtime and size."""
+    parts = []
+    for path in (Path(db_file), Path(f"{db_file}-wal")):
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{stat.st_mtime_ns:x}.{stat.st_size:x}")
+    return "-".join(parts)
+
+
+def snapshot_path(root: Path, db_file: Path, kind: str) -> Path:
+    """Where the snapshot of `kind` for the current state of `db_file` lives, in this format."""
+    source = hashlib.sha1(str(Path(db_file).resolve()).encode()).hexdigest()[:12]
+    return Path(root) / f"{kind}-{source}" / f"{source_stamp(db_file)}.v{SNAPSHOT_FORMAT}"
+
+
+def is_published(directory: Path) -> bool:
+    manifest = Path(directory) / MANIFEST
+    if not manifest.exists():
+        return False
+    return json.loads(manifest.read_text()).get("format") == SNAPSHOT_FORMAT
+
+
+def write_snapshot(directory: Path, arrays: dict[str, np.ndarray], meta: dict) -> Path:
+    """
+    Write `arrays` and `meta` and publish them at `directory`. If another
+    process published the same snapshot first, theirs is kept.
+    """
+    directory = Path(directory)
+    tmp = directory.parent / f".{directory.name}.{os.getpid()}.{uuid.uuid4().hex[:8]}"
+    tmp.mkdir(parents=True)
+    try:
+        for name, array in arrays.items():
+            np.save(tmp / f"{name}.npy", np.ascontiguousarray(array), allow_pickle=False)
+        (tmp / MANIFEST).write_text(json.dumps({**meta, "format": SNAPSHOT_FORMAT}))
+        os.rename(tmp, directory)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not is_published(directory):
+            raise
+    return directory
+
+
+def read_snapshot(directory: Path) -> tuple[dict[str, np.ndarray], dict]:
+    """
+    Memory-map every array of a published snapshot, read-only. Arrays come back
+    as plain ndarray views of the mapping, which index faster than np.memmap.
+    """
+    directory = Path(directory)
+    meta = json.loads((directory / MANIFEST).read_text())
+    arrays = {
+        path.name[:-len(".npy")]: np.asarray(np.load(path, mmap_mode="r", allow_pickle=False))
+        for path in directory.glob("*.npy")
+    }
+    return arrays, meta
+
+
+def prune_snapshots(current: Path, keep: int = 2, db_file: Optional[Path] = None):
+    """
+    Delete older snapshots of the same source, keeping the newest `keep`.
+    Given the source `db_file`, also record it and delete the snapshots of
+    every other source file that no longer exists (a moved or deleted copy).
+    Processes still mapping a deleted snapshot keep their pages until they unmap.
+    """
+    current = Path(current)
+    siblings = sorted(
+        (p for p in current.parent.iterdir() if p.is_dir() and p != current and not p.name.startswith(".")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for path in siblings[max(keep - 1, 0):]:
+        shutil.rmtree(path, ignore_errors=True)
+    if db_file is not None:
+        (current.parent / SOURCE).write_text(str(Path(db_file).resolve()))
+        prune_orphans(current.parent.parent)
+
+
+def prune_orphans(root: Path):
+    """Delete the snapshots under `root` whose recorded source file is gone."""
+    for directory in Path(root).iterdir():
+        source = directory / SOURCE
+        try:
+            orphaned = not Path(source.read_text()).exists()
+        except OSError:
+            continue  # not recorded (or just deleted by another process)
+        if orphaned:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class DataVersionWatcher:
+    """
+    Cheap change detection for a SQLite file: `PRAGMA data_version` moves when
+    any other connection commits, and the file identity moves when the file
+    is replaced outright.
+    """
+
+    def __init__(self, db_file: Path):
+        self.db_file = Path(db_file)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._identity = None
+        self._version = None
+        self.changed()
+
+    def _file_identity(self):
+        stat = self.db_file.stat()
+        return stat.st_dev, stat.st_ino
+
+    def changed(self) -> bool:
+        """True if the database changed since the previous call."""
+        identity = self._file_identity()
+        replaced = self._identity is not None and identity != self._identity
+        if identity != self._identity:
+            self.close()
+            self._conn = sqlite3.connect(f"{self.db_file.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            self._identity, self._version = identity, None
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        committed = self._version is not None and version != self._version
+        self._version = version
+        return replaced or committed
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
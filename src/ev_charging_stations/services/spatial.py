@@ -0,0 +1,265 @@
+"""Spatial primitives used by the station index."""
+
+import heapq
+import math
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+
+
+def to_unit_vectors(lat, lon) -> np.ndarray:
+    """Convert lat/lon degrees to 3D unit vectors on the sphere."""
+    lat_r = np.radians(np.asarray(lat, dtype=np.float64))
+    lon_r = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat_r)
+    return np.stack((cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)), axis=-1)
+
+
+def km_to_chord(km: float) -> float:
+    """Straight-line distance through the sphere for a great-circle distance."""
+    angle = min(km / EARTH_RADIUS_KM, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+def chord_to_km(chord):
+    """Great-circle distance for a straight-line distance through the sphere."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.asarray(chord) / 2, 1.0))
+
+
+def densify(points: np.ndarray, max_km: float) -> np.ndarray:
+    """
+    Unit vectors of a polyline with points added along each great-circle leg
+    so that no piece is longer than `max_km`. Repeated points are dropped.
+    """
+    out = [points[0]]
+    for a, b in zip(points[:-1], points[1:]):
+        angle = float(np.arctan2(np.linalg.norm(np.cross(a, b)), a @ b))
+        if angle == 0:
+            continue
+        steps = max(1, math.ceil(angle * EARTH_RADIUS_KM / max_km))
+        t = np.arange(1, steps + 1)[:, None] / steps
+        out.extend((np.sin((1 - t) * angle) * a + np.sin(t * angle) * b) / np.sin(angle))
+    return np.array(out)
+
+
+def segment_distances(points: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Great-circle distance (km) from every point to every arc start -> end, and
+    how far along each arc (km) the closest point on it lies; both (m, s).
+
+    A point whose projection onto the arc's great circle falls inside the arc
+    is as far as its cross-track angle; otherwise the nearer endpoint is
+    closest. Arcs must be shorter than half the circle (see `densify`).
+    """
+    normals = np.cross(starts, ends)
+    sines = np.linalg.norm(normals, axis=1)
+    lengths = np.arctan2(sines, np.einsum("ij,ij->i", starts, ends))
+    degenerate = sines < 1e-15
+    normals = normals / np.where(degenerate, 1.0, sines)[:, None]
+
+    # Signed cross-track sine, then the along-track angle of the projection:
+    # the component along each start and along normal x start.
+    cross_track = points @ normals.T
+    along = np.arctan2(points @ np.cross(normals, starts).T, points @ starts.T)
+    inside = (along >= 0) & (along <= lengths) & ~degenerate
+
+    to_start = np.arccos(np.clip(points @ starts.T, -1.0, 1.0))
+    to_end = np.arccos(np.clip(points @ ends.T, -1.0, 1.0))
+    distances = np.where(inside, np.abs(np.arcsin(np.clip(cross_track, -1.0, 1.0))), np.minimum(to_start, to_end))
+    along = np.where(inside, along, np.where(to_start <= to_end, 0.0, lengths))
+    return distances * EARTH_RADIUS_KM, along * EARTH_RADIUS_KM
+
+
+def route_pieces(route, buffer_km: float) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    A [lat, lon] polyline cut into great-circle pieces of at most
+    `2 * buffer_km` (5 km or more), as unit-vector starts, ends and
+    midpoints plus lengths in km. A single stop is one zero-length piece.
+    """
+    route = np.asarray(route, dtype=np.float64).reshape(-1, 2)
+    points = densify(to_unit_vectors(route[:, 0], route[:, 1]), max(2 * buffer_km, 5.0))
+    if len(points) == 1:
+        points = np.repeat(points, 2, axis=0)
+    starts, ends = points[:-1], points[1:]
+    midpoints = starts + ends
+    midpoints /= np.maximum(np.linalg.norm(midpoints, axis=1), 1e-15)[:, None]
+    return starts, ends, midpoints, chord_to_km(np.linalg.norm(ends - starts, axis=1))
+
+
+class KDTree:
+    """
+    Static k-d tree over unit vectors.
+
+    Working in 3D avoids the dateline and pole special cases of a lat/lon grid,
+    and chord length is monotonic in great-circle distance, so bounding boxes
+    can be used to prune both range and nearest-neighbour queries.
+    """
+
+    def __init__(self, points: np.ndarray, leaf_size: int = 32):
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(points))
+        self._points = points
+        self._lo, self._hi, self._start, self._end, self._left, self._right = [], [], [], [], [], []
+        if len(points):
+            self._build(0, len(points))
+        self.points = points[self.order]
+        self.lo = np.array(self._lo).reshape(-1, 3)
+        self.hi = np.array(self._hi).reshape(-1, 3)
+        self.start = np.array(self._start, dtype=np.int64)
+        self.end = np.array(self._end, dtype=np.int64)
+        self.left = np.array(self._left, dtype=np.int64)
+        self.right = np.array(self._right, dtype=np.int64)
+        del self._points, self._lo, self._hi, self._start, self._end, self._left, self._right
+
+    ARRAYS = ("order", "points", "lo", "hi", "start", "end", "left", "right")
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, leaf_size: int = 32) -> "KDTree":
+        """Rebuild a tree from `to_arrays()` output (e.g. memory-mapped) without re-partitioning."""
+        tree = cls.__new__(cls)
+        tree.leaf_size = leaf_size
+        for name in cls.ARRAYS:
+            setattr(tree, name, arrays[name])
+        return tree
+
+    def to_arrays(self) -> dict:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def __len__(self):
+        return len(self.order)
+
+    def _build(self, start: int, end: int) -> int:
+        idx = self.order[start:end]
+        pts = self._points[idx]
+        lo, hi = pts.min(axis=0), pts.max(axis=0)
+        node = len(self._start)
+        self._lo.append(lo)
+        self._hi.append(hi)
+        self._start.append(start)
+        self._end.append(end)
+        self._left.append(-1)
+        self._right.append(-1)
+        if end - start > self.leaf_size:
+            axis = int(np.argmax(hi - lo))
+            mid = (end - start) // 2
+            part = np.argpartition(pts[:, axis], mid)
+            self.order[start:end] = idx[part]
+            self._left[node] = self._build(start, start + mid)
+            self._right[node] = self._build(start + mid, end)
+        return node
+
+    def _min_dist(self, node: int, q: np.ndarray) -> float:
+        d = np.maximum(self.lo[node] - q, 0) + np.maximum(q - self.hi[node], 0)
+        return float(np.sqrt(d @ d))
+
+    def _max_dist(self, node: int, q: np.ndarray) -> float:
+        d = np.maximum(np.abs(q - self.lo[node]), np.abs(q - self.hi[node]))
+        return float(np.sqrt(d @ d))
+
+    def query_radius(self, q: np.ndarray, chord: float) -> np.ndarray:
+        """Positions (into the original points) within `chord` of `q`."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        # Nodes entirely inside the sphere are taken whole; the small margin
+        # keeps boundary points for the exact per-point check below.
+        inner = chord * (1 - 1e-9)
+        chunks = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._min_dist(node, q) > chord:
+                continue
+            start, end = self.start[node], self.end[node]
+            if self._max_dist(node, q) <= inner:
+                chunks.append(self.order[start:end])
+            elif self.left[node] < 0:
+                d = self.points[start:end] - q
+                hit = np.einsum("ij,ij->i", d, d) <= chord * chord
+                chunks.append(self.order[start:end][hit])
+            else:
+                stack.append(self.left[node])
+                stack.append(self.right[node])
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def nearest(self, q: np.ndarray, mask: Optional[np.ndarray] = None) -> Optional[tuple[int, float]]:
+        """
+        Best-first search for the closest point, optionally restricted to
+        positions where `mask` is true. Returns (position, chord) or None.
+        """
+        if not len(self):
+            return None
+        best, best_d = None, np.inf
+        heap = [(self._min_dist(0, q), 0)]
+        while heap:
+            bound, node = heapq.heappop(heap)
+            if bound >= best_d:
+                break
+            start, end = self.start[node], self.end[node]
+            if self.left[node] < 0:
+                positions = self.order[start:end]
+                pts = self.points[start:end]
+                if mask is not None:
+                    keep = mask[positions]
+                    positions, pts = positions[keep], pts[keep]
+                if len(positions):
+                    d = pts - q
+                    d2 = np.einsum("ij,ij->i", d, d)
+                    i = int(np.argmin(d2))
+                    if d2[i] < best_d * best_d:
+                        best, best_d = int(positions[i]), float(np.sqrt(d2[i]))
+                continue
+            for child in (self.left[node], self.right[node]):
+                child_bound = self._min_dist(child, q)
+                if child_bound < best_d:
+                    heapq.heappush(heap, (child_bound, child))
+        return None if best is None else (best, best_d)
+
+    def nearest_k(self, q: np.ndarray, k: int, mask: Optional[np.ndarray] = None,
+                  max_chord: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The k closest points within `max_chord` of `q` (optionally only where
+        `mask` is true), by best-first search: the pruning radius shrinks to
+        the current k-th best as soon as k points are found. Returns
+        (positions, chords), closest first.
+        """
+        if not len(self) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # max-heap of (-chord, -position): the worst kept point is the farthest,
+        # and of equally far ones the last by position, so ties at the k-th
+        # place break by position whatever order the leaves are visited in
+        best: list[tuple[float, int]] = []
+        bound = max_chord
+        heap = [(self._min_dist(0, q), 0)]
+        while heap:
+            node_bound, node = heapq.heappop(heap)
+            if node_bound > bound:
+                break
+            start, end = self.start[node], self.end[node]
+            if self.left[node] < 0:
+                positions = self.order[start:end]
+                pts = self.points[start:end]
+                if mask is not None:
+                    keep = mask[positions]
+                    positions, pts = positions[keep], pts[keep]
+                d = pts - q
+                chords = np.sqrt(np.einsum("ij,ij->i", d, d))
+                hit = chords <= bound
+                for chord, position in zip(chords[hit].tolist(), positions[hit].tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-chord, -position))
+                    elif (-chord, -position) > best[0]:
+                        heapq.heapreplace(best, (-chord, -position))
+                if len(best) == k:
+                    bound = min(bound, -best[0][0])
+                continue
+            for child in (self.left[node], self.right[node]):
+                child_bound = self._min_dist(child, q)
+                if child_bound <= bound:
+                    heapq.heappush(heap, (child_bound, child))
+        best.sort(reverse=True)
+        return (
+            np.array([-position for _, position in best], dtype=np.int64),
+            np.array([-chord for chord, _ in best], dtype=np.float64),
+        )
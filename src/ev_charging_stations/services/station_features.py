@@ -0,0 +1,359 @@
+"""
+Per-station review features: materialized in SQLite, held as arrays next to
+the station index.
+
+`station_features` keeps sufficient statistics per reviewed station (review
+and scored counts, sentiment sum, recency-weighted sums, preferred speed and
+connector counts). Triggers on `user_reviews` queue the stations whose
+reviews changed, and `refresh_station_features` re-aggregates just those.
+
+At load the statistics become arrays aligned with the station store: a
+Bayesian-smoothed sentiment, a recency-decayed review score, and every
+station's rank by that score, so ordering by reviews is an array lookup
+instead of a per-request aggregate and sort.
+
+The recency fade depends on the current time, so the score and rank are
+only exact when computed. The decayed sums and each station's latest review
+day are kept with them, and the shared index rescores from those arrays
+(no database read) once they are `review_rescore_seconds` old: between
+rescores a score lags by at most that much of a half-life.
+"""
+
+import json
+import math
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.ev_charging_stations.services.station_store import StationStore
+from src.ev_charging_stations.utils.config import settings
+
+# Pseudo-reviews at the catalogue mean added to every station, so a couple of
+# glowing reviews do not outrank a long record of good ones.
+REVIEW_PRIOR = 5
+
+PREFERENCES = ("speed", "type")
+# Part of a station's quality that comes from its reviewers preferring the
+# charging speed or type a query names (see StationFeatures.quality).
+PREFERENCE_WEIGHT = 0.25
+
+MARK_ALL_DIRTY = """
+INSERT OR IGNORE INTO station_features_dirty (station_id)
+SELECT station_id FROM station_features UNION SELECT station_id FROM user_reviews
+"""
+
+# Recency weights are relative to each station's latest review (so they stay
+# in (0, 1]); the age of that review is applied when the features are loaded.
+REFRESH_FEATURES = """
+WITH reviews AS (
+    SELECT station_id, sentiment_score AS score,
+           preferred_charging_speed AS speed, preferred_charging_type AS type,
+           julianday(COALESCE(created_at, 'now')) AS day
+    FROM user_reviews
+    WHERE station_id IN (SELECT station_id FROM station_features_dirty)
+),
+latest AS (SELECT station_id, MAX(day) AS day FROM reviews GROUP BY station_id),
+speeds AS (
+    SELECT station_id, json_group_object(speed, n) AS counts FROM (
+        SELECT station_id, speed, COUNT(*) AS n FROM reviews WHERE speed IS NOT NULL GROUP BY station_id, speed
+    ) GROUP BY station_id
+),
+types AS (
+    SELECT station_id, json_group_object(type, n) AS counts FROM (
+        SELECT station_id, type, COUNT(*) AS n FROM reviews WHERE type IS NOT NULL GROUP BY station_id, type
+    ) GROUP BY station_id
+)
+INSERT INTO station_features (
+    station_id, review_count, scored_count, sentiment_sum, decayed_sum, decayed_weight, last_review_day,
+    speed_counts, type_counts
+)
+SELECT r.station_id, COUNT(*), COUNT(r.score), TOTAL(r.score),
+       TOTAL(r.score * decay(l.day - r.day, :half_life)),
+       TOTAL(CASE WHEN r.score IS NOT NULL THEN decay(l.day - r.day, :half_life) END),
+       l.day, COALESCE(s.counts, '{}'), COALESCE(t.counts, '{}')
+FROM reviews r
+JOIN latest l ON l.station_id = r.station_id
+LEFT JOIN speeds s ON s.station_id = r.station_id
+LEFT JOIN types t ON t.station_id = r.station_id
+GROUP BY r.station_id
+"""
+
+FEATURES_QUERY = """
+SELECT station_id, review_count, scored_count, sentiment_sum, decayed_sum, decayed_weight, last_review_day,
+       speed_counts, type_counts
+FROM station_features
+"""
+
+# Databases without the feature table: the station averages, as if just reviewed.
+LEGACY_QUERY = """
+SELECT station_id, num_reviews, num_reviews, avg_sentiment * num_reviews, avg_sentiment * num_reviews,
+       num_reviews, NULL, '{}', '{}'
+FROM charging_stations
+WHERE num_reviews > 0 AND avg_sentiment IS NOT NULL
+"""
+
+
+def decay(age_days, half_life: float) -> float:
+    return 1.0 if age_days is None else 0.5 ** (age_days / half_life)
+
+
+def _register_decay(conn: sqlite3.Connection):
+    """
+    SQL `decay(age_days, half_life)`, once per connection: replacing a
+    function fails while any statement on the connection is unfinished.
+    """
+    try:
+        conn.execute("SELECT decay(0, 1)").fetchall()
+    except sqlite3.OperationalError:
+        conn.create_function("decay", 2, decay, deterministic=True)
+
+
+def refresh_station_features(conn: sqlite3.Connection, full: bool = False) -> int:
+    """
+    Re-aggregate the stations queued by the review triggers (every station
+    with `full`). Runs in the caller's transaction. Returns the number of
+    stations refreshed.
+    """
+    _register_decay(conn)
+    if full:
+        conn.execute(MARK_ALL_DIRTY)
+    dirty = conn.execute("SELECT COUNT(*) FROM station_features_dirty").fetchone()[0]
+    if dirty:
+        conn.execute("DELETE FROM station_features WHERE station_id IN (SELECT station_id FROM station_features_dirty)")
+        conn.execute(REFRESH_FEATURES, {"half_life": settings.review_half_life_days})
+        conn.execute("DELETE FROM station_features_dirty")
+    return dirty
+
+
+def julian_day(timestamp: float) -> float:
+    return timestamp / 86400 + 2440587.5
+
+
+def read_statistics(conn: sqlite3.Connection) -> list[tuple]:
+    """Rows of `station_features`, or equivalent rows from the station averages."""
+    has_table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'station_features'"
+    ).fetchone()
+    return conn.execute(FEATURES_QUERY if has_table else LEGACY_QUERY).fetchall()
+
+
+def faded_scores(decayed_sum: np.ndarray, decayed_weight: np.ndarray, last_day: np.ndarray, prior: float,
+                 now: Optional[float] = None) -> np.ndarray:
+    """
+    review_score at `now` from the decayed sums, which are relative to each
+    station's latest review (`last_day`, NaN when unknown: not faded).
+    """
+    age = np.nan_to_num(julian_day(time.time() if now is None else now) - last_day).clip(min=0)
+    fade = decay(age, settings.review_half_life_days)
+    return (decayed_sum * fade + REVIEW_PRIOR * prior) / (decayed_weight * fade + REVIEW_PRIOR)
+
+
+def statistics_columns(rows: list[tuple]) -> dict[str, np.ndarray]:
+    """The numeric columns of statistics rows as arrays."""
+    columns = list(zip(*rows)) or [()] * 9
+    return {
+        "scored": np.array(columns[2], dtype=np.float64),
+        "sums": np.array(columns[3], dtype=np.float64),
+        "decayed_sum": np.array(columns[4], dtype=np.float64),
+        "decayed_weight": np.array(columns[5], dtype=np.float64),
+        "last_review_day": np.array([math.nan if d is None else d for d in columns[6]], dtype=np.float64),
+    }
+
+
+def smoothed_scores(rows: list[tuple], now: Optional[float] = None) -> tuple[np.ndarray, np.ndarray, float]:
+    """
+    (bayes_sentiment, review_score) per row, and the prior mean both are
+    smoothed towards (the mean of every scored review, 0 if none).
+    """
+    columns = statistics_columns(rows)
+    scored, sums = columns["scored"], columns["sums"]
+    prior = float(sums.sum() / scored.sum()) if scored.sum() > 0 else 0.0
+    bayes = (sums + REVIEW_PRIOR * prior) / (scored + REVIEW_PRIOR)
+    score = faded_scores(columns["decayed_sum"], columns["decayed_weight"], columns["last_review_day"], prior, now)
+    return bayes, score, prior
+
+
+def review_scores(conn: sqlite3.Connection, now: Optional[float] = None) -> tuple[dict[int, float], float]:
+    """review_score by station_id, plus the score of a station without reviews."""
+    rows = read_statistics(conn)
+    _, scores, prior = smoothed_scores(rows, now)
+    return dict(zip([row[0] for row in rows], scores.tolist())), prior
+
+
+class StationFeatures:
+    """
+    Review features of every station in a store, by position.
+
+    `review_score` is the recency-weighted mean sentiment, smoothed towards
+    the catalogue mean with REVIEW_PRIOR pseudo-reviews (`bayes_sentiment`
+    is the same without recency), as of `scored_at`. `order` lists positions
+    best first, ties in catalogue order, and `rank` is each position's place
+    in it. The decayed sums behind the score are kept so `rescored` can move
+    it to a later time. Preference shares are kept for reviewed stations only
+    (`reviewed`, sorted positions).
+    """
+
+    ARRAYS = ("review_count", "bayes_sentiment", "review_score", "order", "rank", "reviewed",
+              "speed_share", "type_share", "decayed_sum", "decayed_weight", "last_review_day")
+
+    def __init__(self, review_count: np.ndarray, bayes_sentiment: np.ndarray, review_score: np.ndarray,
+                 reviewed: np.ndarray, speed_share: np.ndarray, type_share: np.ndarray,
+                 categories: dict[str, list[str]], decayed_sum: np.ndarray, decayed_weight: np.ndarray,
+                 last_review_day: np.ndarray, prior: float, scored_at: float):
+        self.review_count = review_count
+        self.bayes_sentiment = bayes_sentiment
+        self.review_score = review_score
+        self.reviewed = reviewed
+        self.speed_share = speed_share
+        self.type_share = type_share
+        self.categories = categories
+        self.decayed_sum = decayed_sum
+        self.decayed_weight = decayed_weight
+        self.last_review_day = last_review_day
+        self.prior = prior
+        self.scored_at = scored_at
+        self.order = np.argsort(-review_score, kind="stable")
+        self.rank = np.empty_like(self.order)
+        self.rank[self.order] = np.arange(len(self.order))
+
+    @classmethod
+    def from_statistics(cls, size: int, positions: np.ndarray, rows: list[tuple],
+                        now: Optional[float] = None) -> "StationFeatures":
+        """Features for a store of `size` stations from statistics rows at `positions`."""
+        now = time.time() if now is None else now
+        bayes, score, prior = smoothed_scores(rows, now)
+        columns = statistics_columns(rows)
+        review_count = np.zeros(size, dtype=np.int64)
+        bayes_sentiment = np.full(size, prior)
+        review_score = np.full(size, prior)
+        decayed_sum, decayed_weight = np.zeros(size), np.zeros(size)
+        last_review_day = np.full(size, math.nan)
+        sort = np.argsort(positions, kind="stable")
+        positions = np.asarray(positions, dtype=np.int64)[sort]
+        review_count[positions] = [rows[i][1] for i in sort]
+        bayes_sentiment[positions] = bayes[sort]
+        review_score[positions] = score[sort]
+        decayed_sum[positions] = columns["decayed_sum"][sort]
+        decayed_weight[positions] = columns["decayed_weight"][sort]
+        last_review_day[positions] = columns["last_review_day"][sort]
+
+        shares, categories = {}, {}
+        for column, field in enumerate(PREFERENCES, start=7):
+            counts = [json.loads(rows[i][column]) for i in sort]
+            categories[field] = sorted({value for c in counts for value in c})
+            matrix = np.array(
+                [[c.get(value, 0) for value in categories[field]] for c in counts], dtype=np.float32
+            ).reshape(len(counts), len(categories[field]))
+            totals = matrix.sum(axis=1, keepdims=True)
+            shares[field] = np.divide(matrix, totals, out=np.zeros_like(matrix), where=totals > 0)
+        return cls(review_count, bayes_sentiment, review_score, positions, shares["speed"], shares["type"],
+                   categories, decayed_sum, decayed_weight, last_review_day, prior, now)
+
+    @classmethod
+    def from_store(cls, store: StationStore) -> "StationFeatures":
+        """From the store's avg_sentiment/num_reviews columns (no review table)."""
+        def column(name):
+            if name not in store.data:
+                return np.full(store.size, math.nan)
+            return np.asarray(store.data[name], dtype=np.float64)
+
+        avg, num = column("avg_sentiment"), column("num_reviews")
+        positions = np.flatnonzero(~np.isnan(avg) & (num > 0))
+        rows = [
+            (None, int(n), n, a * n, a * n, n, None, "{}", "{}")
+            for a, n in zip(avg[positions].tolist(), num[positions].tolist())
+        ]
+        return cls.from_statistics(store.size, positions, rows)
+
+    @classmethod
+    def from_database(cls, store: StationStore, db_file: Optional[Path] = None) -> "StationFeatures":
+        conn = sqlite3.connect(db_file or settings.db_file)
+        try:
+            rows = read_statistics(conn)
+        finally:
+            conn.close()
+        ids = np.asarray(store.data["station_id"], dtype=np.int64)
+        sorter = np.argsort(ids)
+        row_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        found = sorter[np.searchsorted(ids, row_ids, sorter=sorter).clip(max=max(len(ids) - 1, 0))]
+        keep = ids[found] == row_ids if len(ids) else np.zeros(len(rows), dtype=bool)
+        return cls.from_statistics(store.size, found[keep], [row for row, k in zip(rows, keep) if k])
+
+    def to_arrays(self) -> tuple[dict, dict]:
+        meta = {"categories": self.categories, "prior": self.prior, "scored_at": self.scored_at}
+        return {name: getattr(self, name) for name in self.ARRAYS}, meta
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, meta: dict) -> "StationFeatures":
+        features = cls.__new__(cls)
+        for name in cls.ARRAYS:
+            setattr(features, name, arrays[name])
+        features.categories = meta["categories"]
+        features.prior, features.scored_at = meta["prior"], meta["scored_at"]
+        return features
+
+    def rescored(self, now: Optional[float] = None) -> "StationFeatures":
+        """These features with review_score, order and rank recomputed for `now` (default: the current time)."""
+        now = time.time() if now is None else now
+        score = faded_scores(self.decayed_sum, self.decayed_weight, self.last_review_day, self.prior, now)
+        return StationFeatures(
+            self.review_count, self.bayes_sentiment, score, self.reviewed, self.speed_share, self.type_share,
+            self.categories, self.decayed_sum, self.decayed_weight, self.last_review_day, self.prior, now,
+        )
+
+    def current(self, max_age: float, now: Optional[float] = None) -> "StationFeatures":
+        """These features, or `rescored` ones once they were scored more than `max_age` seconds ago."""
+        now = time.time() if now is None else now
+        return self if now - self.scored_at <= max_age else self.rescored(now)
+
+    def take(self, positions) -> "StationFeatures":
+        """Features of the stations at `positions` (sorted), for a store of just those."""
+        positions = np.asarray(positions, dtype=np.int64)
+        at = np.searchsorted(self.reviewed, positions).clip(max=max(len(self.reviewed) - 1, 0))
+        hit = self.reviewed[at] == positions if len(self.reviewed) else np.zeros(len(positions), dtype=bool)
+        return StationFeatures(
+            self.review_count[positions], self.bayes_sentiment[positions], self.review_score[positions],
+            np.flatnonzero(hit), self.speed_share[at[hit]], self.type_share[at[hit]], self.categories,
+            self.decayed_sum[positions], self.decayed_weight[positions], self.last_review_day[positions],
+            self.prior, self.scored_at,
+        )
+
+    def quality(self, positions, filters: Optional[dict] = None) -> np.ndarray:
+        """
+        review_score at `positions` mapped to [0, 1]. When `filters` name a
+        charging speed or type, PREFERENCE_WEIGHT of it is instead the share
+        of each station's reviewers who prefer that speed or type (averaged
+        if both are named), so it stays in [0, 1].
+        """
+        quality = (np.clip(self.review_score[positions], -1, 1) + 1) / 2
+        filters = filters or {}
+        named = [(field, filters[f"charging_{field}"]) for field in PREFERENCES if filters.get(f"charging_{field}")]
+        if not named:
+            return quality
+        share = sum(self.preference_share(field, value, positions) for field, value in named) / len(named)
+        return (1 - PREFERENCE_WEIGHT) * quality + PREFERENCE_WEIGHT * share
+
+    def best_first(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Distinct `positions` ordered by review_score, best first. Large sets
+        are read off the precomputed order; small ones sort their ranks.
+        """
+        if len(positions) * 8 < len(self.order):
+            return positions[np.argsort(self.rank[positions])]
+        member = np.zeros(len(self.order), dtype=bool)
+        member[positions] = True
+        return self.order[member[self.order]]
+
+    def preference_share(self, field: str, value: str, positions) -> np.ndarray:
+        """Share of reviewers at `positions` who prefer `value` for "speed" or "type" (0 if unreviewed)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        shares = np.zeros(len(positions), dtype=np.float32)
+        if value not in self.categories[field] or not len(self.reviewed):
+            return shares
+        at = np.searchsorted(self.reviewed, positions).clip(max=len(self.reviewed) - 1)
+        hit = self.reviewed[at] == positions
+        shares[hit] = getattr(self, f"{field}_share")[at[hit], self.categories[field].index(value)]
+        return shares
@@ -0,0 +1,383 @@
+"""
+In-memory station index, loaded once and reused across requests.
+
+The shared index is memory-mapped from an immutable snapshot (see
+`services.snapshot`), so every API worker maps the same pages, and it is
+swapped for a fresh one when the database changes. Its review scores are
+rescored in memory as they age (see `services.station_features`).
+"""
+
+import math
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from src.ev_charging_stations.models.query_models import StationOutput, StationRecord
+from src.ev_charging_stations.services.availability import get_availability, min_available
+from src.ev_charging_stations.services.name_search import name_matches
+from src.ev_charging_stations.services.opening_hours import OpeningHours, minute_of_week
+from src.ev_charging_stations.services.snapshot import (
+    DataVersionWatcher,
+    is_published,
+    prune_snapshots,
+    read_snapshot,
+    snapshot_path,
+    write_snapshot,
+)
+from src.ev_charging_stations.services.spatial import (
+    KDTree,
+    km_to_chord,
+    route_pieces,
+    segment_distances,
+    to_unit_vectors,
+)
+from src.ev_charging_stations.services.station_features import StationFeatures
+from src.ev_charging_stations.services.station_store import StationStore, haversine_distances
+from src.ev_charging_stations.utils.config import settings
+
+# filter key in the extracted query -> column in charging_stations
+FILTER_COLUMNS = {
+    "charging_speed": "charging_speed",
+    "charging_type": "charging_types",
+    "accessibility": "accessibility",
+}
+
+# Candidate x route-piece cells scored per vectorised pass in `corridor`.
+CORRIDOR_CHUNK = 1 << 20
+
+# Filters matching at most this many stations (e.g. a name lookup) are
+# scored directly: cheaper than a tree walk that skips almost every point.
+DIRECT_MATCHES = 8192
+
+
+def ring_radius(distance: float, initial_radius: float, step: float) -> float:
+    """The first ring of the expanding search (initial_radius, +step, ...) that reaches `distance` km."""
+    if distance <= initial_radius:
+        return initial_radius
+    return initial_radius + math.ceil((distance - initial_radius) / step) * step
+
+
+class StationIndex:
+    """
+    Station catalogue with a k-d tree over coordinates and dictionary-encoded
+    filter columns, so a query is a few integer compares plus a tree lookup
+    instead of a full table scan. Review features ride along, aligned with
+    the store, for review-aware ordering, and operating hours are parsed
+    once into minute-of-week bitsets for `open_at`. Live charger counts come
+    from the availability overlay, and provider / name matches from the
+    full-text index. `generation` counts the times `features` was rescored
+    in place, so results computed on older scores can be told apart.
+    """
+
+    def __init__(self, store: StationStore, tree: Optional[KDTree] = None, located: Optional[np.ndarray] = None,
+                 features: Optional[StationFeatures] = None, hours: Optional[OpeningHours] = None):
+        self.store = store
+        self.features = StationFeatures.from_store(store) if features is None else features
+        self.generation = 0
+        self.hours = OpeningHours.from_store(store) if hours is None else hours
+        self.size = store.size
+        self.latitude = store.latitude
+        self.longitude = store.longitude
+
+        self._located = np.flatnonzero(store.located) if located is None else located
+        if tree is None:
+            tree = KDTree(to_unit_vectors(self.latitude[self._located], self.longitude[self._located]))
+        self.tree = tree
+        self._id_order: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_database(cls, db_file: Optional[Path] = None) -> "StationIndex":
+        store = StationStore.from_database(db_file)
+        return cls(store, features=StationFeatures.from_database(store, db_file))
+
+    def to_arrays(self) -> tuple[dict, dict]:
+        arrays, meta = self.store.to_arrays()
+        arrays["located"] = self._located
+        arrays.update({f"tree.{name}": array for name, array in self.tree.to_arrays().items()})
+        meta["leaf_size"] = self.tree.leaf_size
+        features, meta["features"] = self.features.to_arrays()
+        arrays.update({f"features.{name}": array for name, array in features.items()})
+        arrays.update({f"hours.{name}": array for name, array in self.hours.to_arrays().items()})
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, meta: dict) -> "StationIndex":
+        tree = KDTree.from_arrays({name: arrays[f"tree.{name}"] for name in KDTree.ARRAYS}, meta["leaf_size"])
+        features = StationFeatures.from_arrays(
+            {name: arrays[f"features.{name}"] for name in StationFeatures.ARRAYS}, meta["features"]
+        )
+        store = StationStore.from_arrays(arrays, meta)
+        hours = OpeningHours.from_arrays({name: arrays[f"hours.{name}"] for name in OpeningHours.ARRAYS}, store)
+        return cls(store, tree, arrays["located"], features, hours)
+
+    def filter_mask(self, filters: dict) -> Optional[np.ndarray]:
+        """AND of the masks for the active filters, or None if unfiltered."""
+        mask = None
+        for key, column in FILTER_COLUMNS.items():
+            value = filters.get(key)
+            if not value:
+                continue
+            matches = self.store.data[column].mask(value)
+            mask = matches if mask is None else mask & matches
+        if filters.get("open_at"):
+            matches = self.hours.open_mask(minute_of_week(filters["open_at"]), self.size)
+            mask = matches if mask is None else mask & matches
+        minimum = min_available(filters)
+        if minimum:
+            matches = get_availability().live(self) >= minimum
+            mask = matches if mask is None else mask & matches
+        named = name_matches(filters)
+        if named is not None:
+            positions = self.positions_of(named.station_ids)
+            matches = np.zeros(self.size, dtype=bool)
+            matches[positions[positions >= 0]] = True
+            mask = matches if mask is None else mask & matches
+        return mask
+
+    def station_ids(self, positions) -> np.ndarray:
+        return np.asarray(self.store.data["station_id"], dtype=np.int64)[np.asarray(positions, dtype=np.int64)]
+
+    def positions_of(self, station_ids) -> np.ndarray:
+        """Positions of `station_ids` in this index, -1 for ids it does not have."""
+        ids = np.asarray(self.store.data["station_id"], dtype=np.int64)
+        station_ids = np.asarray(station_ids, dtype=np.int64)
+        if not len(ids):
+            return np.full(len(station_ids), -1, dtype=np.int64)
+        if self._id_order is None:
+            self._id_order = np.argsort(ids, kind="stable")
+        at = np.searchsorted(ids, station_ids, sorter=self._id_order).clip(max=len(ids) - 1)
+        return np.where(ids[self._id_order[at]] == station_ids, self._id_order[at], -1)
+
+    def search(self, filters: dict, initial_radius=20, max_radius=600, step=30) -> np.ndarray:
+        """
+        Row positions matching `filters`, in catalogue order.
+
+        Equivalent to expanding the radius by `step` until something matches:
+        the nearest matching station fixes the ring, then one range query
+        returns everything inside it.
+        """
+        mask = self.filter_mask(filters)
+
+        if not (filters.get("latitude") and filters.get("longitude")):
+            if mask is None:
+                return np.arange(self.size)
+            return np.flatnonzero(mask)
+
+        user_lat, user_lon = filters["latitude"], filters["longitude"]
+        q = to_unit_vectors(user_lat, user_lon)
+        tree_mask = None if mask is None else mask[self._located]
+
+        direct = self._direct(tree_mask, q)
+        if direct is not None:
+            positions, chords = direct
+            if not len(positions):
+                return np.empty(0, dtype=np.int64)
+            row = positions[np.argmin(chords)]
+        else:
+            nearest = self.tree.nearest(q, tree_mask)
+            if nearest is None:
+                return np.empty(0, dtype=np.int64)
+            position, _ = nearest
+            row = self._located[position]
+        distance = float(haversine_distances(user_lat, user_lon, self.latitude[row], self.longitude[row]))
+
+        radius = ring_radius(distance, initial_radius, step)
+        if radius > max_radius:
+            return np.empty(0, dtype=np.int64)
+        return self.within(filters, radius, mask)
+
+    def _direct(self, tree_mask: Optional[np.ndarray], q: np.ndarray) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        """(positions, chords to `q`) of every located match, if there are few enough to skip the tree."""
+        if tree_mask is None or np.count_nonzero(tree_mask) > DIRECT_MATCHES:
+            return None
+        positions = self._located[tree_mask]
+        d = to_unit_vectors(self.latitude[positions], self.longitude[positions]) - q
+        return positions, np.sqrt(np.einsum("ij,ij->i", d, d))
+
+    def within(self, filters: dict, radius: float, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Positions matching `filters` within `radius` km of the query point, in catalogue order."""
+        if mask is None:
+            mask = self.filter_mask(filters)
+        user_lat, user_lon = filters["latitude"], filters["longitude"]
+        # Prune with a slightly larger chord, then apply the exact haversine test.
+        q = to_unit_vectors(user_lat, user_lon)
+        if mask is not None and np.count_nonzero(mask) <= DIRECT_MATCHES:
+            candidates = np.flatnonzero(mask)
+            candidates = candidates[self.store.located[candidates]]
+        else:
+            candidates = self._located[self.tree.query_radius(q, km_to_chord(radius) * (1 + 1e-9))]
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+        distances = haversine_distances(user_lat, user_lon, self.latitude[candidates], self.longitude[candidates])
+        return np.sort(candidates[distances <= radius])
+
+    def nearest(self, filters: dict, k: int, max_radius: float = 600) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The k stations matching `filters` closest to the query point, within
+        `max_radius` km: one bounded best-first traversal of the tree.
+        Returns (positions, distances in km), closest first.
+        """
+        mask = self.filter_mask(filters)
+        user_lat, user_lon = filters["latitude"], filters["longitude"]
+        tree_mask = None if mask is None else mask[self._located]
+        q = to_unit_vectors(user_lat, user_lon)
+        max_chord = km_to_chord(max_radius) * (1 + 1e-9)
+        direct = self._direct(tree_mask, q)
+        if direct is not None:
+            # closest first, ties by position, as the tree walk orders them
+            positions, chords = direct
+            keep = chords <= max_chord
+            positions, chords = positions[keep], chords[keep]
+            positions = positions[np.lexsort((positions, chords))[:k]]
+        else:
+            found, _ = self.tree.nearest_k(q, k, tree_mask, max_chord)
+            positions = self._located[found]
+        distances = haversine_distances(user_lat, user_lon, self.latitude[positions], self.longitude[positions])
+        keep = distances <= max_radius
+        return positions[keep], distances[keep]
+
+    def corridor(self, filters: dict, buffer_km: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Stations matching `filters` within `buffer_km` of the route in
+        `filters["route"]` ([lat, lon] stops in travel order), ordered by how
+        far along the route they are. Returns (positions, km off the route,
+        km along the route).
+
+        The route is cut into pieces (see `route_pieces`); one range query
+        per piece, covering the piece and its buffer, collects candidates, and `segment_distances` measures each candidate
+        against every piece at once.
+        """
+        mask = self.filter_mask(filters)
+        starts, ends, midpoints, lengths = route_pieces(filters["route"], buffer_km)
+        offsets = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+        found = [
+            self.tree.query_radius(q, km_to_chord(length / 2 + buffer_km) * (1 + 1e-9))
+            for q, length in zip(midpoints, lengths)
+        ]
+        candidates = self._located[np.unique(np.concatenate(found))]
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+
+        off_route = np.empty(len(candidates))
+        along = np.empty(len(candidates))
+        # bound the (candidates x pieces) temporaries
+        chunk = max(1, CORRIDOR_CHUNK // len(starts))
+        for i in range(0, len(candidates), chunk):
+            rows = candidates[i:i + chunk]
+            distances, offsets_in = segment_distances(
+                to_unit_vectors(self.latitude[rows], self.longitude[rows]), starts, ends
+            )
+            closest = np.argmin(distances, axis=1)
+            picked = np.arange(len(rows))
+            off_route[i:i + chunk] = distances[picked, closest]
+            along[i:i + chunk] = offsets[closest] + offsets_in[picked, closest]
+
+        keep = off_route <= buffer_km
+        candidates, off_route, along = candidates[keep], off_route[keep], along[keep]
+        order = np.lexsort((candidates, along))
+        return candidates[order], off_route[order], along[order]
+
+    def stored_availability(self) -> np.ndarray:
+        """Available chargers by position as loaded from the database (NaN where unknown), before live updates."""
+        if "available_chargers" not in self.store.data:
+            return np.full(self.size, np.nan)
+        return np.asarray(self.store.data["available_chargers"], dtype=np.float64)
+
+    def live_columns(self, positions) -> dict:
+        """Record fields served from the availability overlay rather than the snapshot."""
+        live = get_availability().live(self)[np.asarray(positions, dtype=np.int64)]
+        return {"available_chargers": [None if np.isnan(v) else int(v) for v in live.tolist()]}
+
+    def to_records(self, positions, distances=None) -> List[StationRecord]:
+        return self.store.to_records(positions, distances, self.live_columns(positions))
+
+    def to_outputs(self, positions, distances=None) -> List[StationOutput]:
+        return self.store.to_outputs(positions, distances, self.live_columns(positions))
+
+
+def open_station_index(db_file: Optional[Path] = None) -> StationIndex:
+    """
+    Index for the current state of `db_file`, memory-mapped from its snapshot
+    (built and published first if no worker has done so yet). Without a
+    `snapshot_dir` setting the index is simply built in memory.
+    """
+    db_file = Path(db_file or settings.db_file)
+    if settings.snapshot_dir is None:
+        return StationIndex.from_database(db_file)
+    directory = snapshot_path(settings.snapshot_dir, db_file, "stations")
+    if not is_published(directory):
+        write_snapshot(directory, *StationIndex.from_database(db_file).to_arrays())
+        prune_snapshots(directory, db_file=db_file)
+    return StationIndex.from_arrays(*read_snapshot(directory))
+
+
+def rescore_features(index):
+    """
+    Replace `index.features` (of a StationIndex or ShardSet) with rescored
+    ones once they are `review_rescore_seconds` old, bumping its generation.
+    """
+    features = index.features.current(settings.review_rescore_seconds)
+    if features is not index.features:
+        index.features = features
+        index.generation += 1
+
+
+_index: Optional[StationIndex] = None
+_watcher: Optional[DataVersionWatcher] = None
+_next_check = 0.0
+_index_lock = threading.Lock()
+
+
+def _load_locked(db_file: Path):
+    global _index, _watcher, _next_check
+    if _watcher is not None:
+        _watcher.close()
+    _watcher = DataVersionWatcher(db_file)
+    _index = open_station_index(db_file)
+    rescore_features(_index)
+    _next_check = time.monotonic() + settings.snapshot_check_interval
+
+
+def load_station_index(db_file: Optional[Path] = None) -> StationIndex:
+    """(Re)load the shared index from the database and watch it for changes."""
+    with _index_lock:
+        _load_locked(Path(db_file or settings.db_file))
+        return _index
+
+
+def _refresh_station_index():
+    """
+    Swap in a new index if the database changed, and rescore its features
+    if they are due. Called with the lock held.
+    """
+    global _index, _next_check
+    _next_check = time.monotonic() + settings.snapshot_check_interval
+    try:
+        if _watcher.changed():
+            _index = open_station_index(_watcher.db_file)
+        rescore_features(_index)
+    except Exception as e:
+        # keep serving the previous snapshot; the next check retries
+        print(f"⚠️ Station index reload failed: {e}")
+
+
+def get_station_index() -> StationIndex:
+    """
+    Shared index, loaded on first use if startup did not load it. At most
+    every `snapshot_check_interval` seconds one caller checks the database for
+    changes and swaps in a new index; others keep using the current one.
+    """
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _load_locked(Path(settings.db_file))
+            return _index
+    if time.monotonic() >= _next_check and _index_lock.acquire(blocking=False):
+        try:
+            _refresh_station_index()
+        finally:
+            _index_lock.release()
+    return _index
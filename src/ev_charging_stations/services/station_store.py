@@ -0,0 +1,298 @@
+"""Columnar station store and vectorised distance kernels."""
+
+import math
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from src.ev_charging_stations.models.query_models import StationOutput, StationRecord
+from src.ev_charging_stations.services.spatial import EARTH_RADIUS_KM
+from src.ev_charging_stations.utils.config import settings
+
+
+def haversine_distances(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Haversine distance in km between broadcastable arrays of lat/lon degrees."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def top_k(distances: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Column indices and values of the k smallest entries of each row, sorted.
+    Uses argpartition so only the k survivors are fully sorted.
+    """
+    distances = np.atleast_2d(distances)
+    k = min(k, distances.shape[1])
+    if k <= 0:
+        empty = np.empty((distances.shape[0], 0))
+        return empty.astype(np.int64), empty
+    if k < distances.shape[1]:
+        part = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(k), distances.shape).copy()
+    values = np.take_along_axis(distances, part, axis=1)
+    order = np.argsort(values, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+# Low-cardinality text is dictionary-encoded, so filters are integer compares.
+CATEGORICAL_COLUMNS = ("provider", "charging_speed", "charging_types", "accessibility", "operating_hours")
+
+
+class Categorical:
+    """Text column as int32 codes into a small list of categories (-1 is NULL)."""
+
+    def __init__(self, codes: np.ndarray, categories: list[str]):
+        self.codes = codes
+        self.categories = categories
+        self._lookup = {value: i for i, value in enumerate(categories)}
+
+    @classmethod
+    def from_values(cls, values: list) -> "Categorical":
+        categories = sorted({v for v in values if v is not None})
+        lookup = {value: i for i, value in enumerate(categories)}
+        codes = np.array([-1 if v is None else lookup[v] for v in values], dtype=np.int32)
+        return cls(codes, categories)
+
+    def __getitem__(self, position) -> Optional[str]:
+        code = self.codes[position]
+        return None if code < 0 else self.categories[code]
+
+    def mask(self, value) -> np.ndarray:
+        """Rows equal to `value`; all False for a value the column never holds."""
+        code = self._lookup.get(value)
+        if code is None:
+            return np.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+
+class StringColumn:
+    """Text column packed into one UTF-8 buffer with row offsets."""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray, valid: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self.valid = valid
+
+    @classmethod
+    def from_values(cls, values: list) -> "StringColumn":
+        encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(data, offsets, np.array([v is not None for v in values], dtype=bool))
+
+    def __getitem__(self, position) -> Optional[str]:
+        if not self.valid[position]:
+            return None
+        return self.data[self.offsets[position]:self.offsets[position + 1]].tobytes().decode("utf-8")
+
+
+def encode_column(name: str, values: list):
+    """
+    Typed storage for one column: Categorical or StringColumn for text, int64
+    for non-null integers, float64 (NaN for NULL) for other numbers.
+    Returns (kind, column).
+    """
+    present = [v for v in values if v is not None]
+    if name in CATEGORICAL_COLUMNS:
+        return "category", Categorical.from_values(values)
+    if any(isinstance(v, (str, bytes)) for v in present):
+        return "string", StringColumn.from_values(values)
+    is_int = all(isinstance(v, int) for v in present)
+    if is_int and len(present) == len(values):
+        return "int", np.array(values, dtype=np.int64)
+    floats = np.array([math.nan if v is None else float(v) for v in values], dtype=np.float64)
+    return ("int" if is_int else "float"), floats
+
+
+class StationStore:
+    """
+    Station catalogue held column by column in typed, immutable arrays.
+    Coordinates are float64 (NaN when missing) so distances to every station
+    are one vectorised pass; the arrays can be memory-mapped from a snapshot.
+    """
+
+    def __init__(self, rows: list, columns: list[str]):
+        kinds, data = {}, {}
+        for i, name in enumerate(columns):
+            kinds[name], data[name] = encode_column(name, [r[i] for r in rows])
+        self._set_columns(kinds, data, len(rows))
+
+    def _set_columns(self, kinds: dict, data: dict, size: int):
+        self.kinds = kinds
+        self.data = data
+        self.columns = list(data)
+        self.size = size
+        self.latitude = self._float_column("latitude")
+        self.longitude = self._float_column("longitude")
+        self.located = ~(np.isnan(self.latitude) | np.isnan(self.longitude))
+
+    @classmethod
+    def from_database(cls, db_file: Optional[Path] = None) -> "StationStore":
+        conn = sqlite3.connect(db_file or settings.db_file)
+        try:
+            cursor = conn.execute("SELECT * FROM charging_stations")
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+        finally:
+            conn.close()
+        return cls(rows, columns)
+
+    def to_arrays(self) -> tuple[dict, dict]:
+        """Flat name -> ndarray mapping plus the metadata to rebuild the store."""
+        arrays, columns = {}, []
+        for name, kind in self.kinds.items():
+            column = self.data[name]
+            meta = {"name": name, "kind": kind}
+            if kind == "category":
+                arrays[f"{name}.codes"] = column.codes
+                meta["categories"] = column.categories
+            elif kind == "string":
+                arrays[f"{name}.data"], arrays[f"{name}.offsets"], arrays[f"{name}.valid"] = (
+                    column.data, column.offsets, column.valid
+                )
+            else:
+                arrays[name] = column
+            columns.append(meta)
+        return arrays, {"size": self.size, "columns": columns}
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, meta: dict) -> "StationStore":
+        kinds, data = {}, {}
+        for column in meta["columns"]:
+            name, kind = column["name"], column["kind"]
+            if kind == "category":
+                data[name] = Categorical(arrays[f"{name}.codes"], column["categories"])
+            elif kind == "string":
+                data[name] = StringColumn(arrays[f"{name}.data"], arrays[f"{name}.offsets"], arrays[f"{name}.valid"])
+            else:
+                data[name] = arrays[name]
+            kinds[name] = kind
+        store = cls.__new__(cls)
+        store._set_columns(kinds, data, meta["size"])
+        return store
+
+    def take(self, positions) -> "StationStore":
+        """A store of just the stations at `positions`; categories are kept as they are."""
+        positions = np.asarray(positions, dtype=np.int64)
+        data = {}
+        for name, kind in self.kinds.items():
+            column = self.data[name]
+            if kind == "category":
+                data[name] = Categorical(column.codes[positions], column.categories)
+            elif kind == "string":
+                data[name] = StringColumn.from_values(self.column_values(name, positions))
+            else:
+                data[name] = column[positions]
+        store = StationStore.__new__(StationStore)
+        store._set_columns(dict(self.kinds), data, len(positions))
+        return store
+
+    def _float_column(self, name: str) -> np.ndarray:
+        if name not in self.data:
+            return np.full(self.size, math.nan)
+        return np.asarray(self.data[name], dtype=np.float64)
+
+    def value(self, name: str, position: int):
+        """One cell as a plain Python value (None for NULL)."""
+        kind, column = self.kinds[name], self.data[name]
+        if kind in ("category", "string"):
+            return column[position]
+        value = column[position]
+        if kind == "int" and column.dtype == np.int64:
+            return int(value)
+        if math.isnan(value):
+            return None
+        return int(value) if kind == "int" else float(value)
+
+    def column_values(self, name: str, positions) -> list:
+        """Plain Python values of one column at `positions`, converted in bulk."""
+        positions = np.asarray(positions, dtype=np.int64)
+        kind, column = self.kinds[name], self.data[name]
+        if kind == "category":
+            categories = column.categories
+            return [categories[code] if code >= 0 else None for code in column.codes[positions].tolist()]
+        if kind == "string":
+            data, starts, ends = column.data, column.offsets[positions].tolist(), column.offsets[positions + 1].tolist()
+            return [
+                data[start:end].tobytes().decode("utf-8") if valid else None
+                for start, end, valid in zip(starts, ends, column.valid[positions].tolist())
+            ]
+        values = column[positions]
+        if values.dtype == np.int64:
+            return values.tolist()
+        missing = np.isnan(values)
+        if kind == "int":
+            return [None if m else int(v) for v, m in zip(values.tolist(), missing.tolist())]
+        if missing.any():
+            return [None if m else v for v, m in zip(values.tolist(), missing.tolist())]
+        return values.tolist()
+
+    def column(self, name: str) -> np.ndarray:
+        """Values of a column as an object array."""
+        return np.array([self.value(name, i) for i in range(self.size)], dtype=object)
+
+    def distances(self, lat, lon, positions=None) -> np.ndarray:
+        """
+        Distances in km from one point, or from n points, to the stations.
+        Scalar input gives shape (n_stations,); array input gives
+        (n_queries, n_stations). Unlocated stations are +inf.
+        """
+        lats, lons = self.latitude, self.longitude
+        if positions is not None:
+            lats, lons = lats[positions], lons[positions]
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        if lat.ndim:
+            lat, lon = lat[:, None], lon[:, None]
+        d = haversine_distances(lat, lon, lats, lons)
+        return np.where(np.isnan(d), np.inf, d)
+
+    def nearest(self, lat, lon, k: int, mask: Optional[np.ndarray] = None, chunk_size: int = 256):
+        """
+        The k closest stations to each query point, ranked by distance.
+
+        Returns (positions, distances), each of shape (n_queries, k). Query
+        points are processed in chunks so the distance matrix stays bounded.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        candidates = np.flatnonzero(self.located if mask is None else self.located & mask)
+        k = min(k, len(candidates))
+        positions = np.empty((len(lat), k), dtype=np.int64)
+        distances = np.empty((len(lat), k), dtype=np.float64)
+        for start in range(0, len(lat), chunk_size):
+            stop = start + chunk_size
+            d = self.distances(lat[start:stop], lon[start:stop], candidates)
+            idx, values = top_k(d, k)
+            positions[start:stop] = candidates[idx]
+            distances[start:stop] = values
+        return positions, distances
+
+    def to_records(self, positions, distances=None, overrides: Optional[dict] = None) -> List[StationRecord]:
+        """
+        Records for `positions`, built column by column; `distance_km` set when
+        `distances` is given, and fields in `overrides` (name -> values at
+        `positions`) taken from there instead of the store.
+        """
+        n = len(positions)
+        columns = []
+        for field in StationRecord._fields:
+            if field == "distance_km":
+                columns.append([None] * n if distances is None else np.round(distances, 3).tolist())
+            elif overrides and field in overrides:
+                columns.append(overrides[field])
+            elif field in self.data:
+                columns.append(self.column_values(field, positions))
+            else:
+                columns.append([None] * n)
+        return list(map(StationRecord._make, zip(*columns)))
+
+    def to_outputs(self, positions, distances=None, overrides: Optional[dict] = None) -> List[StationOutput]:
+        """Validated output models; only for the rows actually returned."""
+        return [record.to_output() for record in self.to_records(positions, distances, overrides)]
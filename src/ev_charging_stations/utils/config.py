@@ -0,0 +1,115 @@
+"""Application settings, read from the environment or `.env`."""
+
+from pathlib import Path
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent  # project root
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    db_file: Path = BASE_DIR / "ev_charging.db"
+    db_pool_size: int = 4
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # station index snapshots shared by all workers (None: build in memory per process)
+    snapshot_dir: Optional[Path] = BASE_DIR / ".cache" / "snapshots"
+    snapshot_check_interval: float = 1.0
+
+    # LLM extraction cache; the disk tier is only used when a file is set
+    llm_cache_size: int = 4096
+    llm_cache_ttl_seconds: float = 6 * 3600
+    llm_cache_file: Optional[Path] = None
+
+    # Geocoding: bundled gazetteer first, then a persistent cache, then OpenCage
+    gazetteer_file: Path = BASE_DIR / "data" / "cities.csv"
+    geocode_cache_file: Optional[Path] = BASE_DIR / ".cache" / "geocode.db"
+    geocode_cache_ttl_seconds: float = 30 * 24 * 3600
+    opencage_url: str = "https://api.opencagedata.com/geocode/v1/json"
+    upstream_connect_timeout: float = 3.05
+    upstream_read_timeout: float = 10.0
+
+    # LLM extraction and the async pipeline's per-stage budgets
+    openrouter_url: str = "https://openrouter.ai/api/v1/chat/completions"
+    llm_timeout_seconds: float = 30.0
+    geocode_timeout_seconds: float = 10.0
+    db_timeout_seconds: float = 10.0
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 20
+
+    # Upstream resilience: retries with backoff and jitter, a circuit breaker
+    # per provider, and token buckets (requests/s, 0 = unlimited) set to the
+    # provider quotas; calls that would wait longer than rate_limit_max_wait fail
+    upstream_retries: int = 2
+    upstream_backoff_base: float = 0.2
+    upstream_backoff_max: float = 2.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+    rate_limit_max_wait: float = 2.0
+    openrouter_rate_per_second: float = 10.0
+    openrouter_burst: int = 20
+    opencage_rate_per_second: float = 1.0  # free plan
+    opencage_burst: int = 1
+
+    # Search results per (filters, k, max_radius) on the current index, shared
+    # by bursts of identical queries; 0 disables
+    response_cache_size: int = 1024
+    response_cache_ttl_seconds: float = 5.0
+
+    # Station features: a review's weight in the recency-decayed score halves
+    # every this many days (run compute_sentiment --full after changing it)
+    review_half_life_days: float = 180.0
+    # ... and the shared index rescores it (a vectorised pass, no database
+    # read) once its score is this old, so the fade keeps up with time
+    review_rescore_seconds: float = 3600.0
+
+    # Route questions ("from Munich to Berlin"): stations within this many km
+    # of the route, unless the request sets corridor_km
+    corridor_buffer_km: float = 10.0
+
+    # Live availability (services.availability): changed stations are written
+    # to this SQLite file (default: <db_file stem>-availability.db beside it)
+    # every checkpoint interval
+    availability_db_file: Optional[Path] = None
+    availability_checkpoint_seconds: float = 2.0
+
+    # Geo-sharding (services.shards): with shard_dir set, searches run on the
+    # catalogue split by geohash prefix of this many characters; queries
+    # touching at least shard_fanout_min_stations stations fan out over a
+    # process pool of shard_workers (None = CPU count, 1 = never)
+    shard_dir: Optional[Path] = None
+    shard_precision: int = 2
+    shard_workers: Optional[int] = None
+    shard_fanout_min_stations: int = 200_000
+
+    # provider / name_query lookups (services.name_search): when nothing
+    # contains the text, up to this many candidate rows are checked for
+    # misspellings, and the best few corrections at least this similar
+    # (difflib ratio) are searched instead
+    name_match_candidates: int = 2000
+    name_match_threshold: float = 0.8
+    name_match_corrections: int = 5
+
+    # Sentiment scoring (services.sentiment): backend, pool size (None = CPU
+    # count), texts per chunk, and the score cache keyed on text hash
+    sentiment_backend: str = "textblob"
+    sentiment_workers: Optional[int] = None
+    sentiment_chunk_size: int = 256
+    sentiment_cache_size: int = 100_000
+    sentiment_cache_ttl_seconds: float = 30 * 24 * 3600
+    sentiment_cache_file: Optional[Path] = None
+
+    # /process/batch
+    batch_max_size: int = 5000
+    batch_llm_concurrency: int = 8
+    batch_geocode_concurrency: int = 8
+
+    # Observability: per-stage timings in a Server-Timing header, and the
+    # fraction of requests that run under the stack sampler (/debug/profile)
+    server_timing: bool = False
+    profile_sample_rate: float = 0.0
+
+
+settings = Settings()
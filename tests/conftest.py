@@ -0,0 +1,47 @@
+"""Shared test setup."""
+
+import shutil
+
+import pytest
+
+from src.ev_charging_stations.services import availability, db_pool, http_client, station_index
+from src.ev_charging_stations.services.migrations import migrate
+from src.ev_charging_stations.utils.config import settings
+
+
+@pytest.fixture(autouse=True)
+def fresh_upstreams(monkeypatch):
+    """No breaker or rate-limit state carried between tests, and quick retries."""
+    monkeypatch.setattr(settings, "upstream_backoff_base", 0.01)
+    monkeypatch.setattr(settings, "openrouter_rate_per_second", 0.0)
+    monkeypatch.setattr(settings, "opencage_rate_per_second", 0.0)
+    http_client.reset_upstreams()
+    yield
+    http_client.reset_upstreams()
+
+
+@pytest.fixture(autouse=True)
+def private_db(tmp_path_factory, monkeypatch):
+    """
+    Every test runs on its own copy of the shipped database, so nothing a
+    test (or the app's startup) writes, journal mode included, reaches it,
+    and publishes its snapshots beside that copy rather than in the repo.
+    """
+    path = tmp_path_factory.mktemp("db") / settings.db_file.name
+    shutil.copy(settings.db_file, path)
+    monkeypatch.setattr(settings, "db_file", path)
+    monkeypatch.setattr(settings, "snapshot_dir", path.parent / "snapshots")
+    monkeypatch.setattr(station_index, "_index", None)
+    monkeypatch.setattr(station_index, "_watcher", None)
+    db_pool.close_pool()
+    yield path
+    db_pool.close_pool()
+
+
+@pytest.fixture
+def db(private_db, monkeypatch):
+    """The test's database, migrated, with the index built in memory and no live availability yet."""
+    migrate(private_db)
+    monkeypatch.setattr(settings, "snapshot_dir", None)
+    monkeypatch.setattr(availability, "_overlay", None)
+    return private_db
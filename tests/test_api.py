@@ -61,3 +61,11 @@ def test_process_query_invalid_json():
     """Test with malformed JSON (invalid body)."""
     response = client.post("/process", data="not a json")
     assert response.status_code in (400, 422)
+
+
+def test_fast_path_bodies_are_still_documented():
+    """/process and /process/batch bypass the response model but keep it in the OpenAPI schema."""
+    paths = client.get("/openapi.json").json()["paths"]
+    for path, model in (("/process", "ResponseModel"), ("/process/batch", "BatchResponseModel")):
+        schema = paths[path]["post"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert schema["$ref"].endswith(f"/{model}")
@@ -0,0 +1,120 @@
+"""Live availability overlay tests."""
+
+import asyncio
+import sqlite3
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from src.ev_charging_stations import api
+from src.ev_charging_stations.api import app
+from src.ev_charging_stations.services import availability, shards, station_index
+from src.ev_charging_stations.services.availability import AvailabilityOverlay
+from src.ev_charging_stations.services.database import find_stations
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.services.station_store import StationStore
+from src.ev_charging_stations.utils.config import settings
+from tests.test_station_index import COLUMNS, make_rows
+
+
+@pytest.fixture
+def overlay(tmp_path, monkeypatch):
+    overlay = AvailabilityOverlay(tmp_path / "availability.db", checkpoint_seconds=3600)
+    monkeypatch.setattr(availability, "_overlay", overlay)
+    yield overlay
+    overlay.close()
+
+
+@pytest.fixture
+def index():
+    return StationIndex(StationStore(make_rows(200), COLUMNS))
+
+
+def test_updates_reach_filters_and_records(overlay, index):
+    stored = index.store.column_values("available_chargers", [3, 4])
+    changed, unknown = overlay.apply(index, [(3, 5, None), (4, None, 2), (4, None, -1), (999, 1, None), (5, None, -50)])
+    assert changed == {3: 5, 4: stored[1] + 1, 5: 0}
+    assert unknown == [999]
+
+    assert [r.available_chargers for r in index.to_records([3, 4, 5])] == [5, stored[1] + 1, 0]
+    live = overlay.live(index)
+    expected = np.flatnonzero(live >= 4)
+    assert 3 in expected and 5 not in expected
+    assert [s.station_id for s in find_stations({"min_available": 4}, index=index)] == list(expected)
+    assert [s.station_id for s in find_stations({"available_only": True}, index=index)] == list(np.flatnonzero(live >= 1))
+
+
+def test_checkpoint_coalesces_and_reloads(overlay, index):
+    for available in range(100):
+        overlay.apply(index, [(7, available, None), (8, None, 1)])
+    assert overlay.checkpoint() == 2
+    assert overlay.checkpoint() == 0
+    expected = {7: 99, 8: int(overlay.live(index)[8])}
+    rows = sqlite3.connect(overlay.path).execute("SELECT station_id, available FROM station_availability").fetchall()
+    assert dict(rows) == expected
+
+    # a new overlay (a restart) aligns the checkpoint with a fresh index
+    reloaded = AvailabilityOverlay(overlay.path)
+    fresh = StationIndex(StationStore(make_rows(200), COLUMNS))
+    assert reloaded.counts(fresh, [7, 8, 999]) == expected
+
+
+def test_subscribers_get_only_their_stations_merged(overlay, index):
+    async def scenario():
+        subscription = overlay.subscribe([1, 2])
+        overlay.apply(index, [(1, 3, None), (9, 3, None)])
+        overlay.apply(index, [(1, 4, None), (2, 0, None)])
+        first = await subscription.changes(timeout=1)
+        overlay.unsubscribe(subscription)
+        overlay.apply(index, [(1, 6, None)])
+        return first, await subscription.changes(timeout=0.05)
+
+    assert asyncio.run(scenario()) == ({1: 4, 2: 0}, {})
+
+
+def test_ingest_endpoint_checkpoints_on_shutdown(db):
+    station_id, stored = sqlite3.connect(db).execute(
+        "SELECT station_id, available_chargers FROM charging_stations WHERE available_chargers != 5 LIMIT 1"
+    ).fetchone()
+    with TestClient(app) as client:
+        response = client.post("/availability", json={"updates": [
+            {"station_id": station_id, "available": 2}, {"station_id": station_id, "delta": 3},
+            {"station_id": -1, "delta": 1},
+        ]})
+        assert response.status_code == 200
+        assert response.json() == {"applied": {str(station_id): 5}, "unknown": [-1]}
+        bad = client.post("/availability", json={"updates": [{"station_id": station_id, "available": 1, "delta": 1}]})
+        assert bad.status_code == 422
+
+    checkpoint = db.with_name("ev_charging-availability.db")
+    assert sqlite3.connect(checkpoint).execute("SELECT available FROM station_availability").fetchall() == [(5,)]
+    # the catalogue itself is not written
+    assert sqlite3.connect(db).execute(
+        "SELECT available_chargers FROM charging_stations WHERE station_id = ?", (station_id,)
+    ).fetchone() == (stored,)
+
+
+def test_endpoints_use_the_shard_set_when_configured(db, tmp_path, monkeypatch):
+    """With `shard_dir` set, updates and the stream go through the shard set; the full index is never loaded."""
+    monkeypatch.setattr(settings, "shard_dir", tmp_path / "shards")
+    monkeypatch.setattr(shards, "_shards", None)
+    monkeypatch.setattr(shards, "_watcher", None)
+    station_id = sqlite3.connect(db).execute(
+        "SELECT station_id FROM charging_stations WHERE available_chargers != 7 LIMIT 1"
+    ).fetchone()[0]
+
+    class Disconnected:
+        async def is_disconnected(self):
+            return True
+
+    async def first_event():
+        response = await api.stream_availability(Disconnected(), [station_id])
+        return [chunk async for chunk in response.body_iterator]
+
+    with TestClient(app) as client:
+        response = client.post("/availability", json={"updates": [{"station_id": station_id, "available": 7}]})
+        assert response.json() == {"applied": {str(station_id): 7}, "unknown": []}
+        assert asyncio.run(first_event()) == [f'event: availability\ndata: {{"{station_id}":7}}\n\n'.encode()]
+        found = [s for s in find_stations({"min_available": 7}) if s.station_id == station_id]
+        assert [s.available_chargers for s in found] == [7]
+    assert station_index._index is None
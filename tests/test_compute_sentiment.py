@@ -0,0 +1,73 @@
+"""Incremental sentiment job tests."""
+
+import shutil
+import sqlite3
+
+import pytest
+from src.ev_charging_stations.scripts import compute_sentiment
+from src.ev_charging_stations.services.migrations import migrate
+from src.ev_charging_stations.utils.config import settings
+
+AGGREGATES = """
+SELECT s.station_id, AVG(r.sentiment_score), COUNT(r.sentiment_score)
+FROM charging_stations s JOIN user_reviews r ON r.station_id = s.station_id
+GROUP BY s.station_id ORDER BY s.station_id
+"""
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / "ev_charging.db"
+    shutil.copy(settings.db_file, path)
+    migrate(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def stored_aggregates(conn):
+    return conn.execute("""
+        SELECT station_id, avg_sentiment, num_reviews FROM charging_stations
+        WHERE station_id IN (SELECT station_id FROM user_reviews) ORDER BY station_id
+    """).fetchall()
+
+
+def assert_matches_full_groupby(conn):
+    expected = conn.execute(AGGREGATES).fetchall()
+    for (sid, avg, count), (expected_sid, expected_avg, expected_count) in zip(stored_aggregates(conn), expected):
+        assert (sid, count) == (expected_sid, expected_count)
+        assert avg == pytest.approx(expected_avg)
+
+
+def test_first_run_scores_everything_then_nothing(conn):
+    total = conn.execute("SELECT COUNT(*) FROM user_reviews").fetchone()[0]
+    scored, _ = compute_sentiment.update_sentiment(conn, workers=1)
+    assert scored == total
+    assert_matches_full_groupby(conn)
+    assert compute_sentiment.update_sentiment(conn, workers=1) == (0, 0)
+
+
+def test_only_changed_reviews_are_rescored(conn, monkeypatch):
+    compute_sentiment.update_sentiment(conn, workers=1)
+    review_id, station_id = conn.execute("SELECT review_id, station_id FROM user_reviews LIMIT 1").fetchone()
+    with conn:
+        conn.execute(
+            "UPDATE user_reviews SET feedback = 'Terrible, broken and awful.' WHERE review_id = ? AND station_id = ?",
+            (review_id, station_id),
+        )
+
+    scored_texts = []
+    original = compute_sentiment.score_texts
+    monkeypatch.setattr(compute_sentiment, "score_texts", lambda texts, workers=None: scored_texts.extend(texts) or original(texts, workers))
+    assert compute_sentiment.update_sentiment(conn, workers=1) == (1, 1)
+    assert scored_texts == ["Terrible, broken and awful."]
+    assert_matches_full_groupby(conn)
+
+
+def test_full_rebuild_matches_incremental(conn):
+    compute_sentiment.update_sentiment(conn, workers=1)
+    incremental = stored_aggregates(conn)
+    compute_sentiment.update_sentiment(conn, full=True, workers=1)
+    rebuilt = stored_aggregates(conn)
+    assert [row[::2] for row in rebuilt] == [row[::2] for row in incremental]
+    assert [row[1] for row in rebuilt] == pytest.approx([row[1] for row in incremental])
@@ -0,0 +1,42 @@
+"""Tests for the synthetic benchmark datasets."""
+
+import sqlite3
+
+import pandas as pd
+
+from benchmarks import datasets
+from benchmarks.datasets import build_database, review_chunks, station_chunks, write_dataset
+
+
+def test_generators_are_deterministic_and_chunk_independent(monkeypatch):
+    """Same seed, same rows, whatever the chunk size."""
+    monkeypatch.setattr(datasets, "SEED_BLOCK", 90)
+    whole = pd.concat(station_chunks(250, seed=3, chunk_rows=250), ignore_index=True)
+    chunks = list(station_chunks(250, seed=3, chunk_rows=100))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+    pd.testing.assert_frame_equal(whole, pd.concat(chunks, ignore_index=True))
+    assert whole["Station ID"].is_unique and len(whole) == 250
+
+    reviews = pd.concat(review_chunks(250, 2, seed=3, chunk_rows=100), ignore_index=True)
+    pd.testing.assert_frame_equal(reviews, pd.concat(review_chunks(250, 2, seed=3, chunk_rows=33), ignore_index=True))
+    assert len(reviews) == 500 and reviews["Station ID"].isin(whole["Station ID"]).all()
+
+
+def test_cached_files_are_keyed_on_every_argument(tmp_path):
+    stations, reviews = write_dataset(tmp_path, 100, reviews_per_station=1.5)
+    assert write_dataset(tmp_path, 100, reviews_per_station=1.5) == (stations, reviews)
+    other_stations, other_reviews = write_dataset(tmp_path, 100, reviews_per_station=3)
+    assert other_stations == stations and other_reviews != reviews
+    assert len(pd.read_csv(other_reviews)) == 300
+    assert write_dataset(tmp_path, 100, seed=1)[0] != stations
+
+
+def test_build_database_loads_with_load_data(tmp_path):
+    db_file = build_database(tmp_path / "bench.db", 500)
+    conn = sqlite3.connect(db_file)
+    stations, rated = conn.execute(
+        "SELECT COUNT(*), COUNT(avg_sentiment) FROM charging_stations"
+    ).fetchone()
+    reviews = conn.execute("SELECT COUNT(*) FROM user_reviews").fetchone()[0]
+    conn.close()
+    assert (stations, rated, reviews) == (500, 500, 750)
@@ -0,0 +1,83 @@
+"""Connection pool tests."""
+
+import asyncio
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+
+import pytest
+from src.ev_charging_stations.services import database
+from src.ev_charging_stations.services.db_pool import ConnectionPool, enable_wal
+from src.ev_charging_stations.utils.config import settings
+
+
+@pytest.fixture
+def db_copy(tmp_path):
+    path = tmp_path / "ev_charging.db"
+    shutil.copy(settings.db_file, path)
+    return path
+
+
+def test_pool_never_writes_the_database(db_copy):
+    """Building a pool and reading through it leaves the file and its journal mode alone."""
+    before = db_copy.read_bytes()
+    pool = ConnectionPool(db_copy, size=2)
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        conn.execute("SELECT COUNT(*) FROM charging_stations").fetchone()
+    pool.close()
+    assert db_copy.read_bytes() == before
+    assert not Path(f"{db_copy}-wal").exists()
+
+
+def test_pool_connections_are_read_only_wal(db_copy):
+    """Pooled connections on a WAL database run with query_only and mmap enabled."""
+    enable_wal(db_copy)
+    pool = ConnectionPool(db_copy, size=2, mmap_size=1 << 20)
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 1 << 20
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM charging_stations")
+    pool.close()
+
+
+def test_pool_reuses_connections_across_threads(db_copy):
+    """Concurrent readers share a bounded set of connections."""
+    pool = ConnectionPool(db_copy, size=2)
+    seen, errors = set(), []
+
+    def worker():
+        try:
+            for _ in range(20):
+                with pool.connection() as conn:
+                    seen.add(id(conn))
+                    conn.execute("SELECT COUNT(*) FROM charging_stations").fetchone()
+        except Exception as e:  # pragma: no cover - surfaced by the assert below
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    pool.close()
+    assert not errors
+    assert len(seen) <= 2
+
+
+def test_filter_query_is_built_once_per_combination():
+    """Identical filter combinations map to the same cached SQL text."""
+    first = database.station_filter_query(("charging_speed", "accessibility"))
+    second = database.station_filter_query(("charging_speed", "accessibility"))
+    assert first is second
+    assert first.count("?") == 2
+
+
+def test_find_stations_async_matches_sync():
+    """The async interface returns the same stations as the blocking call."""
+    filters = {"latitude": 40.7128, "longitude": -74.0060, "charging_speed": "Fast"}
+    result = asyncio.run(database.find_stations_async(dict(filters)))
+    assert [s.station_id for s in result] == [s.station_id for s in database.find_stations(dict(filters))]
@@ -0,0 +1,124 @@
+"""Gazetteer and cached geocoder tests."""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from src.ev_charging_stations.services import geocoding
+from src.ev_charging_stations.services.gazetteer import get_gazetteer
+from src.ev_charging_stations.services.metrics import registry
+from src.ev_charging_stations.services.query_cache import SQLiteCache, TieredCache, TTLCache
+from src.ev_charging_stations.utils.config import settings
+
+
+class FakeOpenCage(BaseHTTPRequestHandler):
+    """
+    Answers "Atlantis" with coordinates, "Garbled" with a body that is not
+    JSON, "Shapeless" with JSON lacking results, and anything else with none.
+    """
+
+    calls = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)["q"][0]
+        FakeOpenCage.calls.append(query)
+        results = [{"geometry": {"lat": 31.5, "lng": -24.5}}] if query == "Atlantis" else []
+        body = json.dumps({"results": results}).encode()
+        if query == "Garbled":
+            body = b"<html>Service temporarily unavailable</html>"
+        elif query == "Shapeless":
+            body = json.dumps({"status": {"code": 200}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def opencage(monkeypatch, tmp_path):
+    server = HTTPServer(("127.0.0.1", 0), FakeOpenCage)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FakeOpenCage.calls = []
+    monkeypatch.setattr(settings, "opencage_url", f"http://127.0.0.1:{server.server_port}/geocode")
+    monkeypatch.setattr(geocoding, "geocode_cache", TieredCache(TTLCache(), SQLiteCache(tmp_path / "geo.db")))
+    yield FakeOpenCage
+    server.shutdown()
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("Berlin", (52.52, 13.405)),
+        ("berlin, Germany", (52.52, 13.405)),
+        ("Portland, Oregon, USA", (45.5152, -122.6784)),
+        ("Edinburgh, Scotland", (55.9533, -3.1883)),
+        ("München", (48.1351, 11.582)),
+        ("NYC", (40.7128, -74.006)),
+        ("Los Angles", (34.0522, -118.2437)),  # typo
+        ("Amsterd", (52.3676, 4.9041)),  # prefix
+    ],
+)
+def test_gazetteer_lookup(name, expected):
+    """Exact, alias, prefix and fuzzy matches resolve offline."""
+    assert get_gazetteer().lookup(name) == pytest.approx(expected)
+
+
+def test_gazetteer_rejects_ambiguous_prefix():
+    """A prefix shared by several cities is not guessed."""
+    assert get_gazetteer().lookup("San") is None
+
+
+@pytest.mark.parametrize("name", ["Paris, Texas", "London, Ontario", "Portland, Maine", "Berlin, New Hampshire"])
+def test_gazetteer_leaves_other_places_of_the_same_name(name):
+    """A qualifier that does not fit the bundled city is not answered offline."""
+    assert get_gazetteer().lookup(name) is None
+
+
+def test_qualified_namesakes_reach_the_remote_geocoder(opencage):
+    """"Paris, Texas" is looked up remotely, not answered with Paris, France."""
+    assert geocoding.geocode_city("Paris, France") == pytest.approx((48.8566, 2.3522))
+    assert geocoding.geocode_city("Paris, Texas") is None
+    assert opencage.calls == ["Paris, Texas"]
+
+
+def test_known_city_makes_no_network_call(opencage):
+    """Cities in the gazetteer never reach the remote geocoder."""
+    assert geocoding.geocode_city("Tokyo") == pytest.approx((35.6762, 139.6503))
+    assert opencage.calls == []
+
+
+def test_remote_results_are_memoized(opencage):
+    """Unknown places are fetched once; hits and misses are both cached."""
+    assert geocoding.geocode_city("Atlantis") == (31.5, -24.5)
+    assert geocoding.geocode_city("atlantis") == (31.5, -24.5)
+    assert geocoding.geocode_city("Nowhereville") is None
+    assert geocoding.geocode_city("Nowhereville") is None
+    assert opencage.calls == ["Atlantis", "Nowhereville"]
+
+
+def test_malformed_answers_count_as_failures(opencage, caplog):
+    """A 200 without the expected JSON yields None (sync and async), is counted, logged and not cached."""
+    for place in ("Garbled", "Shapeless"):
+        assert geocoding.geocode_city(place) is None
+        assert asyncio.run(geocoding.geocode_city_async(place)) is None
+        assert geocoding.geocode_cache.get(place.lower()) is None
+    assert opencage.calls == ["Garbled", "Garbled", "Shapeless", "Shapeless"]
+    exposition = registry.render()
+    assert 'ev_upstream_errors_total{error="JSONDecodeError",service="opencage"}' in exposition
+    assert 'ev_upstream_errors_total{error="KeyError",service="opencage"}' in exposition
+    assert [r.levelname for r in caplog.records if r.name == geocoding.__name__] == ["WARNING"] * 4
+
+
+def test_provider_outage_returns_none_quickly(monkeypatch, tmp_path):
+    """A connection failure yields None and is not cached."""
+    monkeypatch.setattr(settings, "opencage_url", "http://127.0.0.1:9/geocode")
+    monkeypatch.setattr(settings, "upstream_connect_timeout", 0.5)
+    monkeypatch.setattr(geocoding, "geocode_cache", TieredCache(TTLCache()))
+    assert geocoding.geocode_city("Atlantis") is None
+    assert geocoding.geocode_cache.get("atlantis") is None
@@ -0,0 +1,125 @@
+"""LLM extraction cache and rule-based fast-path tests."""
+
+import asyncio
+import threading
+
+import pytest
+from src.ev_charging_stations.models.query_models import UserQuery
+from src.ev_charging_stations.services import llm_extraction
+from src.ev_charging_stations.services.query_cache import SQLiteCache, TieredCache, TTLCache
+from src.ev_charging_stations.services.rule_extraction import extract_filters
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Find fast charging stations in New York", {"city": "New York", "charging_speed": "Fast"}),
+        ("Show me public Type 2 chargers in San Francisco",
+         {"city": "San Francisco", "charging_type": "Type 2", "accessibility": "Public"}),
+        ("Which superchargers are available in Los Angeles?",
+         {"city": "Los Angeles", "charging_speed": "Supercharger", "available_only": True}),
+        ("Type 2 chargers free now in Berlin", {"city": "Berlin", "charging_type": "Type 2", "available_only": True}),
+        ("Fast chargers with availability in Rome", {"city": "Rome", "charging_speed": "Fast", "available_only": True}),
+        ("I'm in Tokyo, which stations have better user reviews?", {"city": "Tokyo", "sort_by_reviews": True}),
+        ("DC fast chargers near Paris", {"city": "Paris", "charging_type": "DC Fast Charge"}),
+        ("Fast chargers along the way from Munich to Berlin",
+         {"origin": "Munich", "destination": "Berlin", "charging_speed": "Fast"}),
+        ("Stations between New York and Boston", {"origin": "New York", "destination": "Boston"}),
+        ("Public chargers open now in Berlin", {"city": "Berlin", "accessibility": "Public", "open_at": "now"}),
+    ],
+)
+def test_rule_extractor_handles_simple_questions(question, expected):
+    """City plus known enum values are extracted without the LLM."""
+    assert extract_filters(question).model_dump(exclude_none=True) == expected
+
+
+@pytest.mark.parametrize(
+    "question",
+    ["", "cheap chargers in Berlin", "free chargers in Berlin", "Type 1 or Type 2 in Rome", "What is the weather in Berlin", "fast chargers",
+     "chargers in Munich on my way to Berlin"],
+)
+def test_rule_extractor_defers_anything_unclear(question):
+    """Unknown words, conflicts or a missing city go to the LLM."""
+    assert extract_filters(question) is None
+
+
+def test_ttl_cache_expires_and_evicts():
+    """Entries expire after the TTL and the least recently used one is evicted."""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    clock.now = 11
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1, "expirations": 1, "size": 1}
+
+
+def test_disk_tier_survives_restart_and_promotes(tmp_path):
+    """A new process finds values in the SQLite tier and promotes them to memory."""
+    SQLiteCache(tmp_path / "cache.db").set("k", "v")
+    cache = TieredCache(TTLCache(), SQLiteCache(tmp_path / "cache.db"))
+    assert cache.get("k") == "v"
+    assert cache.memory.get("k") == "v"
+    assert cache.stats()["disk"]["hits"] == 1
+
+
+def test_async_access_keeps_the_disk_tier_off_the_event_loop(tmp_path, monkeypatch):
+    """Disk reads and writes from async code run on worker threads."""
+    disk = SQLiteCache(tmp_path / "cache.db")
+    threads = []
+    for name in ("get", "set"):
+        method = getattr(disk, name)
+        monkeypatch.setattr(disk, name, lambda *args, method=method: threads.append(threading.get_ident()) or method(*args))
+    cache = TieredCache(TTLCache(), disk)
+
+    async def scenario():
+        await cache.set_async("k", "v")
+        cache.memory.clear()
+        assert await cache.get_async("k") == "v"
+        assert await cache.get_async("k") == "v"  # promoted: no second disk read
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+def test_parse_user_question_calls_llm_once_per_normalized_question(monkeypatch):
+    """Near-identical questions share one LLM call; rule-based ones make none."""
+    calls = []
+
+    def fake_llm(question):
+        calls.append(question)
+        return UserQuery(city="Berlin", charging_speed="Fast")
+
+    monkeypatch.setattr(llm_extraction, "call_llm", fake_llm)
+    monkeypatch.setattr(llm_extraction, "llm_cache", TieredCache(TTLCache()))
+
+    first = llm_extraction.parse_user_question("Cheapest fast chargers in Berlin?")
+    first.latitude = 1.0  # callers mutate the result; the cache must not see it
+    second = llm_extraction.parse_user_question("cheapest  FAST chargers in berlin")
+    assert len(calls) == 1
+    assert second.latitude is None
+
+    llm_extraction.parse_user_question("fast chargers in Berlin")
+    assert len(calls) == 1
+
+
+def test_failed_llm_calls_are_not_cached(monkeypatch):
+    """A None from the LLM is retried on the next request."""
+    calls = []
+    monkeypatch.setattr(llm_extraction, "call_llm", lambda q: calls.append(q))
+    monkeypatch.setattr(llm_extraction, "llm_cache", TieredCache(TTLCache()))
+    assert llm_extraction.parse_user_question("cheap chargers in Berlin") is None
+    assert llm_extraction.parse_user_question("cheap chargers in Berlin") is None
+    assert len(calls) == 2
@@ -0,0 +1,76 @@
+"""Streaming CSV ingest tests."""
+
+import shutil
+import sqlite3
+
+import pytest
+from src.ev_charging_stations.scripts import load_data
+from src.ev_charging_stations.services.db_pool import enable_wal
+from src.ev_charging_stations.services.migrations import migrate
+from src.ev_charging_stations.utils.config import settings
+
+STATIONS_HEADER = "Station ID,Provider,Location Name,Latitude,Longitude,Charging Speed,Available Chargers,Charging Types,Accessibility,Operating Hours\n"
+REVIEWS_HEADER = "Review ID,User ID,Station ID,Preferred Charging Speed,Preferred Charging Type,Feedback\n"
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = tmp_path / "ev_charging.db"
+    shutil.copy(settings.db_file, path)
+    migrate(path)
+    enable_wal(path)
+    return path
+
+
+def write_csvs(tmp_path, stations, reviews):
+    stations_csv, reviews_csv = tmp_path / "stations.csv", tmp_path / "reviews.csv"
+    stations_csv.write_text(STATIONS_HEADER + "".join(line + "\n" for line in stations))
+    reviews_csv.write_text(REVIEWS_HEADER + "".join(line + "\n" for line in reviews))
+    return stations_csv, reviews_csv
+
+
+def test_reload_in_small_chunks_keeps_indexes_and_scores(db):
+    conn = sqlite3.connect(db)
+    scores = "SELECT station_id, avg_sentiment, num_reviews, sentiment_sum FROM charging_stations ORDER BY 1"
+    before = conn.execute(scores).fetchall()
+    assert any(row[3] is not None for row in before)
+    assert load_data.load_csvs(conn, chunk_size=7) == (150, 217)
+
+    assert conn.execute(scores).fetchall() == before
+    assert conn.execute("SELECT COUNT(*) FROM station_rtree").fetchone() == (150,)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+    assert {"idx_stations_speed_type_access", "idx_reviews_station", "station_rtree_insert"} <= names
+    assert not conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%__shadow'").fetchall()
+
+
+def test_duplicate_keys_are_upserted(db, tmp_path):
+    stations_csv, reviews_csv = write_csvs(
+        tmp_path,
+        ["1,A,Old,1.0,2.0,Fast,1,Type 2,Public,24/7", "2,B,Other,3.0,4.0,Fast,2,Type 1,Public,24/7",
+         "1,A,New,1.5,2.5,Fast,3,Type 2,Public,24/7"],
+        ['10,U1,1,Fast,Type 2,"first"', '10,U1,1,Fast,Type 2,"second"', '10,U2,2,Fast,Type 1,"same id, other station"'],
+    )
+    conn = sqlite3.connect(db)
+    load_data.load_csvs(conn, stations_csv, reviews_csv, chunk_size=2)
+    assert conn.execute("SELECT station_id, location_name, available_chargers FROM charging_stations ORDER BY 1").fetchall() == [
+        (1, "New", 3), (2, "Other", 2)
+    ]
+    assert conn.execute("SELECT station_id, feedback FROM user_reviews ORDER BY 1").fetchall() == [
+        (1, "second"), (2, "same id, other station")
+    ]
+    assert conn.execute("SELECT min_lat, min_lon FROM station_rtree WHERE station_id = 1").fetchone() == pytest.approx((1.5, 2.5))
+    name_search = "SELECT rowid FROM station_names WHERE station_names MATCH ?"
+    assert conn.execute(name_search, ("location_name : New",)).fetchall() == [(1,)]
+    assert conn.execute(name_search, ("location_name : Old",)).fetchall() == []
+
+
+def test_readers_see_old_tables_until_swap(db, tmp_path):
+    stations_csv, reviews_csv = write_csvs(tmp_path, ["1,A,Only,1.0,2.0,Fast,1,Type 2,Public,24/7"], [])
+    reader = sqlite3.connect(db, isolation_level=None)
+    reader.execute("BEGIN")
+    assert reader.execute("SELECT COUNT(*) FROM charging_stations").fetchone() == (150,)
+
+    load_data.load_csvs(sqlite3.connect(db), stations_csv, reviews_csv)
+    assert reader.execute("SELECT COUNT(*) FROM charging_stations").fetchone() == (150,)
+    reader.execute("COMMIT")
+    assert reader.execute("SELECT COUNT(*) FROM charging_stations").fetchone() == (1,)
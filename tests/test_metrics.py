@@ -0,0 +1,113 @@
+"""Tests for pipeline metrics, /metrics and Server-Timing."""
+
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from src.ev_charging_stations import api
+from src.ev_charging_stations.services import http_client, metrics
+from src.ev_charging_stations.utils.config import settings
+from tests.test_pipeline_async import upstreams  # noqa: F401  (fixture)
+
+client = TestClient(api.app)
+
+
+def test_histogram_quantiles_and_buckets():
+    """Recent-window quantiles and cumulative buckets in the exposition text."""
+    hist = metrics.Histogram("test_seconds", "Test.", buckets=(0.1, 1.0), window=100)
+    for i in range(1, 101):
+        hist.observe(i / 100, stage="x")
+    assert hist.quantile(0.5, stage="x") == pytest.approx(0.51)
+    assert hist.quantile(0.99, stage="x") == pytest.approx(1.0)
+    text = "\n".join(hist.render())
+    assert 'test_seconds_bucket{stage="x",le="0.1"} 10' in text
+    assert 'test_seconds_bucket{stage="x",le="+Inf"} 100' in text
+    assert 'test_seconds_count{stage="x"} 100' in text
+    assert 'test_seconds_recent{stage="x",quantile="0.95"} 0.96' in text
+
+
+def test_span_counts_errors_and_records_timings():
+    timings = metrics.start_request_timings()
+    before = metrics.stage_errors.value(stage="unit", error="ValueError")
+    with pytest.raises(ValueError):
+        with metrics.span("unit"):
+            raise ValueError
+    assert metrics.stage_errors.value(stage="unit", error="ValueError") == before + 1
+    assert [stage for stage, _ in timings] == ["unit"]
+    assert metrics.server_timing_header([("llm", 0.25), ("llm", 0.25)], 0.6) == "llm;dur=500.0, total;dur=600.0"
+
+
+def test_metrics_endpoint_after_query(upstreams):
+    """Stage histograms, cache ratios and upstream errors are scraped after /process."""
+    assert client.post("/process", json={"query": "chargers in Springfield"}).status_code == 200
+    http_client.set_transport(httpx.MockTransport(lambda request: httpx.Response(503)))
+    client.post("/process", json={"query": "something broken"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    for stage in ("llm", "geocode", "search", "serialize"):
+        assert f'ev_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'ev_stage_duration_seconds_recent{stage="search",quantile="0.99"}' in text
+    assert 'ev_request_duration_seconds_count{method="POST",path="/process"}' in text
+    assert 'ev_cache_hit_ratio{cache="llm",tier="memory"}' in text
+    assert 'ev_upstream_errors_total{error="HTTPStatusError",service="openrouter"}' in text
+
+
+def test_cache_families_are_grouped(upstreams):
+    """Each cache family is exposed once, typed, with every cache's samples together."""
+    assert client.post("/process", json={"query": "chargers in Springfield"}).status_code == 200
+    lines = metrics.registry.render().splitlines()
+    for family, kind in (("ev_cache_hits_total", "counter"), ("ev_cache_misses_total", "counter"),
+                         ("ev_cache_hit_ratio", "gauge")):
+        assert lines.count(f"# TYPE {family} {kind}") == 1
+        start = lines.index(f"# TYPE {family} {kind}")
+        rows = [i for i, line in enumerate(lines) if line.startswith(family + "{")]
+        assert rows == list(range(start + 1, start + 1 + len(rows)))
+        assert {'cache="llm"', 'cache="geocode"', 'cache="response"'} <= {
+            lines[i].split("{")[1].split(",")[0] for i in rows}
+
+
+def test_server_timing_header(upstreams, monkeypatch):
+    response = client.post("/process", json={"query": "chargers in Springfield"})
+    assert "server-timing" not in response.headers
+
+    monkeypatch.setattr(settings, "server_timing", True)
+    response = client.post("/process", json={"query": "chargers in Springfield"})
+    stages = [part.split(";")[0] for part in response.headers["server-timing"].split(", ")]
+    assert stages[0] == "llm" and "search" in stages and stages[-1] == "total"
+
+
+def test_profiler_is_opt_in(monkeypatch):
+    assert client.get("/debug/profile").status_code == 404
+
+    sampler = metrics.StackSampler(rate=1.0, interval=0.001)
+    monkeypatch.setattr(api, "profiler", sampler)
+    with sampler.sampling():
+        deadline = time.time() + 0.2
+        while time.time() < deadline:
+            sum(range(1000))
+    response = client.get("/debug/profile")
+    assert response.status_code == 200
+    assert "test_profiler_is_opt_in" in response.text
+
+
+def test_sampler_thread_stops_with_profiling():
+    """The sampler thread exits once sampling ends, and reads never race its writes."""
+    sampler = metrics.StackSampler(rate=1.0, interval=0.0005, max_stacks=100_000)
+    with sampler.sampling():
+        thread = sampler._thread
+        deadline = time.time() + 0.2
+        while time.time() < deadline:
+            sampler.collapsed()
+    thread.join(timeout=1)
+    assert not thread.is_alive() and sampler._thread is None
+    assert sampler.collapsed()
+
+    with sampler.sampling():
+        thread = sampler._thread
+        sampler.close()
+        assert not thread.is_alive()
@@ -0,0 +1,97 @@
+"""Schema migration tests."""
+
+import itertools
+import shutil
+import sqlite3
+
+import pytest
+from src.ev_charging_stations.services import database
+from src.ev_charging_stations.services.db_pool import ConnectionPool
+from src.ev_charging_stations.services.migrations import SCHEMA_VERSION, migrate, schema_version
+from src.ev_charging_stations.services.station_index import FILTER_COLUMNS
+from src.ev_charging_stations.utils.config import settings
+
+
+@pytest.fixture
+def migrated_db(tmp_path):
+    """A migrated copy of the shipped (legacy, keyless) database."""
+    path = tmp_path / "ev_charging.db"
+    shutil.copy(settings.db_file, path)
+    migrate(path)
+    return path
+
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def test_migration_keeps_rows_and_adds_keys(migrated_db):
+    """Legacy tables are rebuilt with primary keys and no data loss."""
+    legacy = sqlite3.connect(settings.db_file)
+    conn = sqlite3.connect(migrated_db)
+    for table in ("charging_stations", "user_reviews"):
+        count = f"SELECT COUNT(*) FROM {table}"
+        assert conn.execute(count).fetchone() == legacy.execute(count).fetchone()
+    pk = {row[1]: row[5] for row in conn.execute("PRAGMA table_info(charging_stations)")}
+    assert pk["station_id"] == 1
+    assert schema_version(conn) == SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM station_rtree").fetchone() == \
+        conn.execute("SELECT COUNT(*) FROM charging_stations").fetchone()
+    legacy.close()
+    conn.close()
+
+
+def test_migrate_is_idempotent(migrated_db):
+    """Running migrate again is a no-op."""
+    assert migrate(migrated_db) == SCHEMA_VERSION
+
+
+def test_rtree_follows_station_writes(migrated_db):
+    """Triggers keep the R*Tree in step with inserts, moves and deletes."""
+    conn = sqlite3.connect(migrated_db)
+    conn.execute("INSERT INTO charging_stations (station_id, latitude, longitude) VALUES (9999, 1.5, 2.5)")
+    assert conn.execute("SELECT min_lat, min_lon FROM station_rtree WHERE station_id = 9999").fetchone() == (1.5, 2.5)
+    conn.execute("UPDATE charging_stations SET latitude = 3.5 WHERE station_id = 9999")
+    assert conn.execute("SELECT min_lat FROM station_rtree WHERE station_id = 9999").fetchone() == (3.5,)
+    conn.execute("DELETE FROM charging_stations WHERE station_id = 9999")
+    assert conn.execute("SELECT COUNT(*) FROM station_rtree WHERE station_id = 9999").fetchone() == (0,)
+    conn.close()
+
+
+@pytest.mark.parametrize(
+    "keys",
+    [combo for r in range(1, 4) for combo in itertools.combinations(FILTER_COLUMNS, r)],
+)
+def test_filter_queries_use_an_index(migrated_db, keys):
+    """Every filtered query path is an index SEARCH, never a full SCAN."""
+    conn = sqlite3.connect(migrated_db)
+    for sql, params in [
+        (database.station_filter_query(keys), ["x"] * len(keys)),
+        (database.station_bbox_query(keys), [0, 1, 0, 1] + ["x"] * len(keys)),
+    ]:
+        plan = query_plan(conn, sql, params)
+        assert not any(step.startswith("SCAN") and "VIRTUAL TABLE" not in step for step in plan), plan
+    conn.close()
+
+
+def test_geo_and_review_lookups_use_indexes(migrated_db):
+    """The R*Tree serves bounding boxes and reviews are found by station."""
+    conn = sqlite3.connect(migrated_db)
+    plan = query_plan(conn, database.station_bbox_query(()), [0, 1, 0, 1])
+    assert any("VIRTUAL TABLE INDEX" in step for step in plan)
+    assert any("INTEGER PRIMARY KEY" in step for step in plan)
+    plan = query_plan(conn, "SELECT * FROM user_reviews WHERE station_id = ?", [1001])
+    assert any("idx_reviews_station" in step for step in plan)
+    conn.close()
+
+
+def test_find_stations_in_radius_matches_index(migrated_db, monkeypatch):
+    """The SQL-only radius lookup agrees with a brute-force haversine."""
+    pool = ConnectionPool(migrated_db)
+    monkeypatch.setattr(database, "get_pool", lambda: pool)
+    stations = database.find_stations_in_radius({"charging_speed": "Fast"}, 40.7128, -74.0060, 300)
+    assert stations
+    all_fast = database.find_stations({"charging_speed": "Fast"})
+    expected = {s.station_id for s in all_fast if database.haversine(40.7128, -74.0060, s.latitude, s.longitude) <= 300}
+    assert {s.station_id for s in stations} == expected
+    pool.close()
@@ -0,0 +1,76 @@
+"""Provider and station-name search tests."""
+
+import sqlite3
+
+from src.ev_charging_stations.services import shards
+from src.ev_charging_stations.services.database import find_nearest_stations, find_stations
+from src.ev_charging_stations.services.name_search import name_matches, trigrams
+from src.ev_charging_stations.services.shards import ShardSet, close_shard_pool, write_shard_set
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.utils.config import settings
+
+
+def names(stations):
+    return [(s.provider, s.location_name) for s in stations]
+
+
+def test_trigrams_fold_case_and_spaces():
+    assert trigrams("Ev  Now") == {"ev ", "v n", " no", "now"}
+    assert trigrams("ab") == set()
+
+
+def test_exact_prefix_and_typo_matches(db):
+    conn = sqlite3.connect(db)
+    downtown = conn.execute("SELECT provider, location_name FROM charging_stations WHERE location_name = 'Downtown Station'").fetchall()
+    chargeco = conn.execute("SELECT COUNT(*) FROM charging_stations WHERE provider = 'ChargeCo'").fetchone()[0]
+
+    assert names(find_stations({"name_query": "Downtown Station"})) == downtown
+    assert names(find_stations({"name_query": "downt"})) == downtown
+    assert names(find_stations({"name_query": "Downtwn Statoin"})) == downtown
+    assert len(find_stations({"provider": "chargco"})) == chargeco
+    assert find_stations({"provider": "Nonexistent Network"}) == []
+
+    # exact matches rank ahead of typo matches
+    matches = name_matches({"name_query": "Downtown Station"})
+    assert matches.scores.max() == 1.0
+    stations = find_stations({"name_query": "Station"})
+    scores = name_matches({"name_query": "Station"}).score_of([s.station_id for s in stations])
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_name_filters_combine_with_geo_and_enum_filters(db):
+    conn = sqlite3.connect(db)
+    station_id, lat, lon = conn.execute(
+        "SELECT station_id, latitude, longitude FROM charging_stations WHERE provider = 'ChargeCo' LIMIT 1"
+    ).fetchone()
+    filters = {"provider": "ChargeCo", "latitude": lat, "longitude": lon}
+    found = find_stations(filters)
+    assert station_id in [s.station_id for s in found]
+    assert {s.provider for s in found} == {"ChargeCo"}
+    assert {s.provider for s in find_nearest_stations(filters, k=5)} == {"ChargeCo"}
+    assert {s.charging_speed for s in find_stations({**filters, "charging_speed": "Fast"})} <= {"Fast"}
+
+
+def test_index_follows_station_writes(db):
+    conn = sqlite3.connect(db)
+    station_id = conn.execute("SELECT station_id FROM charging_stations LIMIT 1").fetchone()[0]
+    assert station_id not in name_matches({"name_query": "Zanzibar Quay"}).station_ids
+    with conn:
+        conn.execute("UPDATE charging_stations SET location_name = 'Zanzibar Quay' WHERE station_id = ?", (station_id,))
+    assert list(name_matches({"name_query": "zanzibar"}).station_ids) == [station_id]
+    with conn:
+        conn.execute("DELETE FROM charging_stations WHERE station_id = ?", (station_id,))
+    assert len(name_matches({"name_query": "zanzibar"}).station_ids) == 0
+
+
+def test_shard_workers_get_resolved_matches(db, tmp_path, monkeypatch):
+    index = StationIndex.from_database(db)
+    shard_set = ShardSet(write_shard_set(tmp_path / "shards", index, precision=1))
+    monkeypatch.setattr(settings, "shard_fanout_min_stations", 0)
+    monkeypatch.setattr(settings, "shard_workers", 2)
+    filters = {"provider": "ChargeCo", "name_query": "Station"}
+    try:
+        assert list(shard_set.search(filters)) == list(index.search(filters))
+        assert shards._pool is not None
+    finally:
+        close_shard_pool()
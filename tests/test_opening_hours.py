@@ -0,0 +1,72 @@
+"""Operating-hours parsing and open_at filter tests."""
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+from src.ev_charging_stations.models.query_models import UserQuery
+from src.ev_charging_stations.services.database import find_stations
+from src.ev_charging_stations.services.opening_hours import (
+    MINUTES_PER_DAY,
+    MINUTES_PER_WEEK,
+    minute_of_week,
+    parse_hours,
+)
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.services.station_store import StationStore
+from tests.test_station_index import COLUMNS, make_rows
+
+MON, SAT, SUN = 0, 5, 6
+
+
+def at(day, hour, minute=0):
+    return day * MINUTES_PER_DAY + hour * 60 + minute
+
+
+@pytest.mark.parametrize(
+    "text, open_at, closed_at",
+    [
+        ("24/7", [at(MON, 0), at(SUN, 23, 59)], []),
+        ("06:00 - 22:00", [at(MON, 6), at(SAT, 21, 59)], [at(MON, 5, 59), at(SUN, 22)]),
+        ("22:00-06:00", [at(MON, 23), at(MON, 0), at(SUN, 5, 59)], [at(MON, 6), at(SAT, 21, 59)]),
+        ("Mo-Fr 08:00-18:00; Sa 09:00-14:00", [at(MON, 8), at(SAT, 13, 59)], [at(SAT, 14), at(SUN, 10), at(MON, 18)]),
+        ("Sat,Sun 7am-11pm", [at(SAT, 7), at(SUN, 22, 59)], [at(MON, 12)]),
+        ("Mo-Su 08:00-12:00, 13:00-24:00", [at(MON, 23, 59)], [at(MON, 12, 30)]),
+        ("Fr-Mo 10:00-11:00", [at(SUN, 10), at(MON, 10)], [at(2, 10)]),
+        ("closed", [], [at(MON, 12)]),
+    ],
+)
+def test_parse_hours(text, open_at, closed_at):
+    flags = parse_hours(text)
+    assert flags.shape == (MINUTES_PER_WEEK,)
+    assert flags[open_at].all() and not flags[closed_at].any()
+
+
+@pytest.mark.parametrize("text", [None, "", "sunrise to sunset", "25:00-26:00", "by appointment"])
+def test_unreadable_hours(text):
+    assert parse_hours(text) is None
+
+
+def test_minute_of_week():
+    saturday = datetime(2026, 10, 17, 21, 15)
+    assert minute_of_week("now", saturday) == at(SAT, 21, 15)
+    assert minute_of_week("23:00", saturday) == at(SAT, 23)
+    assert minute_of_week("Mon 7pm", saturday) == at(MON, 19)
+    assert minute_of_week("2026-10-18T08:30") == at(SUN, 8, 30)
+    with pytest.raises(ValueError):
+        minute_of_week("tonightish")
+    assert UserQuery(open_at="late").open_at is None and UserQuery(open_at="Sat 9:00").open_at == "Sat 9:00"
+
+
+def test_open_at_mask_matches_parsing_every_station():
+    """The bitset lookup agrees with parsing each station's own hours, alongside other filters."""
+    hours = ["24/7", "06:00 - 22:00", "22:00-06:00", "Mo-Fr 08:00-18:00", "sunrise to sunset", None]
+    rows = [(*row[:9], hours[i % len(hours)], *row[10:]) for i, row in enumerate(make_rows(600))]
+    index = StationIndex(StationStore(rows, COLUMNS))
+    for when in ("Mon 03:00", "Wed 12:00", "Sat 21:30", "Sun 23:59"):
+        minute = minute_of_week(when)
+        flags = [parse_hours(row[9]) for row in rows]
+        is_open = np.array([f is not None and f[minute] for f in flags])
+        expected = np.flatnonzero(is_open & index.filter_mask({"charging_speed": "Fast"}))
+        stations = find_stations({"open_at": when, "charging_speed": "Fast"}, index=index)
+        assert [s.station_id for s in stations] == list(expected)
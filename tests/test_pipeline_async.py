@@ -0,0 +1,166 @@
+"""Async pipeline tests against mocked upstreams."""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from src.ev_charging_stations.api import app
+from src.ev_charging_stations.pipelines.query_pipeline import run_batch_pipeline_async, run_query_pipeline_async
+from src.ev_charging_stations.services import geocoding, http_client, llm_extraction
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.utils.config import settings
+
+
+@pytest.fixture
+def upstreams(monkeypatch):
+    """Mock OpenRouter/OpenCage with a configurable LLM latency and answer."""
+    state = {"llm_latency": 0.0, "llm_content": json.dumps({"city": "Springfield"}), "calls": []}
+
+    async def handler(request):
+        state["calls"].append(request.url.host)
+        if "opencage" in request.url.host:
+            return httpx.Response(200, json={"results": [{"geometry": {"lat": 40.7128, "lng": -74.0060}}]})
+        await asyncio.sleep(state["llm_latency"])
+        content = state["llm_content"]
+        if "broken" in json.loads(request.content)["messages"][0]["content"]:
+            content = "not json"
+        return httpx.Response(200, json={"choices": [{"message": {"content": content}}]})
+
+    http_client.set_transport(httpx.MockTransport(handler))
+    monkeypatch.setattr(llm_extraction, "llm_cache", TieredCache(TTLCache()))
+    monkeypatch.setattr(geocoding, "geocode_cache", TieredCache(TTLCache()))
+    yield state
+    http_client.set_transport(None)
+
+
+def test_async_pipeline_returns_stations(upstreams):
+    """LLM, remote geocode and index search run end to end."""
+    stations = asyncio.run(run_query_pipeline_async("cheapest chargers in Springfield"))
+    assert stations
+    assert upstreams["calls"] == ["openrouter.ai", "api.opencagedata.com"]
+
+
+def test_llm_failure_maps_to_http_500(upstreams):
+    """Unparseable LLM output is reported as before."""
+    upstreams["llm_content"] = "not json"
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(run_query_pipeline_async("cheapest chargers in Springfield"))
+    assert err.value.status_code == 500
+
+
+def test_llm_stage_timeout(upstreams, monkeypatch):
+    """A hung LLM is cut off by the stage timeout instead of holding the request."""
+    upstreams["llm_latency"] = 5
+    monkeypatch.setattr(settings, "llm_timeout_seconds", 0.1)
+    start = time.perf_counter()
+    with pytest.raises(HTTPException):
+        asyncio.run(run_query_pipeline_async("cheapest chargers in Springfield"))
+    assert time.perf_counter() - start < 2
+
+
+def test_concurrent_requests_overlap(upstreams):
+    """Slow upstream calls for different requests run concurrently."""
+    upstreams["llm_latency"] = 0.3
+
+    async def many():
+        return await asyncio.gather(*(run_query_pipeline_async(f"cheapest chargers in Springfield {i}") for i in range(20)))
+
+    start = time.perf_counter()
+    results = asyncio.run(many())
+    assert len(results) == 20
+    assert time.perf_counter() - start < 3  # 20 x 0.3 s if serialised
+
+
+def test_batch_dedupes_and_keeps_order(upstreams):
+    """Duplicates share one LLM call, cities are geocoded once, order is kept."""
+    questions = [
+        "cheapest chargers in Springfield",
+        "fast chargers in Berlin",
+        "Cheapest chargers in Springfield?",
+        "broken question in Springfield",
+        "cheap chargers, please, in Springfield",
+    ]
+    results = asyncio.run(run_batch_pipeline_async(questions))
+    assert len(results) == 5
+    assert [s.station_id for s in results[0]] == [s.station_id for s in results[2]]
+    assert all(s.charging_speed == "Fast" for s in results[1])
+    assert isinstance(results[3], HTTPException)
+    # 4 distinct questions, one answered by rules, plus a single geocode for Springfield
+    assert upstreams["calls"].count("openrouter.ai") == 3
+    assert upstreams["calls"].count("api.opencagedata.com") == 1
+
+
+def test_batch_endpoint_reports_per_item_errors(upstreams):
+    """/process/batch returns one result per query with errors inline."""
+    client = TestClient(app)
+    payload = {"queries": [{"query": "cheapest chargers in Springfield"}, {"query": "broken question in Springfield"}]}
+    response = client.post("/process/batch", json=payload)
+    assert response.status_code == 200
+    first, second = response.json()["results"]
+    assert first["model_output"] and first["error"] is None
+    assert second["model_output"] is None and "language model" in second["error"]
+
+
+def test_process_pagination_with_cursor(upstreams):
+    """limit/offset pages and the opaque cursor walk the same ranked list."""
+    client = TestClient(app)
+    payload = {"query": "cheapest chargers in Springfield"}
+    everything = client.post("/process", json=payload).json()
+    ids = [s["station_id"] for s in everything["model_output"]]
+    assert everything["total"] == len(ids) and everything["next_cursor"] is None
+
+    assert len(ids) >= 2
+    first = client.post("/process", params={"limit": 1}, json=payload).json()
+    assert [s["station_id"] for s in first["model_output"]] == ids[:1]
+    second = client.post("/process", params={"limit": 1, "cursor": first["next_cursor"]}, json=payload).json()
+    assert [s["station_id"] for s in second["model_output"]] == ids[1:2]
+    offset = client.post("/process", params={"limit": 1, "offset": 1}, json=payload).json()
+    assert offset["model_output"] == second["model_output"]
+
+    assert client.post("/process", params={"cursor": "not-a-cursor"}, json=payload).status_code == 400
+
+
+def test_process_stream_ndjson_and_sse(upstreams):
+    """Streaming endpoints emit one record per station in rank order."""
+    client = TestClient(app)
+    payload = {"query": "cheapest chargers in Springfield"}
+    ids = [s["station_id"] for s in client.post("/process", json=payload).json()["model_output"]]
+
+    response = client.post("/process/stream", params={"limit": 1}, json=payload)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert response.headers["x-total-count"] == str(len(ids))
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [s["station_id"] for s in lines] == ids[:1]
+    response = client.post("/process/stream", params={"offset": 1}, json=payload)
+    assert [json.loads(line)["station_id"] for line in response.text.splitlines()] == ids[1:]
+
+    response = client.post("/process/stream", params={"format": "sse"}, json=payload)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = response.text.strip().split("\n\n")
+    assert len(events) == len(ids) + 1
+    assert events[-1].startswith("event: end") and json.loads(events[-1].split("data: ")[1])["total"] == len(ids)
+
+
+def test_process_ranked_mode(upstreams):
+    """k returns the nearest stations first, each with its distance."""
+    client = TestClient(app)
+    body = client.post("/process", params={"k": 2, "max_radius": 50}, json={"query": "cheapest chargers in Springfield"}).json()
+    distances = [s["distance_km"] for s in body["model_output"]]
+    assert len(distances) == 2 and distances == sorted(distances) and distances[-1] <= 50
+
+
+def test_process_route_question(upstreams):
+    """Origin and destination are geocoded and searched as a corridor, narrowed by corridor_km."""
+    upstreams["llm_content"] = json.dumps({"origin": "Springfield", "destination": "Shelbyville"})
+    client = TestClient(app)
+    params = {"k": 5, "corridor_km": 5}
+    body = client.post("/process", params=params, json={"query": "chargers from springfield to shelbyville"}).json()
+    assert upstreams["calls"].count("api.opencagedata.com") == 2
+    distances = [s["distance_km"] for s in body["model_output"]]
+    assert distances and all(d <= 5 for d in distances)
+    wider = client.post("/process", params={**params, "corridor_km": 50}, json={"query": "chargers from springfield to shelbyville"})
+    assert wider.json()["total"] >= body["total"]
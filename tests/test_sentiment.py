@@ -0,0 +1,94 @@
+"""Sentiment service and review submission tests."""
+
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from src.ev_charging_stations.api import app
+from src.ev_charging_stations.services import sentiment
+from src.ev_charging_stations.services.metrics import registry
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.services.sentiment import SentimentBackend, SentimentService, score_chunk
+from src.ev_charging_stations.utils.config import settings
+
+REVIEWS = [
+    "Great station, fast and clean.",
+    "Broken charger, terrible experience.",
+    "  Great station, fast and clean.",
+    "",
+    "Okay, nothing special.",
+    "Broken charger, terrible experience.",
+]
+
+
+class CountingBackend(SentimentBackend):
+    name = "counting"
+    seen: list = []
+
+    def polarity(self, text: str) -> float:
+        CountingBackend.seen.append(text)
+        return len(text) / 100
+
+
+@pytest.fixture
+def counting(monkeypatch):
+    monkeypatch.setitem(sentiment.BACKENDS, "counting", CountingBackend)
+    CountingBackend.seen = []
+    yield CountingBackend
+    sentiment.get_backend.cache_clear()
+
+
+def test_duplicates_are_scored_once_and_cached(counting):
+    service = SentimentService("counting", workers=1, cache=TieredCache(TTLCache()))
+    scores = service.score(REVIEWS)
+    assert scores[0] == scores[2] and scores[1] == scores[5]
+    assert scores[3] is None
+    assert len(counting.seen) == 3
+
+    assert service.score(["Okay, nothing special.", "Brand new text."]) == [scores[4], 0.15]
+    assert len(counting.seen) == 4
+
+
+def test_pool_scores_match_inline_scores():
+    texts = [f"{review} #{i}" for i, review in enumerate(REVIEWS * 3)]
+    with SentimentService("textblob", workers=2, chunksize=4) as service:
+        assert service.score(texts) == score_chunk("textblob", texts)
+        assert service._get_pool()._mp_context.get_start_method() != "fork"
+
+
+def test_scrape_does_not_build_the_service(monkeypatch):
+    """Until something scores a review, the metrics report no sentiment cache (and build none)."""
+    monkeypatch.setattr(sentiment, "_service", None)
+    monkeypatch.setattr(settings, "sentiment_backend", "nope")  # building the service would fail
+    assert 'cache="sentiment"' not in registry.render()
+    assert sentiment._service is None
+
+    monkeypatch.setattr(sentiment, "_service", SentimentService("textblob", workers=1, cache=TieredCache(TTLCache())))
+    assert 'ev_cache_hits_total{cache="sentiment",tier="memory"} 0' in registry.render()
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        SentimentService("nope")
+
+
+def test_submitted_review_updates_station_and_features(db):
+    with TestClient(app) as client:
+        station_id = sqlite3.connect(db).execute("SELECT station_id FROM user_reviews LIMIT 1").fetchone()[0]
+        response = client.post("/reviews", json={"station_id": station_id, "feedback": "Awful, nothing worked."})
+        assert response.status_code == 201
+        body = response.json()
+        assert body["sentiment_score"] < 0
+
+        conn = sqlite3.connect(db)
+        expected = conn.execute(
+            "SELECT AVG(sentiment_score), COUNT(sentiment_score) FROM user_reviews WHERE station_id = ?", (station_id,)
+        ).fetchone()
+        assert (body["avg_sentiment"], body["num_reviews"]) == (pytest.approx(expected[0]), expected[1])
+        assert conn.execute(
+            "SELECT scored_count FROM station_features WHERE station_id = ?", (station_id,)
+        ).fetchone() == (expected[1],)
+        assert conn.execute("SELECT COUNT(*) FROM station_features_dirty").fetchone() == (0,)
+
+        assert client.post("/reviews", json={"station_id": -1, "feedback": "Nice."}).status_code == 404
+        assert client.post("/reviews", json={"station_id": station_id, "feedback": "  "}).status_code == 400
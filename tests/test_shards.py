@@ -0,0 +1,116 @@
+"""Geo-sharded index tests."""
+
+import numpy as np
+import pytest
+from src.ev_charging_stations.services import shards
+from src.ev_charging_stations.services.database import find_stations, rank_nearest_positions, rank_station_positions
+from src.ev_charging_stations.services.shards import ShardSet, close_shard_pool, geohash, write_shard_set
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.services.station_store import StationStore
+from src.ev_charging_stations.utils.config import settings
+from tests.test_station_index import COLUMNS, make_rows
+
+FILTERS = [
+    {"latitude": 48.14, "longitude": 11.58},
+    {"latitude": 48.14, "longitude": 11.58, "charging_speed": "Fast", "sort_by_reviews": True},
+    {"latitude": -33.9, "longitude": 151.2, "charging_type": "Type 2"},
+    {"latitude": 10.0, "longitude": 179.9, "accessibility": "Public"},
+    {"charging_speed": "Supercharger", "sort_by_reviews": True},
+    {"route": [[48.14, 11.58], [52.52, 13.40]], "corridor_km": 400},
+    {"route": [[10.0, 178.0], [12.0, -178.0]], "corridor_km": 500, "sort_by_reviews": True},
+]
+
+
+def test_geohash_matches_reference_cells():
+    assert list(geohash([57.64911, -25.382708, 0.0], [10.40744, -49.265506, 0.0], 5)) == ["u4pru", "6gkzw", "s0000"]
+
+
+@pytest.fixture
+def index():
+    rows = make_rows(3000, seed=2, reviews=True)
+    # a few stations without coordinates go to their own shard
+    rows[::250] = [(*row[:3], None, None, *row[5:]) for row in rows[::250]]
+    return StationIndex(StationStore(rows, COLUMNS))
+
+
+@pytest.fixture
+def shard_set(index, tmp_path):
+    return ShardSet(write_shard_set(tmp_path / "shards", index, precision=1))
+
+
+def assert_same_results(index, shard_set):
+    for filters in FILTERS:
+        assert list(rank_station_positions(filters, index=shard_set)) == list(rank_station_positions(filters, index=index))
+        for k in (1, 10):
+            expected, expected_distances = rank_nearest_positions(filters, k, index=index)
+            positions, distances = rank_nearest_positions(filters, k, index=shard_set)
+            assert list(positions) == list(expected)
+            if expected_distances is None:
+                assert distances is None
+            else:
+                assert np.allclose(distances, expected_distances)
+        expected = index.to_records(rank_station_positions(filters, index=index))
+        assert shard_set.to_records(rank_station_positions(filters, index=shard_set)) == expected
+
+
+def test_shard_set_matches_unsharded_index(index, shard_set):
+    assert len(shard_set.shards) > 20 and "_" in [shard["prefix"] for shard in shard_set.shards]
+    assert_same_results(index, shard_set)
+
+
+def test_parity_filters_really_filter(shard_set):
+    """Every filter in FILTERS narrows the results: a misspelt key would match everything and pass unnoticed."""
+    for filters in FILTERS:
+        narrowing = {key: filters[key] for key in ("charging_speed", "charging_type", "accessibility")
+                     if key in filters}
+        if not narrowing:
+            continue
+        base = {key: value for key, value in filters.items() if key not in narrowing}
+        if "latitude" in filters:
+            # a fixed radius: the expanding search may reach further for the rarer filtered stations
+            filtered, unfiltered = shard_set.within(filters, 3000), shard_set.within(base, 3000)
+        else:
+            filtered = rank_station_positions(filters, index=shard_set)
+            unfiltered = rank_station_positions(base, index=shard_set)
+        assert 0 < len(filtered) < len(unfiltered)
+        assert set(filtered) < set(unfiltered)
+
+
+def test_replaced_shard_sets_are_released(index, tmp_path):
+    """Each process keeps the shards of the last OPEN_SHARD_SETS shard sets it used, not every set it ever opened."""
+    sets = [ShardSet(write_shard_set(tmp_path / f"shards-{i}", index, precision=1)) for i in range(3)]
+    for shard_set in sets:
+        shard_set.within({"latitude": 48.14, "longitude": 11.58}, 300)
+    assert list(shards._opened) == [str(shard_set.directory) for shard_set in sets[-shards.OPEN_SHARD_SETS:]]
+
+
+def test_queries_only_touch_nearby_shards(shard_set, monkeypatch):
+    touched = []
+    run = shards.run_on_shard
+    monkeypatch.setattr(shards, "run_on_shard", lambda path, method, args: touched.append(path) or run(path, method, args))
+    shard_set.within({"latitude": 48.14, "longitude": 11.58}, 300)
+    assert 1 <= len(touched) <= 3
+    touched.clear()
+    shard_set.corridor({"route": [[48.14, 11.58], [52.52, 13.40]]}, 50)
+    assert 1 <= len(touched) <= 3
+
+
+def test_pool_fan_out_matches_in_process(index, shard_set, monkeypatch):
+    monkeypatch.setattr(settings, "shard_fanout_min_stations", 0)
+    monkeypatch.setattr(settings, "shard_workers", 2)
+    try:
+        assert_same_results(index, shard_set)
+        assert shards._pool is not None and shards._pool._mp_context.get_start_method() != "fork"
+    finally:
+        close_shard_pool()
+
+
+def test_searches_use_shards_when_configured(db, tmp_path, monkeypatch):
+    filters = {"latitude": 52.52, "longitude": 13.40}
+    expected = find_stations(filters)
+
+    monkeypatch.setattr(settings, "shard_dir", tmp_path / "shards")
+    monkeypatch.setattr(shards, "_shards", None)
+    monkeypatch.setattr(shards, "_watcher", None)
+    assert find_stations(filters) == expected
+    assert isinstance(shards._shards, ShardSet)
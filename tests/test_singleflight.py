@@ -0,0 +1,84 @@
+"""Tests for request coalescing."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.ev_charging_stations.pipelines import query_pipeline
+from src.ev_charging_stations.pipelines.query_pipeline import run_query_pipeline_async
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.services.singleflight import SingleFlight
+from tests.test_pipeline_async import upstreams  # noqa: F401  (fixture)
+
+
+def test_threads_share_one_call():
+    flight, calls, results = SingleFlight("test"), [], []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "answer"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and results == ["answer"] * 10
+    assert flight.do("key", lambda: "again") == "again"  # nothing in flight any more
+
+
+def test_async_errors_reach_every_caller():
+    flight, calls = SingleFlight("test"), []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("upstream down")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", failing) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight("test")
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return 42
+
+    async def main():
+        impatient = asyncio.create_task(asyncio.wait_for(flight.do_async("key", slow), 0.01))
+        patient = asyncio.create_task(flight.do_async("key", slow))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(main()) == 42
+
+
+def test_burst_of_identical_queries_calls_upstreams_once(upstreams, monkeypatch):
+    """N concurrent identical questions: one LLM call, one geocode, one search."""
+    monkeypatch.setattr(query_pipeline, "response_cache", TieredCache(TTLCache(ttl=60)))
+    upstreams["llm_latency"] = 0.1
+    searches = []
+    original = query_pipeline.rank_station_positions
+    monkeypatch.setattr(query_pipeline, "rank_station_positions",
+                        lambda *args, **kwargs: searches.append(1) or original(*args, **kwargs))
+
+    async def burst():
+        return await asyncio.gather(*(run_query_pipeline_async("cheapest chargers in Springfield") for _ in range(20)))
+
+    results = asyncio.run(burst())
+    assert upstreams["calls"] == ["openrouter.ai", "api.opencagedata.com"]
+    assert len(searches) == 1
+    assert all([s.station_id for s in r] == [s.station_id for s in results[0]] for r in results)
+
+    asyncio.run(run_query_pipeline_async("Cheapest chargers in Springfield!"))  # served by the caches
+    assert len(upstreams["calls"]) == 2 and len(searches) == 1
@@ -0,0 +1,96 @@
+"""Station snapshot tests."""
+
+import shutil
+import sqlite3
+
+import numpy as np
+import pytest
+from src.ev_charging_stations.services import snapshot, station_index
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.utils.config import settings
+
+
+@pytest.fixture
+def snapshots(tmp_path, monkeypatch):
+    """A private copy of the database and snapshot directory, checked on every call."""
+    db_file = tmp_path / "ev_charging.db"
+    shutil.copy(settings.db_file, db_file)
+    monkeypatch.setattr(settings, "snapshot_dir", tmp_path / "snapshots")
+    monkeypatch.setattr(settings, "snapshot_check_interval", 0.0)
+    monkeypatch.setattr(station_index, "_index", None)
+    monkeypatch.setattr(station_index, "_watcher", None)
+    return db_file
+
+
+def test_snapshot_round_trip_is_memory_mapped(snapshots):
+    """A mapped snapshot answers queries exactly like the index it was built from."""
+    built = StationIndex.from_database(snapshots)
+    mapped = station_index.open_station_index(snapshots)
+    for array in (mapped.latitude, mapped.tree.points, mapped.store.data["charging_speed"].codes):
+        assert isinstance(array.base, np.memmap) and not array.flags.writeable
+    for filters in ({}, {"latitude": 40.7128, "longitude": -74.0060, "charging_speed": "Fast"}, {"accessibility": "Nope"},
+                    {"open_at": "Sun 23:30", "charging_type": "Type 2"}):
+        expected = built.search(filters)
+        assert list(mapped.search(filters)) == list(expected)
+        assert mapped.to_outputs(expected) == built.to_outputs(expected)
+    assert list(mapped.features.order) == list(built.features.order)
+    assert mapped.features.categories == built.features.categories
+
+
+def test_publishing_twice_keeps_the_first_snapshot(tmp_path):
+    directory = tmp_path / "stations-x" / "stamp"
+    snapshot.write_snapshot(directory, {"a": np.arange(3)}, {"n": 1})
+    snapshot.write_snapshot(directory, {"a": np.arange(5)}, {"n": 2})
+    arrays, meta = snapshot.read_snapshot(directory)
+    assert list(arrays["a"]) == [0, 1, 2] and meta["n"] == 1
+    assert [p.name for p in directory.parent.iterdir()] == ["stamp"]
+
+
+def test_index_is_swapped_when_database_changes(snapshots):
+    """A commit from another connection is picked up; the old index stays intact."""
+    old = station_index.load_station_index(snapshots)
+    assert station_index.get_station_index() is old
+    station_id = old.store.value("station_id", 0)
+
+    conn = sqlite3.connect(snapshots)
+    with conn:
+        conn.execute("UPDATE charging_stations SET location_name = 'Renamed' WHERE station_id = ?", (station_id,))
+    conn.close()
+
+    new = station_index.get_station_index()
+    assert new is not old
+    assert new.to_outputs([0])[0].location_name == "Renamed"
+    assert old.to_outputs([0])[0].location_name != "Renamed"
+    assert station_index.get_station_index() is new
+
+
+def test_snapshots_of_deleted_sources_are_pruned(tmp_path):
+    """Publishing for one database removes the snapshots of copies that no longer exist."""
+    root = tmp_path / "snapshots"
+    copies = [tmp_path / "a.db", tmp_path / "b.db"]
+    for db_file in copies:
+        shutil.copy(settings.db_file, db_file)
+    legacy = root / "stations-unrecorded" / "stamp"
+    snapshot.write_snapshot(legacy, {"a": np.arange(1)}, {})
+    for db_file in copies:
+        directory = snapshot.snapshot_path(root, db_file, "stations")
+        snapshot.write_snapshot(directory, {"a": np.arange(3)}, {})
+        snapshot.prune_snapshots(directory, db_file=db_file)
+    assert len(list(root.iterdir())) == 3
+
+    copies[0].unlink()
+    snapshot.prune_snapshots(directory, db_file=copies[1])
+    assert sorted(p.name for p in root.iterdir()) == sorted([directory.parent.name, legacy.parent.name])
+
+
+def test_watcher_notices_a_replaced_file(tmp_path):
+    db_file = tmp_path / "a.db"
+    sqlite3.connect(db_file).close()
+    watcher = snapshot.DataVersionWatcher(db_file)
+    assert not watcher.changed()
+    replacement = tmp_path / "b.db"
+    sqlite3.connect(replacement).close()
+    replacement.replace(db_file)
+    assert watcher.changed()
+    assert not watcher.changed()
+    watcher.close()
@@ -0,0 +1,180 @@
+"""Station feature table and feature array tests."""
+
+import asyncio
+import shutil
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+from src.ev_charging_stations.pipelines import query_pipeline
+from src.ev_charging_stations.services import shards, station_index
+from src.ev_charging_stations.services.migrations import migrate
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.services.station_features import (
+    REVIEW_PRIOR,
+    StationFeatures,
+    julian_day,
+    refresh_station_features,
+)
+from src.ev_charging_stations.utils.config import settings
+
+NOW = time.time()
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = tmp_path / "ev_charging.db"
+    shutil.copy(settings.db_file, path)
+    migrate(path)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def stored(conn, station_id):
+    return conn.execute(
+        "SELECT review_count, scored_count, sentiment_sum FROM station_features WHERE station_id = ?", (station_id,)
+    ).fetchone()
+
+
+def test_migration_materializes_review_aggregates(conn):
+    expected = conn.execute("""
+        SELECT station_id, COUNT(*), COUNT(sentiment_score), TOTAL(sentiment_score)
+        FROM user_reviews GROUP BY station_id ORDER BY station_id
+    """).fetchall()
+    actual = conn.execute("""
+        SELECT station_id, review_count, scored_count, sentiment_sum FROM station_features ORDER BY station_id
+    """).fetchall()
+    assert [row[:3] for row in actual] == [row[:3] for row in expected]
+    assert [row[3] for row in actual] == pytest.approx([row[3] for row in expected])
+
+
+def test_refresh_only_touches_changed_stations(conn):
+    station_id, other = [row[0] for row in conn.execute("SELECT station_id FROM station_features LIMIT 2")]
+    untouched = stored(conn, other)
+    with conn:
+        conn.execute(
+            "INSERT INTO user_reviews (review_id, user_id, station_id, preferred_charging_speed, sentiment_score)"
+            " VALUES (99999, 'U1', ?, 'Supercharger', -1.0)",
+            (station_id,),
+        )
+    assert conn.execute("SELECT station_id FROM station_features_dirty").fetchall() == [(station_id,)]
+    count, scored, total = stored(conn, station_id)
+
+    with conn:
+        assert refresh_station_features(conn) == 1
+    assert stored(conn, station_id) == (count + 1, scored + 1, pytest.approx(total - 1.0))
+    assert stored(conn, other) == untouched
+    speeds = conn.execute("SELECT speed_counts FROM station_features WHERE station_id = ?", (station_id,)).fetchone()
+    assert '"Supercharger"' in speeds[0]
+
+    with conn:
+        conn.execute("DELETE FROM user_reviews WHERE station_id = ?", (station_id,))
+        refresh_station_features(conn)
+    assert stored(conn, station_id) is None
+
+
+def statistics(scored, total, age_days=0.0):
+    """One station's statistics row with every review written at the same time."""
+    return (None, scored, scored, total, total, scored, julian_day(NOW) - age_days, "{}", "{}")
+
+
+def test_scores_are_smoothed_towards_the_catalogue_mean():
+    rows = [statistics(1, 1.0), statistics(40, 32.0), statistics(10, -5.0)]
+    features = StationFeatures.from_statistics(4, np.array([0, 1, 2]), rows, now=NOW)
+    prior = 28.0 / 51
+    assert features.bayes_sentiment[0] == pytest.approx((1.0 + REVIEW_PRIOR * prior) / (1 + REVIEW_PRIOR))
+    assert features.review_score[3] == pytest.approx(prior)  # no reviews
+    # one perfect review does not beat forty good ones
+    assert list(features.order) == [1, 0, 3, 2]
+    assert list(features.rank) == [1, 0, 3, 2]
+
+
+def test_old_reviews_fade_towards_the_prior():
+    half_life = settings.review_half_life_days
+    rows = [statistics(10, 8.0), statistics(10, 8.0, age_days=2 * half_life), statistics(10, -8.0)]
+    features = StationFeatures.from_statistics(3, np.array([0, 1, 2]), rows, now=NOW)
+    prior = 8.0 / 30
+    assert features.bayes_sentiment[0] == features.bayes_sentiment[1]
+    assert features.review_score[0] > features.review_score[1] > prior
+    # two half-lives: the reviews weigh as 2.5 fresh ones
+    assert features.review_score[1] == pytest.approx((2.0 + REVIEW_PRIOR * prior) / (2.5 + REVIEW_PRIOR))
+
+
+def test_best_first_matches_a_stable_sort():
+    rng = np.random.default_rng(0)
+    size = 2000
+    rows = [statistics(int(n), float(s)) for n, s in zip(rng.integers(1, 5, 500), rng.uniform(-3, 3, 500))]
+    positions = rng.choice(size, 500, replace=False)
+    features = StationFeatures.from_statistics(size, positions, rows, now=NOW)
+    for subset in (rng.choice(size, 20, replace=False), rng.choice(size, 1500, replace=False), np.arange(size)):
+        subset = np.sort(subset)
+        expected = subset[np.argsort(-features.review_score[subset], kind="stable")]
+        assert list(features.best_first(subset)) == list(expected)
+
+
+def test_preference_shares():
+    rows = [
+        (None, 3, 0, 0.0, 0.0, 0.0, None, '{"Fast": 2, "Supercharger": 1}', '{"Type 2": 3}'),
+        (None, 1, 0, 0.0, 0.0, 0.0, None, '{"Fast": 1}', "{}"),
+    ]
+    features = StationFeatures.from_statistics(5, np.array([3, 1]), rows, now=NOW)
+    assert list(features.reviewed) == [1, 3]
+    assert features.categories == {"speed": ["Fast", "Supercharger"], "type": ["Type 2"]}
+    assert list(features.preference_share("speed", "Fast", [0, 1, 3])) == pytest.approx([0, 1, 2 / 3])
+    assert list(features.preference_share("type", "Type 2", [1, 3])) == [0, 1]
+    assert list(features.preference_share("type", "Type 1", [3])) == [0]
+
+
+def test_rescoring_applies_the_fade_at_a_later_time():
+    """Rescoring from the kept sums gives what scoring the statistics at that time gives."""
+    # a long, lukewarm record against a few glowing reviews: as both fade,
+    # the smoothing weighs the longer record more
+    rows = [statistics(40, 12.0), statistics(5, 4.0), statistics(40, -16.0)]
+    features = StationFeatures.from_statistics(4, np.array([0, 1, 2]), rows, now=NOW)
+    assert list(features.order) == [1, 0, 3, 2]
+
+    later = NOW + 4 * settings.review_half_life_days * 86400
+    rescored = features.rescored(later)
+    expected = StationFeatures.from_statistics(4, np.array([0, 1, 2]), rows, now=later)
+    assert list(rescored.review_score) == pytest.approx(list(expected.review_score))
+    assert list(rescored.order) == list(expected.order) == [0, 1, 3, 2]
+    assert features.current(3600, now=NOW + 60) is features
+    assert features.current(3600, now=later).scored_at == later
+
+    arrays, meta = features.take(np.array([0, 1])).to_arrays()
+    assert list(StationFeatures.from_arrays(arrays, meta).rescored(later).order) == [0, 1]
+
+
+def test_shared_index_rescores_stale_features(monkeypatch):
+    monkeypatch.setattr(settings, "snapshot_check_interval", 0)
+    features = station_index.load_station_index().features
+    assert station_index.get_station_index().features is features  # fresh enough
+    monkeypatch.setattr(settings, "review_rescore_seconds", 0)
+    assert station_index.get_station_index().features.scored_at > features.scored_at
+
+
+@pytest.mark.parametrize("sharded", [False, True])
+def test_rescoring_invalidates_cached_rankings(db, sharded, tmp_path, monkeypatch):
+    """A ranking cached before a rescore is searched again after it, on the station index and shard set alike."""
+    monkeypatch.setattr(query_pipeline, "response_cache", TieredCache(TTLCache(ttl=60)))
+    monkeypatch.setattr(settings, "snapshot_check_interval", 0)
+    if sharded:
+        monkeypatch.setattr(settings, "shard_dir", tmp_path / "shards")
+        monkeypatch.setattr(shards, "_shards", None)
+        monkeypatch.setattr(shards, "_watcher", None)
+    searches = []
+    original = query_pipeline.rank_station_positions
+    monkeypatch.setattr(query_pipeline, "rank_station_positions",
+                        lambda *args, **kwargs: searches.append(1) or original(*args, **kwargs))
+    filters = {"latitude": 52.52, "longitude": 13.40, "sort_by_reviews": True}
+
+    first = asyncio.run(query_pipeline.rank_stations_async(filters))
+    assert asyncio.run(query_pipeline.rank_stations_async(filters)) is first
+    assert len(searches) == 1
+
+    monkeypatch.setattr(settings, "review_rescore_seconds", 0)
+    index, _, _ = asyncio.run(query_pipeline.rank_stations_async(filters))
+    assert index is first[0] and index.generation > 0
+    assert len(searches) == 2
@@ -0,0 +1,312 @@
+"""Station index tests."""
+
+import random
+
+import numpy as np
+import pytest
+from src.ev_charging_stations.services.database import (
+    combined_score,
+    find_stations,
+    find_stations_scan,
+    haversine,
+    match_station_positions,
+    nearest_stations_many,
+    rank_nearest_positions,
+    rank_station_positions,
+    ranked_chunks,
+)
+from src.ev_charging_stations.services.name_search import NameMatches
+from src.ev_charging_stations.services.spatial import EARTH_RADIUS_KM, densify, to_unit_vectors
+from src.ev_charging_stations.services import station_index
+from src.ev_charging_stations.services.station_features import StationFeatures
+from src.ev_charging_stations.services.station_index import StationIndex
+from src.ev_charging_stations.services.station_store import StationStore, haversine_distances
+
+COLUMNS = [
+    "station_id", "provider", "location_name", "latitude", "longitude", "charging_speed",
+    "available_chargers", "charging_types", "accessibility", "operating_hours",
+    "avg_sentiment", "num_reviews",
+]
+
+
+def make_rows(n, seed=0, reviews=False):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        rows.append((
+            i, "ChargeCo", f"Station {i}",
+            rng.uniform(-80, 80), rng.uniform(-180, 180),
+            rng.choice(["Fast", "Supercharger"]), rng.randint(0, 6),
+            rng.choice(["Type 1", "Type 2", "DC Fast Charge"]),
+            rng.choice(["Public", "Restricted"]), "24/7",
+            rng.uniform(-1, 1) if reviews else None, rng.randint(0, 30) if reviews else None,
+        ))
+    return rows
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"charging_speed": "Fast"},
+        {"latitude": 40.7128, "longitude": -74.0060},
+        {"latitude": 52.52, "longitude": 13.405, "charging_type": "Type 2"},
+        {"latitude": 34.05, "longitude": -118.24, "accessibility": "Public", "sort_by_reviews": True},
+        {"latitude": 35.68, "longitude": 139.69, "charging_speed": "Supercharger"},
+        {"latitude": -80.0, "longitude": 0.0},
+        {"latitude": 40.7, "longitude": -74.0, "charging_type": "Unknown"},
+    ],
+)
+def test_index_matches_table_scan(filters):
+    """The index must return exactly what the expanding-radius scan returns."""
+    expected = [s.station_id for s in find_stations_scan(dict(filters))]
+    actual = [s.station_id for s in find_stations(dict(filters))]
+    assert actual == expected
+
+
+def test_radius_query_matches_brute_force():
+    """Range and nearest queries agree with a brute-force haversine, across the dateline too."""
+    rows = make_rows(3000)
+    index = StationIndex(StationStore(rows, COLUMNS))
+    rng = random.Random(1)
+    for _ in range(50):
+        lat, lon = rng.uniform(-70, 70), rng.choice([rng.uniform(-180, 180), 179.9, -179.9])
+        filters = {"latitude": lat, "longitude": lon, "charging_speed": "Fast"}
+        mask = index.filter_mask(filters)
+        distances = haversine_distances(lat, lon, index.latitude, index.longitude)
+        nearest = distances[mask].min()
+        radius = 20 if nearest <= 20 else 20 + np.ceil((nearest - 20) / 30) * 30
+        expected = np.flatnonzero(mask & (distances <= radius)) if radius <= 600 else []
+        assert list(index.search(filters)) == list(expected)
+
+
+def test_distance_matrix_matches_scalar_haversine():
+    """One (n_queries x n_stations) pass gives the same distances as the scalar function."""
+    store = StationStore(make_rows(200), COLUMNS)
+    lats, lons = [40.7, -33.9, 0.0], [-74.0, 151.2, 179.5]
+    matrix = store.distances(lats, lons)
+    assert matrix.shape == (3, 200)
+    for q, (lat, lon) in enumerate(zip(lats, lons)):
+        expected = [haversine(lat, lon, store.latitude[i], store.longitude[i]) for i in range(200)]
+        assert np.allclose(matrix[q], expected)
+
+
+def test_nearest_top_k_is_ranked():
+    """argpartition top-k returns the k smallest distances in ascending order."""
+    store = StationStore(make_rows(500), COLUMNS)
+    positions, distances = store.nearest([10.0, 50.0], [20.0, -3.0], k=7)
+    full = store.distances([10.0, 50.0], [20.0, -3.0])
+    for q in range(2):
+        assert list(distances[q]) == sorted(distances[q])
+        assert np.allclose(distances[q], np.sort(full[q])[:7])
+        assert np.allclose(full[q][positions[q]], distances[q])
+
+
+def test_selective_filters_skip_the_tree(monkeypatch):
+    """Scoring a handful of matches directly gives the tree walk's results, in its order."""
+    rows = make_rows(3000, seed=5)
+    rows[::40] = [(*row[:5], "Rare", *row[6:]) for row in rows[::40]]
+    rows[40:42] = [(*row[:3], *rows[80][3:5], *row[5:]) for row in rows[40:42]]  # a tie at the same spot
+    index = StationIndex(StationStore(rows, COLUMNS))
+    queries = [{"latitude": lat, "longitude": lon, "charging_speed": "Rare"} for lat, lon in [(10, 20), (-45, 170), rows[80][3:5]]]
+
+    def run():
+        return [(list(index.search(q)), *map(list, index.nearest(q, 5, max_radius=3000))) for q in queries]
+
+    direct = run()
+    monkeypatch.setattr(station_index, "DIRECT_MATCHES", 0)
+    assert direct == run()
+
+
+def test_ties_at_the_kth_place_break_by_position(monkeypatch):
+    """Tree walk and direct scoring keep the same stations when more than k are equally far."""
+    rows = make_rows(3000, seed=6)
+    spot = rows[0][3:5]
+    tied = list(range(2999, 0, -97))  # scattered through the catalogue, so through the tree's leaves
+    for i in tied:
+        rows[i] = (*rows[i][:3], *spot, "Fast", *rows[i][6:])
+    rows[0] = (*rows[0][:5], "Supercharger", *rows[0][6:])
+    index = StationIndex(StationStore(rows, COLUMNS))
+    filters = {"latitude": spot[0] + 0.5, "longitude": spot[1], "charging_speed": "Fast"}
+    expected = sorted(tied)[:5]
+
+    for direct_matches in (10_000, 0):
+        monkeypatch.setattr(station_index, "DIRECT_MATCHES", direct_matches)
+        assert list(index.nearest(filters, 5, max_radius=20000)[0]) == expected
+    positions, _ = index.tree.nearest_k(to_unit_vectors(*spot), 5)
+    assert list(positions) == [0] + expected[:4]
+
+
+def test_nearest_stations_many_respects_filters():
+    """Bulk lookups return k filtered stations per input point."""
+    results = nearest_stations_many([(40.7128, -74.0060), (52.52, 13.405)], k=3, filters={"charging_speed": "Fast"})
+    assert len(results) == 2
+    for stations in results:
+        assert len(stations) == 3
+        assert all(s.charging_speed == "Fast" for s in stations)
+
+
+def test_ranked_mode_returns_k_nearest_with_distances():
+    """Best-first top-k agrees with sorting every matching station by distance."""
+    index = StationIndex(StationStore(make_rows(3000), COLUMNS))
+    rng = random.Random(2)
+    for _ in range(30):
+        filters = {"latitude": rng.uniform(-70, 70), "longitude": rng.uniform(-180, 180), "charging_type": "Type 2"}
+        distances = haversine_distances(filters["latitude"], filters["longitude"], index.latitude, index.longitude)
+        distances[~index.filter_mask(filters)] = np.inf
+        within = np.flatnonzero(distances <= 1500)
+        expected = within[np.argsort(distances[within], kind="stable")][:5]
+        positions, found = rank_nearest_positions(filters, k=5, max_radius=1500, index=index)
+        assert list(positions) == list(expected)
+        assert np.allclose(found, distances[expected])
+
+
+def test_ranked_mode_combined_score_is_exact():
+    """With sort_by_reviews the k best combined scores come back, not just the k nearest re-sorted."""
+    index = StationIndex(StationStore(make_rows(3000, reviews=True), COLUMNS))
+    quality = index.features.quality(np.arange(index.size))
+    rng = random.Random(3)
+    for _ in range(30):
+        filters = {"latitude": rng.uniform(-70, 70), "longitude": rng.uniform(-180, 180), "sort_by_reviews": True}
+        distances = haversine_distances(filters["latitude"], filters["longitude"], index.latitude, index.longitude)
+        within = np.flatnonzero(distances <= 2000)
+        scores = combined_score(distances[within], quality[within])
+        expected = within[np.argsort(scores, kind="stable")][:8]
+        positions, _ = rank_nearest_positions(filters, k=8, max_radius=2000, index=index)
+        assert sorted(positions) == sorted(expected)
+
+
+def test_ranked_mode_boosts_preferred_speed_and_type():
+    """A named charging speed or type lifts stations whose reviewers prefer it, still exactly."""
+    index = StationIndex(StationStore(make_rows(3000, reviews=True), COLUMNS))
+    rng = np.random.default_rng(5)
+    reviewed = np.sort(rng.choice(3000, 1200, replace=False))
+    rows = [
+        (None, 4, 4, 1.0, 1.0, 4.0, None, f'{{"Fast": {int(fast)}, "Supercharger": {4 - int(fast)}}}',
+         f'{{"Type 2": {int(fast)}}}')
+        for fast in rng.integers(0, 5, len(reviewed))
+    ]
+    index.features = StationFeatures.from_statistics(index.size, reviewed, rows)
+    plain = index.features.quality(np.arange(index.size))
+    for filters in ({"charging_speed": "Fast"}, {"charging_speed": "Fast", "charging_type": "Type 2"}):
+        quality = index.features.quality(np.arange(index.size), filters)
+        assert (quality[reviewed] != plain[reviewed]).any() and quality.min() >= 0 and quality.max() <= 1
+        filters.update({"latitude": 48.1, "longitude": 11.6, "sort_by_reviews": True})
+        distances = haversine_distances(filters["latitude"], filters["longitude"], index.latitude, index.longitude)
+        distances[~index.filter_mask(filters)] = np.inf
+        within = np.flatnonzero(distances <= 3000)
+        expected = within[np.argsort(combined_score(distances[within], quality[within]), kind="stable")][:8]
+        positions, _ = rank_nearest_positions(filters, k=8, max_radius=3000, index=index)
+        assert sorted(positions) == sorted(expected)
+        without = within[np.argsort(combined_score(distances[within], plain[within]), kind="stable")][:8]
+        assert list(expected) != list(without)
+
+
+@pytest.mark.parametrize("reviews", [False, True])
+def test_ranked_mode_weighs_name_matches(reviews):
+    """With a name filter, k-nearest ranking divides each score by the name match score, exactly."""
+    index = StationIndex(StationStore(make_rows(3000, reviews=True), COLUMNS))
+    quality = index.features.quality(np.arange(index.size))
+    rng = np.random.default_rng(4)
+    station_ids = np.sort(rng.choice(3000, 600, replace=False))
+    matches = NameMatches(station_ids, rng.choice([1.0, 0.8, 0.6], 600))
+    for _ in range(20):
+        filters = {"latitude": rng.uniform(-70, 70), "longitude": rng.uniform(-180, 180),
+                   "name_matches": matches, "sort_by_reviews": reviews}
+        distances = haversine_distances(filters["latitude"], filters["longitude"], index.latitude, index.longitude)
+        within = station_ids[distances[station_ids] <= 3000]
+        scores = combined_score(distances[within], quality[within]) if reviews else distances[within]
+        scores = scores / matches.score_of(within)
+        expected = within[np.argsort(scores, kind="stable")][:8]
+        positions, found = rank_nearest_positions(filters, k=8, max_radius=3000, index=index)
+        assert sorted(positions) == sorted(expected)
+        assert np.allclose(found, distances[positions])
+
+    # more than every candidate: the search stops at the candidate count
+    filters = {"latitude": 0.0, "longitude": 0.0, "name_matches": NameMatches(station_ids[:3], np.ones(3))}
+    positions, _ = rank_nearest_positions(filters, k=50, max_radius=20000, index=index)
+    assert sorted(positions) == list(station_ids[:3])
+
+
+@pytest.mark.parametrize("start, stop", [(0, 3000), (0, 1), (5, 40), (37, 1200)])
+def test_ranked_chunks_follow_the_full_ranking(start, stop):
+    """Chunks picked by partial sorts add up to the fully ranked page, ties included."""
+    index = StationIndex(StationStore(make_rows(3000, reviews=True), COLUMNS))
+    for filters in ({"charging_speed": "Fast"}, {"charging_speed": "Fast", "sort_by_reviews": True}):
+        expected = rank_station_positions(filters, index=index)[start:stop]
+        positions, keys = match_station_positions(filters, index=index)
+        chunks = list(ranked_chunks(positions, keys, start, stop, 32))
+        assert all(len(chunk) <= 32 for chunk in chunks)
+        assert list(np.concatenate(chunks)) == list(expected)
+
+    positions = np.arange(500)
+    keys = np.random.default_rng(0).integers(0, 4, 500).astype(float)  # many ties
+    chunks = list(ranked_chunks(positions, keys, start, stop, 32))
+    assert list(np.concatenate(chunks)) == list(np.argsort(keys, kind="stable")[start:stop])
+
+
+def regional_rows(n, lat_range, lon_range, seed=0, reviews=False):
+    """make_rows, with every station inside a lat/lon box (longitudes may run past 180)."""
+    rng = random.Random(seed + 1)
+    return [
+        (*row[:3], rng.uniform(*lat_range), (rng.uniform(*lon_range) + 180) % 360 - 180, *row[5:])
+        for row in make_rows(n, seed, reviews)
+    ]
+
+
+@pytest.mark.parametrize(
+    "route, box",
+    [
+        ([(48.14, 11.58), (50.11, 8.68), (52.52, 13.40)], ((46, 55), (5, 16))),
+        ([(10.0, 178.5), (11.0, -179.0), (9.0, -177.5)], ((7, 13), (176, 184))),
+        ([(50.0, 10.0), (50.0, 10.0)], ((49, 51), (9, 11))),
+    ],
+)
+def test_corridor_matches_brute_force(route, box):
+    """Corridor search agrees with distances to a densely sampled route, across the dateline too."""
+    index = StationIndex(StationStore(regional_rows(3000, *box), COLUMNS))
+    buffer_km = 25.0
+    filters = {"route": route, "charging_speed": "Fast"}
+    positions, off_route, along = index.corridor(filters, buffer_km)
+
+    samples = densify(to_unit_vectors(*np.array(route).T), 0.2)
+    sample_along = np.concatenate(([0], np.cumsum(np.arccos(np.clip(
+        np.einsum("ij,ij->i", samples[:-1], samples[1:]), -1, 1))))) * EARTH_RADIUS_KM
+    stations = to_unit_vectors(index.latitude, index.longitude)
+    angles = np.arccos(np.clip(stations @ samples.T, -1, 1))
+    nearest = angles.argmin(axis=1)
+    distances = angles.min(axis=1) * EARTH_RADIUS_KM
+    mask = index.filter_mask(filters)
+    clear = np.abs(distances - buffer_km) > 0.2
+    expected = np.flatnonzero(mask & (distances <= buffer_km))
+
+    # stations within sampling error of the edge may go either way
+    assert set(positions[clear[positions]]) == set(expected[clear[expected]])
+    assert np.allclose(off_route, distances[positions], atol=0.1)
+    assert np.allclose(along, sample_along[nearest[positions]], atol=0.2)
+    assert list(along) == sorted(along)
+
+
+def test_corridor_ranked_mode():
+    """k returns the first stations along the route (or the best-reviewed) with their distance off it."""
+    index = StationIndex(StationStore(regional_rows(2000, (46, 55), (5, 16), seed=4, reviews=True), COLUMNS))
+    filters = {"route": [[48.14, 11.58], [52.52, 13.40]], "corridor_km": 30}
+    positions, off_route, _ = index.corridor(filters, 30)
+    first, distances = rank_nearest_positions(filters, k=5, index=index)
+    assert list(first) == list(positions[:5]) and list(distances) == list(off_route[:5])
+
+    best, _ = rank_nearest_positions({**filters, "sort_by_reviews": True}, k=5, index=index)
+    assert list(best) == list(index.features.best_first(np.sort(positions))[:5])
+    assert [s.station_id for s in find_stations(filters, index=index)] == list(positions)
+
+
+def test_records_match_per_cell_values():
+    """Bulk column conversion gives the same values (and NULLs) as reading cell by cell."""
+    rows = make_rows(50, reviews=True) + make_rows(5)
+    store = StationStore(rows, COLUMNS)
+    positions = [54, 0, 7, 50]
+    records = store.to_records(positions, distances=np.array([1.23456, 2.0, 3.5, 0.0]))
+    for record, position in zip(records, positions):
+        assert record[:-1] == tuple(store.value(name, position) for name in COLUMNS)
+    assert records[0].avg_sentiment is None and records[0].distance_km == 1.235
+    assert [r.to_output() for r in records] == store.to_outputs(positions, np.array([1.23456, 2.0, 3.5, 0.0]))
@@ -0,0 +1,171 @@
+"""Retry, circuit breaker, rate limit and LLM fallback tests against local fake servers."""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.ev_charging_stations.services import http_client, llm_extraction
+from src.ev_charging_stations.services.http_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RateLimited,
+    TokenBucket,
+    Upstream,
+    UpstreamUnavailable,
+)
+from src.ev_charging_stations.services.query_cache import TieredCache, TTLCache
+from src.ev_charging_stations.utils.config import settings
+
+
+class FlakyServer(BaseHTTPRequestHandler):
+    """Answers `statuses` in order (then 200), counting requests."""
+
+    statuses: list = []
+    calls = 0
+
+    def _answer(self):
+        FlakyServer.calls += 1
+        status = FlakyServer.statuses.pop(0) if FlakyServer.statuses else 200
+        body = json.dumps({"choices": [{"message": {"content": json.dumps({"city": "Berlin"})}}]}).encode()
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def flaky(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyServer)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    FlakyServer.statuses, FlakyServer.calls = [], 0
+    monkeypatch.setattr(settings, "openrouter_url", f"http://127.0.0.1:{server.server_port}/chat")
+    monkeypatch.setattr(llm_extraction, "llm_cache", TieredCache(TTLCache()))
+    yield FlakyServer
+    server.shutdown()
+
+
+def fast_upstream(**kwargs) -> Upstream:
+    return Upstream("test", backoff_base=0.001, **kwargs)
+
+
+def test_retries_transient_failures(flaky):
+    flaky.statuses = [503, 429]
+    up = fast_upstream(retries=2)
+    assert up.request("GET", settings.openrouter_url).status_code == 200
+    assert flaky.calls == 3
+
+
+def test_client_errors_are_not_retried(flaky):
+    flaky.statuses = [401]
+    with pytest.raises(UpstreamUnavailable):
+        fast_upstream(retries=2).request("GET", settings.openrouter_url)
+    assert flaky.calls == 1
+
+
+def test_circuit_opens_and_fails_fast(flaky):
+    flaky.statuses = [500] * 10
+    up = fast_upstream(retries=0, failure_threshold=3)
+    for _ in range(3):
+        with pytest.raises(UpstreamUnavailable):
+            up.request("GET", settings.openrouter_url)
+    with pytest.raises(CircuitOpenError):
+        up.request("GET", settings.openrouter_url)
+    assert flaky.calls == 3
+
+
+def test_breaker_half_open_probe():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    now[0] = 10
+    breaker.before_call()  # the probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+    breaker.record_success()
+    breaker.before_call()
+    assert breaker.state == "closed"
+
+
+def test_cancelled_half_open_probe_frees_the_slot(monkeypatch):
+    """A probe cancelled mid-request (or crashing) lets the next caller probe instead of wedging the circuit."""
+    now = [0.0]
+    up = fast_upstream(retries=0, failure_threshold=1)
+    up.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    up.breaker.record_failure()
+    now[0] = 10
+
+    class HangingClient:
+        async def request(self, *args, **kwargs):
+            await asyncio.sleep(60)
+
+    class BrokenClient:
+        async def request(self, *args, **kwargs):
+            raise RuntimeError("boom")
+
+    async def cancel_probe():
+        monkeypatch.setattr(http_client, "get_async_client", HangingClient)
+        probe = asyncio.create_task(up.request_async("GET", "http://upstream.invalid"))
+        await asyncio.sleep(0.01)
+        with pytest.raises(CircuitOpenError):
+            up.breaker.before_call()  # the probe is in flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+    assert up.breaker.state == "half_open"
+    monkeypatch.setattr(http_client, "get_async_client", BrokenClient)
+    with pytest.raises(RuntimeError):
+        asyncio.run(up.request_async("GET", "http://upstream.invalid"))
+    up.breaker.before_call()  # free to probe again
+    up.breaker.record_success()
+    assert up.breaker.state == "closed"
+
+
+def test_token_bucket_paces_and_refuses():
+    now = [0.0]
+    bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0])
+    assert bucket.reserve(1) == 0 and bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(0.5)
+    with pytest.raises(RateLimited):
+        bucket.reserve(0.5)  # the next slot is 1 s away
+    now[0] = 2
+    assert bucket.reserve(0) == 0
+
+
+def test_async_client_retries(flaky):
+    flaky.statuses = [502]
+
+    async def call():
+        response = await fast_upstream(retries=1).request_async("POST", settings.openrouter_url, json={})
+        await http_client.close_async_client()
+        return response
+
+    assert asyncio.run(call()).status_code == 200
+    assert flaky.calls == 2
+
+
+def test_llm_outage_degrades_to_rules(flaky):
+    """While OpenRouter is down, questions are answered from the lenient rule extractor."""
+    flaky.statuses = [503] * 20
+    filters = llm_extraction.parse_user_question("cheapest fast chargers in Berlin please")
+    assert (filters.city, filters.charging_speed) == ("Berlin", "Fast")
+    assert llm_extraction.llm_cache.get("cheapest fast chargers in berlin please") is None
+
+    flaky.statuses = []  # recovered: the LLM is asked again
+    http_client.reset_upstreams()
+    llm_extraction.parse_user_question("cheapest fast chargers in Berlin please")
+    assert llm_extraction.llm_cache.get("cheapest fast chargers in berlin please") is not None